@@ -0,0 +1,241 @@
+###############################################################################
+#
+# corpus.py
+#
+# A seeded generator of synthetic recipes, used to feed the benchmarks. The
+# same seed always gives the same recipes, so runs made on different machines
+# or at different times can be compared with each other.
+#
+# The distributions are loosely based on real recipe collections: a few
+# ingredients (salt, onion, butter...) show up in most recipes while most
+# ingredients are rare, recipes usually have between 5 and 12 ingredients,
+# and main courses outnumber appetizers and desserts.
+#
+# Run this file directly to write a corpus of .rcpe files into a folder:
+#
+#   python -m benchmarks.corpus 1000 ./recipes/corpus/ --seed 42
+#
+###############################################################################
+
+import os
+import random
+import sys
+
+# Ingredients and the units they are usually measured in, roughly ordered by
+# how often they show up in recipes
+INGREDIENTS = [
+    ('salt', ['tsp', 'pinch']), ('onion', ['pc', 'cup']),
+    ('garlic', ['clove', 'tsp']), ('butter', ['tbsp', 'cup', 'g']),
+    ('olive oil', ['tbsp', 'cup']), ('black pepper', ['tsp', 'pinch']),
+    ('sugar', ['cup', 'tbsp', 'g']), ('egg', ['pc']),
+    ('flour', ['cup', 'g']), ('milk', ['cup', 'ml']),
+    ('water', ['cup', 'ml']), ('tomato', ['pc', 'cup', 'can']),
+    ('chicken breast', ['pc', 'g', 'lb']), ('lemon juice', ['tbsp', 'tsp']),
+    ('carrot', ['pc', 'cup']), ('soy sauce', ['tbsp', 'tsp']),
+    ('vanilla extract', ['tsp']), ('baking powder', ['tsp']),
+    ('parsley', ['tbsp', 'cup']), ('ground beef', ['lb', 'g']),
+    ('cheddar cheese', ['cup', 'g']), ('potato', ['pc', 'lb']),
+    ('rice', ['cup', 'g']), ('heavy cream', ['cup', 'ml']),
+    ('celery', ['stalk', 'cup']), ('bell pepper', ['pc', 'cup']),
+    ('vinegar', ['tbsp', 'cup']), ('honey', ['tbsp', 'cup']),
+    ('ginger', ['tsp', 'tbsp']), ('cinnamon', ['tsp']),
+    ('chicken stock', ['cup', 'ml']), ('mushroom', ['cup', 'g']),
+    ('brown sugar', ['cup', 'tbsp']), ('cumin', ['tsp']),
+    ('paprika', ['tsp']), ('basil', ['tbsp', 'cup']),
+    ('spinach', ['cup', 'g']), ('bacon', ['slice', 'g']),
+    ('parmesan cheese', ['cup', 'tbsp']), ('pork shoulder', ['lb', 'g']),
+    ('shrimp', ['lb', 'g']), ('coconut milk', ['can', 'cup']),
+    ('chocolate chips', ['cup', 'g']), ('oats', ['cup']),
+    ('banana', ['pc']), ('apple', ['pc', 'cup']),
+    ('lime', ['pc']), ('cilantro', ['tbsp', 'cup']),
+    ('thyme', ['tsp', 'sprig']), ('rosemary', ['tsp', 'sprig']),
+    ('pasta', ['g', 'lb']), ('salmon fillet', ['pc', 'g']),
+    ('zucchini', ['pc', 'cup']), ('corn', ['cup', 'can']),
+    ('black beans', ['can', 'cup']), ('walnuts', ['cup', 'g']),
+    ('almonds', ['cup', 'g']), ('yogurt', ['cup', 'g']),
+    ('cream cheese', ['g', 'cup']), ('fish sauce', ['tbsp', 'tsp']),
+    ('sesame oil', ['tsp', 'tbsp']), ('chili flakes', ['tsp', 'pinch']),
+    ('nutmeg', ['pinch', 'tsp']), ('cabbage', ['cup', 'pc']),
+    ('eggplant', ['pc']), ('lamb shank', ['pc', 'lb']),
+    ('tofu', ['g', 'pc']), ('peanut butter', ['tbsp', 'cup']),
+    ('maple syrup', ['tbsp', 'cup']), ('cocoa powder', ['tbsp', 'cup']),
+    ('raisins', ['cup']), ('cornstarch', ['tbsp', 'tsp']),
+    ('bread crumbs', ['cup']), ('mozzarella', ['cup', 'g']),
+    ('sour cream', ['cup', 'tbsp']), ('leek', ['pc']),
+    ('kale', ['cup']), ('sweet potato', ['pc', 'cup']),
+    ('pumpkin puree', ['cup', 'can']), ('cranberries', ['cup']),
+    ('pine nuts', ['tbsp', 'cup']), ('saffron', ['pinch']),
+    ('anchovies', ['pc', 'tin']), ('capers', ['tbsp']),
+    ('coriander seeds', ['tsp']), ('star anise', ['pc']),
+    ('lemongrass', ['stalk']), ('miso paste', ['tbsp']),
+    ('tamarind', ['tbsp']), ('buttermilk', ['cup', 'ml']),
+]
+
+# Quantities people actually write down, per unit
+QUANTITIES = {
+    'tsp': [0.25, 0.5, 1.0, 1.5, 2.0], 'tbsp': [0.5, 1.0, 2.0, 3.0, 4.0],
+    'cup': [0.25, 0.33, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0],
+    'pinch': [1.0, 2.0], 'pc': [1.0, 2.0, 3.0, 4.0, 6.0],
+    'clove': [1.0, 2.0, 3.0, 4.0], 'g': [25.0, 50.0, 100.0, 200.0, 500.0],
+    'ml': [50.0, 100.0, 250.0, 500.0], 'lb': [0.5, 1.0, 1.5, 2.0, 3.0],
+    'can': [1.0, 2.0], 'slice': [2.0, 4.0, 6.0], 'stalk': [1.0, 2.0],
+    'sprig': [1.0, 2.0, 3.0], 'tin': [1.0],
+}
+
+# Courses and how likely each one is
+COURSES = [('Main', 50), ('Appetizer', 25), ('Dessert', 25)]
+
+# Serving sizes and how likely each one is
+SERVING_SIZES = [(1.0, 3), (2.0, 20), (4.0, 35), (6.0, 20), (8.0, 12),
+        (10.0, 5), (12.0, 5)]
+
+DISH_TYPES = ['stew', 'salad', 'soup', 'casserole', 'stir-fry', 'pie',
+        'roast', 'curry', 'bake', 'tart', 'skillet', 'gratin', 'risotto',
+        'pasta', 'cake', 'cookies', 'pudding', 'tacos', 'bowl', 'sandwich']
+
+ADJECTIVES = ['Classic', 'Spicy', 'Creamy', 'Grandma\'s', 'Quick', 'Rustic',
+        'Smoky', 'Lemony', 'Crispy', 'Hearty', 'Easy', 'Weeknight',
+        'Slow-cooked', 'Garlicky', 'Sweet', 'Tangy', 'Golden', 'Herbed']
+
+# Instruction templates, filled in with ingredients, times and temperatures
+INSTRUCTIONS = [
+    'Preheat the oven to {temp} degrees F.',
+    'Chop the {a} and set aside.',
+    'Heat the {a} in a large skillet over medium heat.',
+    'Add the {a} and cook for {minutes} minutes, stirring occasionally.',
+    'In a large bowl, whisk together the {a} and the {b}.',
+    'Stir in the {a} and season with {b}.',
+    'Bring the {a} to a boil, then simmer for {minutes} minutes.',
+    'Fold in the {a} until just combined.',
+    'Transfer to a baking dish and bake for {minutes} minutes.',
+    'Let rest for {minutes} minutes before serving.',
+    'Blend the {a} and {b} until smooth.',
+    'Marinate the {a} for {hours} hours in the refrigerator.',
+    'Garnish with {a} and serve warm.',
+    'Roast the {a} in the oven at {temp} degrees F for {minutes} minutes.',
+    'Drain the {a} and toss with the {b}.',
+    'Cover and refrigerate for at least {hours} hours.',
+]
+
+# The sizes of corpus the benchmarks are usually run with
+DEFAULT_SIZES = [100, 1000, 10000]
+
+# The largest corpus the generator is meant to produce
+MAX_SIZE = 1000000
+
+def weighted_choice(rng, choices):
+    """Picks a value from a list of (value, weight) pairs."""
+    total = sum([weight for value, weight in choices])
+    point = rng.uniform(0, total)
+    for value, weight in choices:
+        point -= weight
+        if point <= 0:
+            return value
+    return choices[-1][0]
+
+class RecipeCorpus(object):
+    """
+    A seeded generator of synthetic recipes. Recipes are made one at a time,
+    so even a corpus of a million recipes never has to sit in memory all at
+    once.
+    """
+    def __init__(self, seed=42):
+        self.seed = seed
+        # Zipf-like popularity: the n-th ingredient is about n times less
+        # likely to be used than the first one
+        self.ingredientWeights = [(index, 1.0 / (index + 1)) for index in
+                range(len(INGREDIENTS))]
+
+    def make_ingredient(self, rng, index):
+        """Makes an ingredient dictionary out of the index of an ingredient."""
+        name, units = INGREDIENTS[index]
+        unit = rng.choice(units)
+        return {'name': name, 'quantity': rng.choice(QUANTITIES[unit]),
+                'unit': unit}
+
+    def make_instruction(self, rng, names):
+        """Makes an instruction mentioning some of the given ingredients."""
+        template = rng.choice(INSTRUCTIONS)
+        return template.format(a=rng.choice(names), b=rng.choice(names),
+                minutes=rng.choice([2, 5, 10, 15, 20, 25, 30, 45, 60]),
+                hours=rng.choice([1, 2, 4, 8, 12]),
+                temp=rng.choice([325, 350, 375, 400, 425, 450]))
+
+    def make_recipe(self, number):
+        """
+        Makes the recipe with the given number. Every recipe has its own
+        random generator derived from the seed, so any recipe of the corpus
+        can be made without making the ones before it.
+        """
+        rng = random.Random(self.seed * 1000003 + number)
+
+        # Most recipes have between 5 and 12 ingredients
+        count = max(1, min(len(INGREDIENTS), int(rng.lognormvariate(2.1,
+            0.35))))
+        indexes = []
+        while len(indexes) < count:
+            index = weighted_choice(rng, self.ingredientWeights)
+            if index not in indexes:
+                indexes.append(index)
+        ingredients = [self.make_ingredient(rng, index) for index in indexes]
+        names = [ingredient['name'] for ingredient in ingredients]
+
+        # And a couple of steps more than they have ingredients
+        steps = max(1, int(rng.gauss(count * 0.8 + 2, 2)))
+        instructions = [self.make_instruction(rng, names) for step in
+                range(steps)]
+
+        name = (rng.choice(ADJECTIVES) + ' ' + names[0].title() + ' ' +
+                rng.choice(DISH_TYPES).title() + ' #' + str(number))
+
+        return {'name': name, 'course': weighted_choice(rng, COURSES),
+                'serving_size': weighted_choice(rng, SERVING_SIZES),
+                'ingredients': ingredients, 'instructions': instructions,
+                'images': []}
+
+    def recipes(self, size):
+        """Yields size raw recipe dictionaries, one at a time."""
+        if size > MAX_SIZE:
+            raise ValueError('Corpus size is limited to ' + str(MAX_SIZE))
+        for number in xrange(size):
+            yield self.make_recipe(number)
+
+    def models(self, size):
+        """Yields size RecipeModel objects, one at a time."""
+        from models.recipemodel import RecipeModel
+
+        for raw in self.recipes(size):
+            recipe = RecipeModel()
+            recipe.name = raw['name']
+            recipe.course = raw['course']
+            recipe.servingSize = raw['serving_size']
+            recipe.ingredients = raw['ingredients']
+            recipe.instructions = raw['instructions']
+            recipe.images = raw['images']
+            yield recipe
+
+    def write(self, size, folder):
+        """Writes a corpus of size .rcpe files into the given folder."""
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        for number, recipe in enumerate(self.models(size)):
+            file = open(os.path.join(folder, 'recipe%07d.rcpe' % number), 'w')
+            file.write(recipe.export_recipe())
+            file.close()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Writes a synthetic ' +
+            'recipe corpus as .rcpe files.')
+    parser.add_argument('size', type=int, help='number of recipes')
+    parser.add_argument('folder', help='folder to write the recipes into')
+    parser.add_argument('--seed', type=int, default=42)
+    arguments = parser.parse_args()
+
+    RecipeCorpus(arguments.seed).write(arguments.size, arguments.folder)
+    print 'Wrote ' + str(arguments.size) + ' recipes to ' + arguments.folder
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+###############################################################################
+#
+# memory.py
+#
+# Reports how much memory a library of recipes takes, with and without the
+# strings they repeat being shared through the string table. The recipes are
+# read from .rcpe JSON the way the application reads them, since that is
+# where the copies come from. Run it from the top folder of the project:
+#
+#   python -m benchmarks.memory
+#   python -m benchmarks.memory --size 100000 --seed 7
+#
+###############################################################################
+
+import sys
+
+from models import codec
+from models.interning import get_string_pool
+from models.recipemodel import RecipeModel
+from benchmarks.corpus import RecipeCorpus
+
+def deep_size(roots):
+    """
+    Returns the number of bytes taken by the given objects and everything
+    they hold, and how many distinct strings there are among them. Objects
+    reachable more than once are counted once.
+    """
+    seen = set()
+    total = 0
+    strings = 0
+    pending = list(roots)
+
+    while pending:
+        value = pending.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        total += sys.getsizeof(value)
+
+        if isinstance(value, basestring):
+            strings += 1
+        elif isinstance(value, dict):
+            pending.extend(value.keys())
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif isinstance(value, RecipeModel):
+            pending.append(value.__dict__)
+
+    return total, strings
+
+def load_plain(documents):
+    """
+    Reads recipes the way they were read before the string table, each
+    with its own copies of every string.
+    """
+    recipes = []
+    for document in documents:
+        raw_recipe = codec.loads(document)
+        recipe = RecipeModel()
+        recipe.name = raw_recipe['name']
+        recipe.course = raw_recipe['course']
+        recipe.servingSize = raw_recipe['serving_size']
+        recipe.ingredients = raw_recipe['ingredients']
+        recipe.instructions = raw_recipe['instructions']
+        recipe.images = raw_recipe['images']
+        recipes.append(recipe)
+    return recipes
+
+def load_interned(documents):
+    """Reads recipes the way the application does."""
+    recipes = []
+    for document in documents:
+        recipe = RecipeModel()
+        recipe.load_recipe(codec.loads(document))
+        recipes.append(recipe)
+    return recipes
+
+def report(size, seed):
+    """Prints the memory taken by a library of the given size."""
+    documents = [recipe.export_recipe() for recipe in
+            RecipeCorpus(seed).models(size)]
+
+    plain, plainStrings = deep_size(load_plain(documents))
+    # The table itself is part of what interning costs
+    interned, internedStrings = deep_size(load_interned(documents) +
+            [get_string_pool().strings])
+
+    print 'Memory taken by ' + str(size) + ' recipes:\n'
+    print '%-22s %14s %14s' % ('', 'bytes', 'strings')
+    print '%-22s %14d %14d' % ('separate strings', plain, plainStrings)
+    print '%-22s %14d %14d' % ('shared strings', interned, internedStrings)
+    print '\n%d bytes saved (%.1f%%), %d bytes per recipe' % (
+            plain - interned, (plain - interned) * 100.0 / plain,
+            (plain - interned) / size)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reports the memory a ' +
+            'library of recipes takes, with and without shared strings.')
+    parser.add_argument('--size', type=int, default=10000,
+            help='how many recipes the library has')
+    parser.add_argument('--seed', type=int, default=42,
+            help='seed of the synthetic corpus')
+    arguments = parser.parse_args()
+
+    report(arguments.size, arguments.seed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,772 @@
+###############################################################################
+#
+# run.py
+#
+# Runs the benchmark suite over synthetic recipe corpora and stores the
+# results as JSON, so that runs can be compared with each other. Run it from
+# the top folder of the project:
+#
+#   python -m benchmarks.run
+#   python -m benchmarks.run --sizes 100 1000 100000 --seed 7
+#   python -m benchmarks.run --compare benchmarks/results/old.json
+#
+# The ShinyList, refresh_list and image loading benchmarks need PySide, and
+# are skipped when it is not installed. The nutrition benchmark reads the
+# nutrient table from ./data/nutrients.json, and the costing benchmark reads
+# the price table from ./data/prices.json.
+#
+###############################################################################
+
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+from models import codec
+
+from models.recipemodel import RecipeModel
+from benchmarks.corpus import RecipeCorpus, DEFAULT_SIZES
+
+# Where the results are written by default
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        'results')
+
+# How many distinct image files the image loading benchmark cycles through
+IMAGE_FILES = 20
+
+# How many recipes the similar recipes benchmark looks up
+SIMILAR_QUERIES = 100
+
+# Lines the parse_lines benchmark checks the parser on before timing it, and
+# what they have to parse to (None for lines that aren't ingredients)
+PARSE_CHECKS = [
+    ('2 1/2 cups flour, sifted', ('flour', 2.5, 'cup')),
+    ('1 (14 oz) can tomatoes', ('tomatoes', 1.0, 'can')),
+    ('2 cups (250 g) flour', ('flour', 2.0, 'cup')),
+    ('1 can (14 oz) diced tomatoes', ('diced tomatoes', 1.0, 'can')),
+    ('1 stick (1/2 cup) butter, softened', ('butter', 1.0, 'stick')),
+    ('1 cup (packed) brown sugar', ('brown sugar', 1.0, 'cup')),
+    ('3 cans (400 g) beans', ('beans', 3.0, 'can')),
+    ('a pinch of salt', ('salt', 1.0, 'pinch')),
+    ('3 eggs', ('eggs', 3.0, 'pc')),
+    ('1/0 cup sugar', ('sugar', 1.0, 'cup')),
+    ('1 cup', None),
+    ('2 cups (250 g)', None),
+    ('For the sauce:', None)]
+
+class QuietOutput(object):
+    """
+    Silences the debug messages printed all over the application while a
+    benchmark runs, so the terminal is not what gets measured.
+    """
+    def __enter__(self):
+        self.stdout = sys.stdout
+        self.devnull = open(os.devnull, 'w')
+        sys.stdout = self.devnull
+
+    def __exit__(self, *exception):
+        sys.stdout = self.stdout
+        self.devnull.close()
+
+# The Qt application the GUI benchmarks run in, made by the first of them
+qtApp = None
+
+def get_app():
+    """Returns the Qt application, making it the first time."""
+    global qtApp
+
+    from PySide.QtGui import QApplication
+    if qtApp is None:
+        qtApp = QApplication.instance() or QApplication(sys.argv)
+    return qtApp
+
+def have_pyside():
+    """Returns whether PySide can be imported."""
+    try:
+        import PySide
+    except ImportError:
+        return False
+    return True
+
+def setup_import(corpus, size):
+    """Times RecipeModel.import_recipe over pre-encoded recipes."""
+    encoded = [recipe.export_recipe() for recipe in corpus.models(size)]
+
+    def run():
+        for raw_json in encoded:
+            RecipeModel().import_recipe(raw_json)
+    return run
+
+def setup_export(corpus, size):
+    """Times RecipeModel.export_recipe."""
+    recipes = list(corpus.models(size))
+
+    def run():
+        for recipe in recipes:
+            recipe.export_recipe()
+    return run
+
+def setup_shopping_list(corpus, size):
+    """Times scaling every recipe to twice its serving size."""
+    recipes = list(corpus.models(size))
+
+    def run():
+        for recipe in recipes:
+            recipe.scale_ingredients(recipe.servingSize * 2)
+    return run
+
+def setup_nutrition_library(corpus, size):
+    """
+    Times recomputing the nutrition of a whole library after the nutrient
+    table has been replaced.
+    """
+    from models.nutrition import NutrientTable, NutritionEngine
+
+    recipes = list(corpus.models(size))
+    engine = NutritionEngine(NutrientTable.load())
+
+    def run():
+        # A fresh table makes every cached result stale
+        engine.set_table(NutrientTable.load())
+        engine.recompute_library(recipes)
+    return run
+
+def setup_costing_library(corpus, size):
+    """
+    Times recomputing the cost of a whole library after the price table has
+    been replaced.
+    """
+    from models.costing import PriceTable, CostingEngine
+
+    recipes = list(corpus.models(size))
+    engine = CostingEngine(PriceTable.load())
+
+    def run():
+        # A fresh table makes every cached result stale
+        engine.set_table(PriceTable.load())
+        engine.recompute_library(recipes)
+    return run
+
+def setup_normalize_import(corpus, size):
+    """
+    Times merging the ingredient names of freshly imported recipes into a
+    vocabulary seeded with the nutrient table, the way importing does it.
+    """
+    from models.nutrition import NutrientTable
+    from models.normalize import IngredientNormalizer
+
+    encoded = [recipe.export_recipe() for recipe in corpus.models(size)]
+    names = NutrientTable.load().names
+
+    def run():
+        normalizer = IngredientNormalizer(names)
+        for raw_json in encoded:
+            recipe = RecipeModel()
+            recipe.import_recipe(raw_json)
+            normalizer.normalize_ingredients(recipe.ingredients)
+    return run
+
+def setup_find_duplicates(corpus, size):
+    """
+    Times finding the near-duplicates in a library where one recipe in a
+    hundred has a slightly changed copy. The signatures made in bulk are
+    checked against the ones made one at a time first, with empty recipes
+    in between and at the end.
+    """
+    from models.dedup import MinHasher, find_duplicates, recipe_shingles
+
+    recipes = list(corpus.models(size))
+
+    hasher = MinHasher()
+    shingleSets = []
+    for recipe in recipes[:20]:
+        shingleSets.extend([recipe_shingles(recipe), set()])
+    shingleSets.append(set())
+    if hasher.signatures(shingleSets) != [hasher.signature(shingles) for
+            shingles in shingleSets]:
+        raise AssertionError('Bulk and single MinHash signatures differ')
+    copies = list(corpus.models(max(size / 100, 1)))
+    for recipe in copies:
+        recipe.name = recipe.name + ' (copy)'
+        if recipe.instructions:
+            recipe.instructions[0] = recipe.instructions[0] + ' Enjoy.'
+    recipes.extend(copies)
+
+    def run():
+        find_duplicates(recipes)
+    return run
+
+def setup_similar_recipes(corpus, size):
+    """
+    Times looking up the most similar recipes of SIMILAR_QUERIES recipes in
+    an indexed library, the way the recipe overview does it.
+    """
+    from models.similarity import SimilarityIndex
+
+    recipes = list(corpus.models(size))
+    index = SimilarityIndex(recipes)
+    queries = recipes[:SIMILAR_QUERIES]
+
+    def run():
+        for recipe in queries:
+            index.similar(recipe)
+    return run
+
+def setup_rescan_folder(corpus, size):
+    """
+    Times what a restart costs with an unchanged recipe folder: loading its
+    manifest, scanning it and getting every recipe out of the manifest.
+    """
+    from models.recipefolder import RecipeFolder
+
+    folder = tempfile.mkdtemp(prefix='pyrecipe-bench-')
+    for number, recipe in enumerate(corpus.models(size)):
+        file = open(os.path.join(folder, 'recipe%07d.rcpe' % number), 'w')
+        file.write(recipe.export_recipe())
+        file.close()
+    RecipeFolder(folder).scan()
+
+    def run():
+        recipeFolder = RecipeFolder(folder)
+        recipeFolder.scan()
+        recipeFolder.recipes()
+    run.temporary = [folder]
+    return run
+
+def setup_stream_import(corpus, size):
+    """
+    Times reading a library export (a JSON list of recipes) one recipe at a
+    time, the way big files are imported.
+    """
+    from models.streaming import iter_recipes
+
+    descriptor, path = tempfile.mkstemp(prefix='pyrecipe-bench-',
+            suffix='.json')
+    file = os.fdopen(descriptor, 'w')
+    file.write('[' + ','.join([recipe.export_recipe() for recipe in
+        corpus.models(size)]) + ']')
+    file.close()
+
+    def run():
+        file = open(path, 'rb')
+        for recipe in iter_recipes(file):
+            pass
+        file.close()
+    run.temporary = [path]
+    return run
+
+def setup_json_codecs(corpus, size):
+    """
+    Times decoding and encoding recipes with the JSON libraries the codec
+    picked. Every installed library is timed over the same recipes too, and
+    whether it can be used at all, which is what the codec's order of
+    preference is based on.
+    """
+    from models.codec import Codec, Backend, load_library, DECODERS, ENCODERS
+
+    documents = [recipe.export_recipe() for recipe in corpus.models(size)]
+    values = [codec.loads(document) for document in documents]
+    options = ((',', ':'), None, False)
+
+    figures = {'decoder': codec.get_codec().get_decoder().name,
+            'encoder': codec.get_codec().get_encoder(options).name}
+    for name in sorted(set(DECODERS + ENCODERS)):
+        if load_library(name) is None:
+            continue
+        backend = Backend(name, load_library(name))
+        tester = Codec(name)
+        figures[name + '_speedups'] = backend.speedups
+        figures[name + '_decodes_alike'] = tester.decodes_like_reference(
+                backend)
+        figures[name + '_encodes_alike'] = tester.encodes_like_reference(
+                backend, options)
+        figures[name + '_decode_microseconds'] = min(timeit.repeat(
+            lambda: [backend.loads(document) for document in documents],
+            number=1, repeat=3)) / size * 1e6
+        figures[name + '_encode_microseconds'] = min(timeit.repeat(
+            lambda: [backend.dumps(value, *options) for value in values],
+            number=1, repeat=3)) / size * 1e6
+
+    def run():
+        for document in documents:
+            codec.loads(document)
+        for value in values:
+            codec.dumps(value, separators=(',', ':'))
+    run.figures = figures
+    return run
+
+def setup_archive_write(corpus, size):
+    """Times writing a library into a compressed recipe archive."""
+    from models.archive import encode_library
+
+    recipes = list(corpus.models(size))
+
+    def run():
+        encode_library(recipes)
+    return run
+
+def setup_archive_read(corpus, size):
+    """
+    Times reading the recipes out of a compressed recipe archive, to be
+    compared with import_recipe. The sizes of the archive, of the same
+    recipes as .rcpe files and of those files zipped together are kept
+    along with the times.
+    """
+    import zlib
+    from models.archive import encode_library, decode_library
+
+    recipes = list(corpus.models(size))
+    data = encode_library(recipes)
+    raw_json = ''.join([recipe.export_recipe() for recipe in recipes])
+
+    def run():
+        decode_library(data)
+    run.figures = {'archive_bytes': len(data), 'json_bytes': len(raw_json),
+            'zlib_json_bytes': len(zlib.compress(raw_json)),
+            'compression_ratio': len(raw_json) / float(len(data))}
+    return run
+
+def setup_print_binder(corpus, size):
+    """
+    Times printing recipes into a PDF binder, with a shopping list of all of
+    them, in as many worker processes as there are processors. Every tenth
+    recipe has an image. The size of the binder is kept along with the
+    times.
+    """
+    import multiprocessing
+    from models.binder import recipe_card, write_binder
+
+    image = os.path.join(os.path.dirname(RESULTS_FOLDER), 'gui', 'images',
+            'placeholder.png')
+    recipes = list(corpus.models(size))
+    for recipe in recipes[::10]:
+        recipe.images = [image]
+    cards = [recipe_card(recipe) for recipe in recipes]
+    handle, path = tempfile.mkstemp(suffix='.pdf')
+    os.close(handle)
+
+    def run():
+        run.figures['pages'] = write_binder(path, cards)
+        run.figures['pdf_bytes'] = os.path.getsize(path)
+    run.figures = {'workers': multiprocessing.cpu_count()}
+    run.temporary = [path]
+    return run
+
+def setup_site_rebuild(corpus, size):
+    """
+    Times rebuilding the static site of a library after a single recipe
+    was edited. The time of the first, full build is kept too.
+    """
+    from models.website import SiteBuilder
+
+    recipes = list(corpus.models(size))
+    folder = tempfile.mkdtemp(prefix='pyrecipe-site-')
+    builder = SiteBuilder(folder)
+
+    start = time.time()
+    builder.build(recipes)
+    fullBuild = time.time() - start
+
+    def run():
+        edited = recipes[len(recipes) // 2]
+        edited.servingSize += 1
+        builder.build(recipes, [edited])
+    run.figures = {'full_build_seconds': fullBuild}
+    run.temporary = [folder]
+    return run
+
+def setup_library_diff(corpus, size):
+    """
+    Times comparing two libraries that differ in four recipes, through
+    their Merkle trees. The other library is published in a folder, as it
+    would be in a shared one. The time of building the first tree, and of
+    comparing in the same process, are kept too.
+    """
+    from models.librarysync import LibraryIndex, SharedLibrary, diff_libraries
+
+    local = list(corpus.models(size))
+    remote = list(corpus.models(size))
+    for recipe in remote[1::max(size // 4, 1)][:4]:
+        recipe.servingSize += 1
+
+    start = time.time()
+    localIndex = LibraryIndex()
+    localIndex.refresh(local)
+    fullBuild = time.time() - start
+    remoteIndex = LibraryIndex()
+    remoteIndex.refresh(remote)
+
+    folder = tempfile.mkdtemp(prefix='pyrecipe-sync-')
+    shared = SharedLibrary(folder)
+    shared.publish(remoteIndex)
+
+    start = time.time()
+    diff_libraries(localIndex, remoteIndex)
+    inProcess = time.time() - start
+
+    def run():
+        run.figures['differences'] = len(diff_libraries(localIndex, shared))
+    run.figures = {'full_build_seconds': fullBuild,
+            'in_process_seconds': inProcess}
+    run.temporary = [folder]
+    return run
+
+def setup_service_plan(corpus, size):
+    """
+    Times planning a service of ten recipes of the library at a time, for
+    two cooks, with the steps read afresh the first time (the time of the
+    first plan is kept too).
+    """
+    from models.timeline import plan_service, stepMemo
+
+    recipes = list(corpus.models(size))
+    services = [recipes[start:start + 10] for start in range(0,
+        len(recipes), 10)]
+
+    stepMemo.clear()
+    start = time.time()
+    plan_service(services[0], 2)
+    firstPlan = time.time() - start
+
+    def run():
+        for service in services:
+            plan_service(service, 2)
+    run.figures = {'first_plan_seconds': firstPlan}
+    return run
+
+def setup_analyze_library(corpus, size):
+    """
+    Times analyzing the instructions of a whole library in as many worker
+    processes as there are processors, with nothing cached. The time of
+    analyzing it again, with everything cached, is kept too.
+    """
+    import multiprocessing
+    from models.analysis import InstructionAnalyzer
+
+    recipes = list(corpus.models(size))
+
+    def run():
+        analyzer = InstructionAnalyzer()
+        analyzer.analyze_library(recipes)
+
+        start = time.time()
+        for recipe in recipes:
+            analyzer.analyze(recipe)
+        run.figures['cached_seconds'] = time.time() - start
+    run.figures = {'workers': multiprocessing.cpu_count()}
+    return run
+
+def setup_parse_lines(corpus, size):
+    """
+    Times parsing the ingredients of a library written out as text lines,
+    like "1 1/3 cups flour", with nothing memoized. The time of parsing
+    them again, with every line memoized, is kept too, as lines per
+    millisecond. The parser is checked on PARSE_CHECKS first.
+    """
+    from models.ingredientparser import parse_lines, read_line, lineMemo
+    from models.quantity import format_amount
+
+    for line, expected in PARSE_CHECKS:
+        parsed = read_line(line)
+        if parsed != expected:
+            raise AssertionError(repr(line) + ' parsed to ' + repr(parsed) +
+                    ', not ' + repr(expected))
+
+    lines = [format_amount(ingredient['quantity'], ingredient['unit']) + ' ' +
+            ingredient['name'] for recipe in corpus.models(size) for
+            ingredient in recipe.ingredients]
+
+    def run():
+        lineMemo.clear()
+        parse_lines(lines)
+
+        start = time.time()
+        parse_lines(lines)
+        run.figures['memoized_lines_per_ms'] = (len(lines) / 1000.0 /
+                (time.time() - start))
+    run.figures = {'lines': len(lines)}
+    return run
+
+def setup_convert_markdown(corpus, size):
+    """
+    Times converting a library written out as a Markdown file, a heading
+    per recipe, into .rcpe text, the way collections are converted into
+    recipe folders.
+    """
+    from models.converters import Conversion
+    from models.quantity import format_amount
+
+    descriptor, path = tempfile.mkstemp(prefix='pyrecipe-bench-',
+            suffix='.md')
+    file = os.fdopen(descriptor, 'w')
+    for recipe in corpus.models(size):
+        file.write('## ' + recipe.name + '\n\nServes: ' +
+                str(recipe.servingSize) + '\n\n### Ingredients\n\n')
+        for ingredient in recipe.ingredients:
+            file.write('- ' + format_amount(ingredient['quantity'],
+                ingredient['unit']) + ' ' + ingredient['name'] + '\n')
+        file.write('\n### Instructions\n\n')
+        for number, instruction in enumerate(recipe.instructions):
+            file.write(str(number + 1) + '. ' + instruction + '\n')
+        file.write('\n')
+    file.close()
+
+    def run():
+        file = open(path, 'rb')
+        for recipe in Conversion(file, 'Markdown', encode=True):
+            pass
+        file.close()
+    run.temporary = [path]
+    return run
+
+def setup_pantry_offset(corpus, size):
+    """
+    Times taking a pantry off the shopping list of a whole library, added
+    up the way the binder adds it up. The pantry holds half of the
+    ingredients, a third of them in other units of the same kind. The time
+    of a week's plan (21 recipes, from adding up to the net list) and of
+    adding what was bought to the pantry in bulk are kept too.
+    """
+    from models.binder import aggregate_ingredients, recipe_card
+    from models.pantry import Pantry
+
+    recipes = list(corpus.models(size))
+    ingredients = aggregate_ingredients([recipe_card(recipe) for recipe in
+        recipes])
+    stocked = []
+    other = {'g': 'kg', 'cup': 'ml', 'tbsp': 'tsp', 'ml': 'cup'}
+    for number, (name, quantity, unit) in enumerate(ingredients[::2]):
+        if number % 3 == 0 and unit in other:
+            stocked.append((name, 1, other[unit]))
+        else:
+            stocked.append((name, quantity / 2, unit))
+    pantry = Pantry()
+    pantry.apply(stocked)
+    week = recipes[:21]
+
+    def run():
+        net = pantry.net_list(ingredients)
+
+        start = time.time()
+        pantry.net_list(aggregate_ingredients([recipe_card(recipe) for
+            recipe in week]))
+        run.figures['week_plan_ms'] = (time.time() - start) * 1000
+
+        start = time.time()
+        pantry.copy().apply(net)
+        run.figures['bulk_update_ms'] = (time.time() - start) * 1000
+    run.figures = {'shopping_list': len(ingredients)}
+    return run
+
+def make_items(recipes):
+    """Makes the ShinyList items the main window would make for recipes."""
+    from gui.shinylist import ShinyListItem
+
+    items = []
+    for recipe in recipes:
+        item = ShinyListItem()
+        item.set_main_text(recipe.name)
+        item.set_sub_text(recipe.course + ', serves ' +
+                str(recipe.servingSize) + ' people')
+        items.append(item)
+    return items
+
+def setup_shinylist(corpus, size):
+    """Times making ShinyList items and adding them to a ShinyList."""
+    from gui.shinylist import ShinyList
+
+    get_app()
+    recipes = list(corpus.models(size))
+
+    def run():
+        shinyList = ShinyList()
+        for item in make_items(recipes):
+            shinyList.add_item(item)
+    return run
+
+def setup_refresh_list(corpus, size):
+    """Times MainWindow.refresh_list with a full list of recipes."""
+    from gui.mainwindow import MainWindow
+
+    get_app()
+    window = MainWindow()
+    window.hide()
+    window.recipes = list(corpus.models(size))
+    window.shinyListItems = make_items(window.recipes)
+
+    def run():
+        window.refresh_list()
+    return run
+
+def setup_image_loading(corpus, size):
+    """
+    Times loading and scaling recipe images the way the recipe overview
+    does it.
+    """
+    from PySide.QtGui import QImage, QPixmap, QColor
+
+    get_app()
+    folder = tempfile.mkdtemp(prefix='pyrecipe-bench-')
+    paths = []
+    for number in range(IMAGE_FILES):
+        image = QImage(1600, 1200, QImage.Format_RGB32)
+        image.fill(QColor(number * 12, 90, 180).rgb())
+        path = os.path.join(folder, 'image%02d.png' % number)
+        image.save(path)
+        paths.append(path)
+
+    def run():
+        for number in xrange(size):
+            QPixmap(paths[number % IMAGE_FILES]).scaledToWidth(420)
+    run.temporary = [folder]
+    return run
+
+# The benchmarks, in the order they are run: (name, setup, needs PySide)
+BENCHMARKS = [
+    ('import_recipe', setup_import, False),
+    ('export_recipe', setup_export, False),
+    ('shopping_list', setup_shopping_list, False),
+    ('nutrition_library', setup_nutrition_library, False),
+    ('costing_library', setup_costing_library, False),
+    ('normalize_import', setup_normalize_import, False),
+    ('find_duplicates', setup_find_duplicates, False),
+    ('similar_recipes', setup_similar_recipes, False),
+    ('rescan_folder', setup_rescan_folder, False),
+    ('stream_import', setup_stream_import, False),
+    ('json_codecs', setup_json_codecs, False),
+    ('archive_write', setup_archive_write, False),
+    ('archive_read', setup_archive_read, False),
+    ('print_binder', setup_print_binder, False),
+    ('site_rebuild', setup_site_rebuild, False),
+    ('library_diff', setup_library_diff, False),
+    ('service_plan', setup_service_plan, False),
+    ('analyze_library', setup_analyze_library, False),
+    ('parse_lines', setup_parse_lines, False),
+    ('convert_markdown', setup_convert_markdown, False),
+    ('pantry_offset', setup_pantry_offset, False),
+    ('shinylist_populate', setup_shinylist, True),
+    ('refresh_list', setup_refresh_list, True),
+    ('image_loading', setup_image_loading, True),
+]
+
+def remove_temporary(paths):
+    """Removes the temporary files and folders a benchmark made."""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+
+def time_benchmark(setup, corpus, size, repeat):
+    """
+    Sets a benchmark up and times it. Returns a dictionary with the best and
+    mean times, and the time per recipe. Benchmarks can also measure other
+    figures (like sizes) and hang them on their run function as
+    run.figures, which are added to the dictionary. The temporary files and
+    folders they hang on it as run.temporary are removed once it is timed.
+    """
+    run = setup(corpus, size)
+    times = []
+    try:
+        with QuietOutput():
+            for attempt in range(repeat):
+                start = timeit.default_timer()
+                run()
+                times.append(timeit.default_timer() - start)
+    finally:
+        remove_temporary(getattr(run, 'temporary', []))
+
+    best = min(times)
+    result = {'best_seconds': best, 'mean_seconds': sum(times) / len(times),
+            'per_recipe_microseconds': best / size * 1e6,
+            'recipes_per_second': size / best if best else None}
+    result.update(getattr(run, 'figures', {}))
+    return result
+
+def run_benchmarks(sizes, seed, repeat, names=None):
+    """Runs the benchmarks and returns the results as a dictionary."""
+    corpus = RecipeCorpus(seed)
+    pyside = have_pyside()
+
+    results = {}
+    for name, setup, needsPyside in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        results[name] = {}
+        for size in sizes:
+            if needsPyside and not pyside:
+                results[name][str(size)] = {'skipped':
+                        'PySide is not installed'}
+                continue
+
+            print 'Running ' + name + ' with ' + str(size) + ' recipes...'
+            results[name][str(size)] = time_benchmark(setup, corpus, size,
+                    repeat)
+
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(), 'seed': seed, 'repeat': repeat,
+            'sizes': sizes, 'results': results}
+
+def compare_results(old, new):
+    """Prints how every benchmark changed between two runs."""
+    print '\n%-20s %10s %14s %14s %8s' % ('benchmark', 'recipes',
+            'old (us/rcp)', 'new (us/rcp)', 'change')
+
+    for name in sorted(new['results']):
+        for size, result in sorted(new['results'][name].items(),
+                key=lambda pair: int(pair[0])):
+            oldResult = old['results'].get(name, {}).get(size, {})
+            if ('per_recipe_microseconds' not in result or
+                    'per_recipe_microseconds' not in oldResult):
+                continue
+
+            before = oldResult['per_recipe_microseconds']
+            after = result['per_recipe_microseconds']
+            print '%-20s %10s %14.2f %14.2f %+7.1f%%' % (name, size, before,
+                    after, (after - before) / before * 100)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Runs the PyRecipe-4-U ' +
+            'benchmark suite.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+            default=DEFAULT_SIZES, help='corpus sizes to run with')
+    parser.add_argument('--seed', type=int, default=42,
+            help='seed of the synthetic corpus')
+    parser.add_argument('--repeat', type=int, default=3,
+            help='how many times each benchmark is timed')
+    parser.add_argument('--only', nargs='+', metavar='BENCHMARK',
+            help='only run the given benchmarks')
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--compare', metavar='RESULTS',
+            help='results of an earlier run to compare against')
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.sizes, arguments.seed,
+            arguments.repeat, arguments.only)
+
+    output = arguments.output
+    if not output:
+        if not os.path.isdir(RESULTS_FOLDER):
+            os.makedirs(RESULTS_FOLDER)
+        output = os.path.join(RESULTS_FOLDER,
+                time.strftime('%Y%m%d-%H%M%S') + '.json')
+
+    file = open(output, 'w')
+    file.write(codec.dumps(results, indent=2, sort_keys=True))
+    file.close()
+    print 'Results written to ' + output
+
+    if arguments.compare:
+        file = open(arguments.compare, 'r')
+        compare_results(codec.loads(file.read()), results)
+        file.close()
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,3 @@
-__all__ = ['mainwindow', 'shinylist', 'recipe', 'ingredients', 'instructions', 'shopping_list', 'errordialog']
+__all__ = ['mainwindow', 'shinylist', 'recipe', 'ingredients',
+        'instructions', 'shopping_list', 'errordialog', 'listmodels',
+        'instrumentation', 'duplicates', 'timeline', 'pantry']
@@ -0,0 +1,128 @@
+###############################################################################
+#
+# duplicates.py
+#
+# The dialog that shows the recipes in the library that are near-duplicates
+# of each other, and lets the user merge every pair by keeping one of the two
+# recipes.
+#
+###############################################################################
+
+# PySide imports
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+class DuplicatesDialog(QDialog):
+    """
+    Dialog that lists the pairs of near-duplicate recipes, most similar
+    first. Merging a pair keeps one of its recipes and removes the other.
+    """
+    def get_removed(self):
+        """
+        Returns the indexes of the recipes the user chose to remove, from the
+        last to the first, so they can be popped from the list in order.
+        """
+        return sorted(self.removed, reverse=True)
+
+    def describe_recipe(self, index):
+        """Returns a short description of a recipe in the list."""
+        recipe = self.recipes[index]
+        return (recipe.name + ' (' + recipe.course + ', serves ' +
+                str(recipe.servingSize) + ')')
+
+    def refresh_list(self):
+        """
+        Repopulates the visible list with the pairs that are still left.
+        """
+        self.pairsList.clear()
+        for similarity, first, second in self.pairs:
+            self.pairsList.addItem(self.describe_recipe(first) + '  and  ' +
+                    self.describe_recipe(second) + '  -  ' +
+                    str(int(round(similarity * 100))) + '% similar')
+
+        self.toggle_buttons()
+
+    def toggle_buttons(self):
+        """
+        Enables the merge buttons only when a pair has been selected.
+        """
+        selected = self.pairsList.currentRow() >= 0 and len(self.pairs) > 0
+        self.keepFirstButton.setEnabled(selected)
+        self.keepSecondButton.setEnabled(selected)
+        self.skipButton.setEnabled(selected)
+
+    def remove_recipe(self, index):
+        """
+        Marks a recipe for removal, and drops every pair it was part of.
+        """
+        self.removed.add(index)
+        self.pairs = [pair for pair in self.pairs if index not in pair[1:]]
+        self.refresh_list()
+
+    def keep_first(self):
+        """Merges the selected pair into its first recipe."""
+        similarity, first, second = self.pairs[self.pairsList.currentRow()]
+        self.remove_recipe(second)
+
+    def keep_second(self):
+        """Merges the selected pair into its second recipe."""
+        similarity, first, second = self.pairs[self.pairsList.currentRow()]
+        self.remove_recipe(first)
+
+    def skip(self):
+        """
+        Drops the selected pair from the list, keeping both of its recipes.
+        """
+        self.pairs.pop(self.pairsList.currentRow())
+        self.refresh_list()
+
+    def __init__(self, parent, recipes, pairs):
+        """
+        Initializes the dialog with the list of recipes and the
+        (similarity, first index, second index) triples of the pairs of
+        near-duplicates found in it.
+        """
+        super(DuplicatesDialog, self).__init__(parent)
+
+        self.recipes = recipes
+        self.pairs = list(pairs)
+        # Indexes of the recipes to be removed from the library
+        self.removed = set()
+
+        self.setWindowTitle("Duplicate Recipes")
+
+        # Creation
+        self.mainLayout = QVBoxLayout()
+        self.buttonLayout = QHBoxLayout()
+
+        self.pairsList = QListWidget()
+        self.pairsList.setToolTip("Pairs of recipes that look like " +
+                "duplicates of each other")
+
+        self.keepFirstButton = QPushButton("Keep First")
+        self.keepFirstButton.setToolTip("Merges the selected pair by " +
+                "keeping the first recipe and removing the second")
+        self.keepSecondButton = QPushButton("Keep Second")
+        self.keepSecondButton.setToolTip("Merges the selected pair by " +
+                "keeping the second recipe and removing the first")
+        self.skipButton = QPushButton("Not Duplicates")
+        self.skipButton.setToolTip("Keeps both recipes of the selected pair")
+        self.doneButton = QPushButton("Done")
+
+        # Layouting
+        self.setLayout(self.mainLayout)
+        self.mainLayout.addWidget(self.pairsList)
+        self.mainLayout.addLayout(self.buttonLayout)
+        self.buttonLayout.addWidget(self.keepFirstButton)
+        self.buttonLayout.addWidget(self.keepSecondButton)
+        self.buttonLayout.addWidget(self.skipButton)
+        self.buttonLayout.addWidget(self.doneButton)
+
+        # Signals
+        self.pairsList.currentRowChanged.connect(self.toggle_buttons)
+        self.keepFirstButton.clicked.connect(self.keep_first)
+        self.keepSecondButton.clicked.connect(self.keep_second)
+        self.skipButton.clicked.connect(self.skip)
+        self.doneButton.clicked.connect(self.accept)
+
+        self.refresh_list()
@@ -14,6 +14,21 @@ from PySide.QtGui import *
 # Import the error dialog
 from errordialog import *
 
+# Undo/redo history import
+from models.history import *
+
+# Copy-on-write list import
+from models.draft import *
+
+# List model import
+from listmodels import *
+
+# Ingredient name normalization import
+from models.normalize import *
+
+# Ingredient line parsing import
+from models.ingredientparser import parse_ingredients
+
 class IngredientEdit(QDialog):
     """
     A smaller dialog that contains the form data that allows the user to
@@ -36,7 +51,9 @@ class IngredientEdit(QDialog):
         """
         if not (self.nameData.text() == '' or self.quantityData.value() == 0.0
             or self.unitData.text() == ''):
-                # No missing data, so carry on
+                # No missing data, so remember the name as it was entered
+                # and carry on
+                self.normalizer.add(self.nameData.text())
                 self.done(1)
         else:
             # There are missing data, invoke the error dialog
@@ -46,6 +63,35 @@ class IngredientEdit(QDialog):
                 # The user wants to discard
                 self.done(1)
 
+    def refresh_suggestions(self, text):
+        """
+        Refreshes the names suggested under the name input while the user is
+        typing.
+        """
+        suggestions = self.normalizer.suggest(text)
+        self.nameSuggestions.setStringList(suggestions)
+        if suggestions:
+            self.nameCompleter.complete()
+        self.refresh_known_name()
+
+    def refresh_known_name(self):
+        """
+        Offers the name we know already that the name entered looks like,
+        if any. The name entered is only replaced if the user says so.
+        """
+        self.knownName = self.normalizer.suggestion(self.nameData.text())
+        if self.knownName is None:
+            self.knownNameButton.hide()
+        else:
+            self.knownNameButton.setText("Use \"" + self.knownName + "\"")
+            self.knownNameButton.show()
+
+    def use_known_name(self):
+        """Replaces the name entered with the name we know already."""
+        if self.knownName is not None:
+            self.nameData.setText(self.knownName)
+            self.refresh_known_name()
+
     def refresh_data(self):
         """
         Refreshes the fields using the passed ingredient.
@@ -79,6 +125,20 @@ class IngredientEdit(QDialog):
         # Name input
         self.nameData = QLineEdit()
         self.nameData.setToolTip("The name of this ingredient")
+        # Name suggestions, refreshed as the user types
+        self.normalizer = get_normalizer()
+        self.nameSuggestions = QStringListModel()
+        self.nameCompleter = QCompleter(self)
+        self.nameCompleter.setModel(self.nameSuggestions)
+        self.nameCompleter.setCompletionMode(
+                QCompleter.UnfilteredPopupCompletion)
+        self.nameData.setCompleter(self.nameCompleter)
+        # The name we know already that the name entered looks like
+        self.knownName = None
+        self.knownNameButton = QPushButton()
+        self.knownNameButton.setFlat(True)
+        self.knownNameButton.setToolTip("A name already in use that looks " +
+                "like this one. Click to use it instead")
         # Quantity input
         self.quantityData = QDoubleSpinBox()
         self.quantityData.setToolTip("How much of this ingredient is " +
@@ -95,17 +155,86 @@ class IngredientEdit(QDialog):
 
         # Initialize the signals of the button
         self.saveButton.clicked.connect(self.submit)
+        # Suggest names as the user types
+        self.nameData.textEdited.connect(self.refresh_suggestions)
+        self.knownNameButton.clicked.connect(self.use_known_name)
 
         # Layouting
         self.setLayout(self.mainLayout)
         self.mainLayout.addLayout(self.formLayout)
         self.formLayout.addRow("Name:", self.nameData)
+        self.formLayout.addRow("", self.knownNameButton)
         self.formLayout.addRow("Qty:", self.quantityData)
         self.formLayout.addRow("Unit:", self.unitData)
         self.mainLayout.addWidget(self.saveButton)
 
         # Refresh the fields, in case we're editing or something
         self.refresh_data()
+        self.refresh_known_name()
+
+class IngredientPaste(QDialog):
+    """
+    A dialog that takes ingredients pasted in as text, a line each, and
+    shows what every line is read as while the user edits them.
+    """
+    def get_ingredients(self):
+        """
+        Returns the ingredients read from the text, with their names as they
+        were entered. The names are remembered for suggesting later on.
+        """
+        ingredients = parse_ingredients(self.textData.toPlainText())
+        for ingredient in ingredients:
+            self.normalizer.add(ingredient['name'])
+        return ingredients
+
+    def refresh_preview(self):
+        """
+        Shows what the lines are read as, and the names we know already that
+        the names look like. Called whenever the text changes.
+        """
+        self.previewList.clear()
+        for ingredient in parse_ingredients(self.textData.toPlainText()):
+            line = (ingredient['name'] + ': ' + str(ingredient['quantity']) +
+                    ' ' + ingredient['unit'])
+            knownName = self.normalizer.suggestion(ingredient['name'])
+            if knownName is not None:
+                line += ' (did you mean "' + knownName + '"?)'
+            self.previewList.addItem(line)
+
+    def __init__(self, parent):
+        """
+        Initializes the window and its UI components.
+        """
+        super(IngredientPaste, self).__init__(parent)
+
+        self.setWindowTitle("Paste Ingredients")
+        self.normalizer = get_normalizer()
+
+        # Layouts
+        self.mainLayout = QVBoxLayout()
+        self.splitLayout = QHBoxLayout()
+
+        # The pasted text, and what it is read as
+        self.textData = QPlainTextEdit()
+        self.textData.setToolTip("One ingredient a line, like " +
+                "\"2 1/2 cups flour, sifted\"")
+        self.previewList = QListWidget()
+        self.previewList.setToolTip("The ingredients that will be added")
+
+        # Add button
+        self.addButton = QPushButton("Add")
+        self.addButton.setToolTip("Adds these ingredients to the recipe")
+
+        # Signals
+        self.textData.textChanged.connect(self.refresh_preview)
+        self.addButton.clicked.connect(self.accept)
+
+        # Layouting
+        self.setLayout(self.mainLayout)
+        self.mainLayout.addLayout(self.splitLayout)
+        self.splitLayout.addWidget(self.textData)
+        self.splitLayout.addWidget(self.previewList)
+        self.mainLayout.addWidget(self.addButton)
 
 class IngredientsWindow(QDialog):
     """
@@ -114,9 +243,12 @@ class IngredientsWindow(QDialog):
     """
     def get_ingredients(self):
         """
-        Returns the array of ingredients.
+        Returns the array of ingredients. If the user closed the window
+        without saving, the untouched list that was passed in is returned.
         """
-        return self.ingredients
+        if self.saved:
+            return self.ingredients.to_list()
+        return self.ingredients.base
 
     def enable_buttons(self):
         """
@@ -125,17 +257,38 @@ class IngredientsWindow(QDialog):
         """
         self.deleteIngredientButton.setEnabled(True)
 
-    def initialize_list(self):
+    def toggle_history_buttons(self):
+        """
+        Enables or disables the Undo and Redo buttons depending on whether
+        there is anything to undo or redo.
+        """
+        self.undoButton.setEnabled(self.history.can_undo())
+        self.redoButton.setEnabled(self.history.can_redo())
+
+    def record_change(self, label):
+        """
+        Records the current list of ingredients in the undo history. Called
+        after every change made to the list.
+        """
+        self.history.push(freeze_ingredients(self.ingredients,
+            self.history.current()), label)
+        self.toggle_history_buttons()
+
+    def restore_state(self, state):
         """
-        Initializes the listview of ingredients by referring to the list of
-        ingredients inside the dialog.
+        Puts a state from the undo history back into the list of ingredients.
         """
-        # Clear the list
-        self.ingredientsList.clear()
+        self.ingredientsModel.reset_items(thaw_ingredients(state))
+        self.deleteIngredientButton.setEnabled(False)
+        self.toggle_history_buttons()
+
+    def undo(self):
+        """Undoes the last change made to the list of ingredients."""
+        self.restore_state(self.history.undo())
 
-        for ingredient in self.ingredients:
-            self.ingredientsList.addItem(ingredient['name'] + ': ' + 
-                    str(ingredient['quantity']) + ' ' +  ingredient['unit'])
+    def redo(self):
+        """Redoes the last change that was undone."""
+        self.restore_state(self.history.redo())
 
     def add_ingredient(self):
         """
@@ -147,8 +300,23 @@ class IngredientsWindow(QDialog):
         ingredient = ingredientEditDialog.get_ingredient()
         if not (ingredient['name'] == '' or ingredient['quantity'] == 0.0 or
                 ingredient['unit'] == ''):
-                    self.ingredients.append(ingredient)
-                    self.initialize_list()
+                    self.ingredientsModel.append_item(ingredient)
+                    self.record_change('Add ingredient')
+
+    def paste_ingredients(self):
+        """
+        Adds the ingredients the user pastes in as text, a line each.
+        """
+        pasteDialog = IngredientPaste(self)
+        if not pasteDialog.exec_():
+            return
+
+        ingredients = pasteDialog.get_ingredients()
+        for ingredient in ingredients:
+            self.ingredientsModel.append_item(ingredient)
+        if ingredients:
+            # All of them are undone at once
+            self.record_change('Paste ingredients')
 
     def edit_ingredient(self):
         """
@@ -156,16 +324,17 @@ class IngredientsWindow(QDialog):
         ingredients.
         """
         # Get the index of the ingredient selected
-        index = self.ingredientsList.currentRow()
+        index = self.ingredientsList.current_row()
 
-        # Create an editing dialog and pass the selected ingredient to it
-        ingredientEditDialog = IngredientEdit(self, self.ingredients[index])
+        # Create an editing dialog and pass a copy of the selected ingredient
+        # to it, since the dialog modifies the ingredient it is given
+        ingredientEditDialog = IngredientEdit(self,
+                copy_ingredient(self.ingredients[index]))
         ingredientEditDialog.exec_() # execute the dialog
         # Retreive the edited ingredient from the dialog
-        self.ingredients[index] = ingredientEditDialog.get_ingredient()
-
-        # Reinitialize the list
-        self.initialize_list()
+        self.ingredientsModel.set_item(index,
+                ingredientEditDialog.get_ingredient())
+        self.record_change('Edit ingredient')
 
         # Disable the edit and delete ingredient buttons again to "fool" the
         # user that their selection was reset
@@ -177,22 +346,29 @@ class IngredientsWindow(QDialog):
         list of ingredients.
         """
         # Get the index of the selected ingredient
-        index = self.ingredientsList.currentRow()
+        index = self.ingredientsList.current_row()
 
-        # Remove the ingredient from the list of ingredients
-        self.ingredients.pop(index)
-        # Refresh the visible list of ingredients
-        self.initialize_list()
+        # Remove the ingredient from both lists of ingredients
+        self.ingredientsModel.remove_item(index)
+        self.record_change('Delete ingredient')
 
         # Disable the edit and delete ingredient buttons again to "fool" the
         # user that their selection was reset
         self.deleteIngredientButton.setEnabled(False)
 
+    def reorder_ingredients(self):
+        """
+        Called after ingredients have been dragged around in the visible
+        list.
+        """
+        self.record_change('Reorder ingredients')
+
     def submit(self):
         """
-        Closes the dialog graciously.
+        Closes the dialog graciously, keeping the changes made.
         """
-        self.done(1)        
+        self.saved = True
+        self.done(1)
 
     def __init__(self, parent, ingredients):
         """
@@ -206,16 +382,21 @@ class IngredientsWindow(QDialog):
         self.mainLayout = QVBoxLayout()
         self.buttonLayout = QHBoxLayout()
 
-        # The listwidget of ingredients
-        self.ingredientsList = QListWidget()
+        # The list of ingredients
+        self.ingredientsList = ReorderableList()
         self.ingredientsList.setToolTip("Double click on an ingredient " +
-                "to edit it.")
+                "to edit it. Drag ingredients around to reorder them.")
         
         # Add ingredient button
         self.addIngredientButton = QPushButton("Add")
         self.addIngredientButton.setToolTip("Add an ingredient for this " +
                 "recipe")
 
+        # Paste ingredients button
+        self.pasteIngredientsButton = QPushButton("Paste")
+        self.pasteIngredientsButton.setToolTip("Add many ingredients at " +
+                "once by pasting them in, one a line")
+
         # Delete ingredient button
         self.deleteIngredientButton = QPushButton("Delete")
         self.deleteIngredientButton.setToolTip("Delete the selected " +
@@ -223,6 +404,13 @@ class IngredientsWindow(QDialog):
         # Give it properties similar to the edit ingredient button
         self.deleteIngredientButton.setEnabled(False)
 
+        # Undo and redo buttons
+        self.undoButton = QPushButton("Undo")
+        self.undoButton.setToolTip("Undoes the last change made to the " +
+                "ingredients")
+        self.redoButton = QPushButton("Redo")
+        self.redoButton.setToolTip("Redoes the last change that was undone")
+
         # Save changes button
         self.saveChangesButton = QPushButton("Save Changes")
         self.saveChangesButton.setToolTip("Saves all changes made and " +
@@ -234,23 +422,39 @@ class IngredientsWindow(QDialog):
         self.mainLayout.addWidget(self.ingredientsList)
         self.mainLayout.addLayout(self.buttonLayout)
         self.buttonLayout.addWidget(self.addIngredientButton)
+        self.buttonLayout.addWidget(self.pasteIngredientsButton)
         self.buttonLayout.addWidget(self.deleteIngredientButton)
+        self.buttonLayout.addWidget(self.undoButton)
+        self.buttonLayout.addWidget(self.redoButton)
         self.mainLayout.addWidget(self.saveChangesButton)
 
         # Initialize the button signals
         self.addIngredientButton.clicked.connect(self.add_ingredient)
+        self.pasteIngredientsButton.clicked.connect(self.paste_ingredients)
         self.saveChangesButton.clicked.connect(self.submit)
         # For editing ingredients
         self.ingredientsList.doubleClicked.connect(self.edit_ingredient)
         # For deleting ingredients
         self.deleteIngredientButton.clicked.connect(self.delete_ingredient)
+        # For undoing and redoing changes
+        self.undoButton.clicked.connect(self.undo)
+        self.redoButton.clicked.connect(self.redo)
         # Enable the edit and delete ingredient buttons once an item has been
         # clicked or selected in the visible list
-        self.ingredientsList.itemClicked.connect(self.enable_buttons)
+        self.ingredientsList.clicked.connect(self.enable_buttons)
+        # For reordering ingredients by dragging them around
+        self.ingredientsList.rowsDropped.connect(self.reorder_ingredients)
 
         # Set the ingredients in this window to the one that was passed by
-        # the parent window
-        self.ingredients = ingredients
-
-        # Initialize the list
-        self.initialize_list()
+        # the parent window. The list only gets copied once it is changed.
+        self.ingredients = CopyOnWriteList(ingredients, copy_ingredient)
+        # Whether the user saved their changes
+        self.saved = False
+
+        # The model that the visible list shows
+        self.ingredientsModel = IngredientListModel(self.ingredients, self)
+        self.ingredientsList.setModel(self.ingredientsModel)
+
+        # Start the undo history off with the ingredients we were given
+        self.history = UndoStack(freeze_ingredients(self.ingredients))
+        self.toggle_history_buttons()
@@ -14,6 +14,15 @@ from PySide.QtGui import *
 # Import the error message
 from errordialog import *
 
+# Undo/redo history import
+from models.history import *
+
+# Copy-on-write list import
+from models.draft import *
+
+# List model import
+from listmodels import *
+
 import sys
 
 class InstructionEdit(QDialog):
@@ -91,14 +100,19 @@ class InstructionEdit(QDialog):
 class InstructionsWindow(QDialog):
     def get_instructions(self):
         """
-        Returns the list of instructions inside this dialog.
+        Returns the list of instructions inside this dialog. If the user
+        closed the window without saving, the untouched list that was passed
+        in is returned.
         """
-        return self.instructions
+        if self.saved:
+            return self.instructions.to_list()
+        return self.instructions.base
 
     def submit(self):
         """
-        Closes the dialog graciously.
+        Closes the dialog graciously, keeping the changes made.
         """
+        self.saved = True
         self.done(1)
 
     def enable_buttons(self):
@@ -121,33 +135,58 @@ class InstructionsWindow(QDialog):
         self.moveUpButton.setEnabled(False)
         self.moveDownButton.setEnabled(False)
 
+    def toggle_history_buttons(self):
+        """
+        Enables or disables the Undo and Redo buttons depending on whether
+        there is anything to undo or redo.
+        """
+        self.undoButton.setEnabled(self.history.can_undo())
+        self.redoButton.setEnabled(self.history.can_redo())
+
+    def record_change(self, label):
+        """
+        Records the current list of instructions in the undo history. Called
+        after every change made to the list.
+        """
+        self.history.push(PersistentList.from_sequence(self.instructions,
+            self.history.current()), label)
+        self.toggle_history_buttons()
+
+    def restore_state(self, state):
+        """
+        Puts a state from the undo history back into the list of
+        instructions.
+        """
+        self.instructionsModel.reset_items(state.to_list())
+        self.disable_buttons()
+        self.toggle_history_buttons()
+
+    def undo(self):
+        """Undoes the last change made to the list of instructions."""
+        self.restore_state(self.history.undo())
+
+    def redo(self):
+        """Redoes the last change that was undone."""
+        self.restore_state(self.history.redo())
+
     def move_instruction_up(self):
         """
         Moves an instruction up both lists of instructions. If the instruction
         is the first instruction in the list, do not do anything.
         """
         # Get the index of the currently selected instruction.
-        index = self.instructionsList.currentRow()
+        index = self.instructionsList.current_row()
 
         if index == 0:
             # Item selected is first, don't do anything
             print 'Item is already at top!'
         else:
-            # Item can be moved up
-            # Store the instruction in a temporary variable first
-            instruction = self.instructions[index]
-            # Pop the last location of the instruction
-            self.instructions.pop(index)
-            # Put the instruction behind the item that was last behind it
-            self.instructions.insert(index - 1, instruction)
-            # Move the current row to the instruction's new position
-            self.instructionsList.setCurrentRow(index - 1)
-
-            # Reinitialize the list
-            self.initialize_list()
-
-            # Disable the buttons
-            self.disable_buttons()
+            # Item can be moved up, swap it with the item behind it
+            self.instructionsModel.move_item(index, index - 1)
+            # Move the current row to the instruction's new position, so it
+            # can be moved again right away
+            self.instructionsList.set_current_row(index - 1)
+            self.record_change('Move instruction up')
 
     def move_instruction_down(self):
         """
@@ -155,42 +194,25 @@ class InstructionsWindow(QDialog):
         is at the bottom of the list, do not do anything.
         """
         # Get the index of the currently selected instruction.
-        index = self.instructionsList.currentRow()
+        index = self.instructionsList.current_row()
 
-        if index == len(self.instructions):
+        if index == len(self.instructions) - 1:
             # Item selected is the last, don't do anything
             print 'Item is already at bottom!'
         else:
-            # Item can be moved down
-            # Store the instruction in a temporary variable first
-            instruction = self.instructions[index]
-            # Pop the last location of the instructon
-            self.instructions.pop(index)
-            # Put the instruction after the item that was last in front of it
-            self.instructions.insert(index + 1, instruction)
-            # Move the current row to the instruction's new position
-            self.instructionsList.setCurrentRow(index + 1)
-
-            # Reinitialize the list
-            self.initialize_list()
-
-            # Disable the edit and delete buttons
-            self.disable_buttons()
-
-    def initialize_list(self):
-        """
-        Initializes the listview of instructions by deleting everything then
-        putting everything back together based on the list of instructions
-        inside this dialog.
-        """
-        # Clear entire list
-        self.instructionsList.clear()
-        # Create a counter variable
-        counter = 1
-        # Put everything into the list
-        for instruction in self.instructions:
-            self.instructionsList.addItem(str(counter) + '. ' + instruction)
-            counter += 1 # increment counter
+            # Item can be moved down, swap it with the item in front of it
+            self.instructionsModel.move_item(index, index + 1)
+            # Move the current row to the instruction's new position, so it
+            # can be moved again right away
+            self.instructionsList.set_current_row(index + 1)
+            self.record_change('Move instruction down')
+
+    def reorder_instructions(self):
+        """
+        Called after instructions have been dragged around in the visible
+        list.
+        """
+        self.record_change('Reorder instructions')
 
     def add_instruction(self):
         """
@@ -202,10 +224,9 @@ class InstructionsWindow(QDialog):
         instruction = instructionEditDialog.get_instruction()
         if not instruction == '':
             # We have a proper non-empty instruction so let's move on
-            # Add the instruction to the list of instructions
-            self.instructions.append(instruction)
-            # Refresh the list
-            self.initialize_list()
+            # Add the instruction to both lists of instructions
+            self.instructionsModel.append_item(instruction)
+            self.record_change('Add instruction')
 
     def edit_instruction(self):
         """
@@ -213,16 +234,15 @@ class InstructionsWindow(QDialog):
         instructions.
         """
         # Get the index of the instruction selected
-        index = self.instructionsList.currentRow()
+        index = self.instructionsList.current_row()
 
         # Pass the selected instruction to an editing dialog
         instructionEditDialog = InstructionEdit(self, self.instructions[index])
         instructionEditDialog.exec_() # execute the dialog
         # Retreive the edited instruction from the dialog
-        self.instructions[index] = instructionEditDialog.get_instruction()
-
-        # Reinitialize the list
-        self.initialize_list()
+        self.instructionsModel.set_item(index,
+                instructionEditDialog.get_instruction())
+        self.record_change('Edit instruction')
 
         # Disable the edit and delete instruction buttons
         self.disable_buttons()
@@ -233,12 +253,11 @@ class InstructionsWindow(QDialog):
         the recipe nad the visible list of instructions.
         """
         # Get the index of the currently selected instruction.
-        index = self.instructionsList.currentRow()
+        index = self.instructionsList.current_row()
 
-        # Remove the instruction from the list of instructions
-        self.instructions.pop(index)
-        # Refresh the visible list of instructions
-        self.initialize_list()
+        # Remove the instruction from both lists of instructions
+        self.instructionsModel.remove_item(index)
+        self.record_change('Delete instruction')
 
         # Disable the edit and delete buttons again
         self.disable_buttons()
@@ -262,10 +281,10 @@ class InstructionsWindow(QDialog):
         # Layout for most of the buttons below
         self.buttonLayout = QHBoxLayout()
         
-        # The listwidget of instructions
-        self.instructionsList = QListWidget()
+        # The list of instructions
+        self.instructionsList = ReorderableList()
         self.instructionsList.setToolTip("Double click an instruction " +
-                "to edit it.")
+                "to edit it. Drag instructions around to reorder them.")
         # Make the list word wrap enabled
         self.instructionsList.setWordWrap(True)
 
@@ -284,10 +303,18 @@ class InstructionsWindow(QDialog):
         self.deleteInstructionButton.setToolTip("Delete the selected " +
                 "instruction")
 
+        # Undo and redo buttons
+        self.undoButton = QPushButton("Undo")
+        self.undoButton.setToolTip("Undoes the last change made to the " +
+                "instructions")
+        self.redoButton = QPushButton("Redo")
+        self.redoButton.setToolTip("Redoes the last change that was undone")
+
         # Save Changes button
         self.saveChangesButton = QPushButton("Save Changes")
         self.saveChangesButton.setToolTip("Saves all changes and returns " +
-                "to the recipe overview")
+                "to the recipe overview (close this window to just discard " +
+                "your changes)")
 
         # Arrange the UI elements into a layout
         self.setLayout(self.mainLayout)
@@ -299,12 +326,23 @@ class InstructionsWindow(QDialog):
         self.mainLayout.addLayout(self.buttonLayout)
         self.buttonLayout.addWidget(self.addInstructionButton)
         self.buttonLayout.addWidget(self.deleteInstructionButton)
+        self.buttonLayout.addWidget(self.undoButton)
+        self.buttonLayout.addWidget(self.redoButton)
         self.mainLayout.addWidget(self.saveChangesButton)
         
         # Set the instructions list in this window to the one that was passed
-        # by the parent window
-        self.instructions = instructions
-
+        # by the parent window. The list only gets copied once it is changed.
+        self.instructions = CopyOnWriteList(instructions)
+        # Whether the user saved their changes
+        self.saved = False
+
+        # The model that the visible list shows
+        self.instructionsModel = InstructionListModel(self.instructions, self)
+        self.instructionsList.setModel(self.instructionsModel)
+
+        # Start the undo history off with the instructions we were given
+        self.history = UndoStack(PersistentList.from_sequence(
+            self.instructions))
         # Connect the signals to appropriate functions
         self.addInstructionButton.clicked.connect(self.add_instruction)
         self.saveChangesButton.clicked.connect(self.submit)
@@ -315,11 +353,14 @@ class InstructionsWindow(QDialog):
         # Moving instructions in the list functions
         self.moveUpButton.clicked.connect(self.move_instruction_up)
         self.moveDownButton.clicked.connect(self.move_instruction_down)
+        # Undoing and redoing changes
+        self.undoButton.clicked.connect(self.undo)
+        self.redoButton.clicked.connect(self.redo)
+        self.toggle_history_buttons()
         # Disable the edit and delete buttons first so that the user will be
         # encouraged to select an item first
         self.disable_buttons()
         # Connect list to a function that enables them
-        self.instructionsList.itemClicked.connect(self.enable_buttons)
-
-        # Initialize the list of instructions
-        self.initialize_list()
+        self.instructionsList.clicked.connect(self.enable_buttons)
+        # Reordering instructions by dragging them around
+        self.instructionsList.rowsDropped.connect(self.reorder_instructions)
@@ -0,0 +1,324 @@
+###############################################################################
+#
+# instrumentation.py
+#
+# An opt-in latency instrumentation layer for the GUI. When it is enabled, the
+# slots of the main window and the refresh functions of the dialogs are
+# wrapped with timers that keep a latency histogram per action. The
+# histograms can be viewed in a debug panel or dumped into a JSON file.
+#
+# Nothing is wrapped unless enable_instrumentation() is called, so the
+# application runs exactly as before when instrumentation is disabled. Run
+# the application with the PYRECIPE_LATENCY environment variable set to a
+# file path to enable it, then press Ctrl+Shift+L in the main window to see
+# the debug panel.
+#
+# Time spent inside modal dialogs (waiting for the user to click something)
+# is not counted as latency of the action that opened the dialog.
+#
+###############################################################################
+
+import time
+
+from models import codec
+
+# PySide imports
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+class LatencyHistogram(object):
+    """
+    A histogram of the latencies of a single action, with buckets that grow
+    roughly exponentially. Also keeps the exact count, total, minimum and
+    maximum.
+    """
+    # The upper bounds of the buckets, in milliseconds. The last bucket takes
+    # everything slower than the last bound.
+    BOUNDS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0,
+            500.0, 1000.0, 2500.0, 5000.0]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, milliseconds):
+        """Adds a single latency to the histogram."""
+        bucket = 0
+        while (bucket < len(self.BOUNDS) and
+                milliseconds > self.BOUNDS[bucket]):
+            bucket += 1
+        self.counts[bucket] += 1
+
+        self.count += 1
+        self.total += milliseconds
+        if self.minimum is None or milliseconds < self.minimum:
+            self.minimum = milliseconds
+        if self.maximum is None or milliseconds > self.maximum:
+            self.maximum = milliseconds
+
+    def mean(self):
+        """Returns the mean latency."""
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def percentile(self, fraction):
+        """
+        Returns an estimate of the given percentile (0.5 for the median), as
+        the upper bound of the bucket it falls in.
+        """
+        if self.count == 0:
+            return None
+
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                if bucket < len(self.BOUNDS):
+                    return min(self.BOUNDS[bucket], self.maximum)
+                return self.maximum
+
+        return self.maximum
+
+    def to_dict(self):
+        """Returns the histogram as a JSON-friendly dictionary."""
+        buckets = []
+        for bucket, count in enumerate(self.counts):
+            if bucket < len(self.BOUNDS):
+                bound = self.BOUNDS[bucket]
+            else:
+                bound = None
+            buckets.append({'le_ms': bound, 'count': count})
+
+        return {'count': self.count, 'total_ms': self.total,
+                'mean_ms': self.mean(), 'min_ms': self.minimum,
+                'max_ms': self.maximum, 'p50_ms': self.percentile(0.5),
+                'p95_ms': self.percentile(0.95),
+                'p99_ms': self.percentile(0.99), 'buckets': buckets}
+
+
+class LatencyRecorder(object):
+    """
+    Keeps a LatencyHistogram per action, and makes the wrappers that time the
+    actions.
+    """
+    def __init__(self):
+        self.histograms = {}
+        # Total time spent inside modal dialogs so far, in seconds
+        self.modalTime = 0.0
+
+    def record(self, name, seconds):
+        """Records a single latency of the named action."""
+        if name not in self.histograms:
+            self.histograms[name] = LatencyHistogram()
+        self.histograms[name].add(seconds * 1000.0)
+
+    def timed(self, name, function):
+        """
+        Returns a wrapper around a method that records how long every call
+        takes, minus the time spent in modal dialogs during the call.
+        """
+        # Qt passes signal arguments along to slots that accept them, so only
+        # pass on as many arguments as the method takes
+        code = function.func_code
+        if code.co_flags & 0x04:
+            # The method takes *args, give it everything
+            argumentCount = None
+        else:
+            argumentCount = code.co_argcount - 1
+
+        recorder = self
+
+        def wrapper(self, *args):
+            if argumentCount is not None:
+                args = args[:argumentCount]
+
+            start = time.time()
+            modalStart = recorder.modalTime
+            try:
+                return function(self, *args)
+            finally:
+                elapsed = time.time() - start
+                recorder.record(name, elapsed -
+                        (recorder.modalTime - modalStart))
+
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+
+    def modal(self, function):
+        """
+        Returns a wrapper around a dialog's exec_() that adds the time spent
+        in the dialog to the total modal time. Dialogs opened from inside the
+        dialog are only counted once.
+        """
+        recorder = self
+
+        def wrapper(self, *args):
+            start = time.time()
+            modalStart = recorder.modalTime
+            try:
+                return function(self, *args)
+            finally:
+                elapsed = time.time() - start
+                nested = recorder.modalTime - modalStart
+                recorder.modalTime += elapsed - nested
+
+        return wrapper
+
+    def summary(self):
+        """Returns every histogram as a JSON-friendly dictionary."""
+        summary = {}
+        for name, histogram in self.histograms.items():
+            summary[name] = histogram.to_dict()
+        return summary
+
+    def dump(self, path):
+        """Writes every histogram into a JSON file."""
+        file = open(path, 'w')
+        file.write(codec.dumps({'generated': time.strftime(
+            '%Y-%m-%dT%H:%M:%S'), 'actions': self.summary()}, indent=2,
+            sort_keys=True))
+        file.close()
+        print 'Latency histograms written to ' + path
+
+
+def instrument_class(recorder, cls, names):
+    """
+    Replaces the named methods of a class with timed wrappers. Actions are
+    named after the class and the method.
+    """
+    for name in names:
+        function = cls.__dict__[name]
+        setattr(cls, name, recorder.timed(cls.__name__ + '.' + name,
+            function))
+
+def instrument_modal(recorder, cls):
+    """Wraps the exec_() of a dialog class so its time is not counted."""
+    try:
+        cls.exec_ = recorder.modal(cls.exec_)
+    except (AttributeError, TypeError):
+        # Some of the classes coming from Qt itself can't be patched
+        print 'Could not instrument ' + cls.__name__ + '.exec_'
+
+
+class LatencyPanel(QDialog):
+    """
+    A debug panel that shows the latency histograms of every action recorded
+    so far.
+    """
+    # The columns of the table
+    COLUMNS = ['Action', 'Count', 'Mean (ms)', 'p50 (ms)', 'p95 (ms)',
+            'Max (ms)']
+
+    def refresh_data(self):
+        """Refreshes the table with the latest numbers."""
+        summary = self.recorder.summary()
+        names = sorted(summary.keys())
+
+        self.table.setRowCount(len(names))
+        for row, name in enumerate(names):
+            action = summary[name]
+            values = [name, str(action['count'])]
+            for key in ['mean_ms', 'p50_ms', 'p95_ms', 'max_ms']:
+                values.append('%.2f' % action[key])
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+
+        self.table.resizeColumnsToContents()
+
+    def save(self):
+        """Dumps the histograms into the JSON file."""
+        self.recorder.dump(self.path)
+
+    def __init__(self, parent, recorder, path):
+        super(LatencyPanel, self).__init__(parent)
+        self.setWindowTitle("Action Latencies")
+
+        self.recorder = recorder
+        self.path = path
+
+        # Creation
+        self.mainLayout = QVBoxLayout()
+        self.buttonLayout = QHBoxLayout()
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.refreshButton = QPushButton("Refresh")
+        self.saveButton = QPushButton("Save to " + path)
+
+        # Layouting
+        self.setLayout(self.mainLayout)
+        self.mainLayout.addWidget(self.table)
+        self.mainLayout.addLayout(self.buttonLayout)
+        self.buttonLayout.addWidget(self.refreshButton)
+        self.buttonLayout.addWidget(self.saveButton)
+
+        # Signals
+        self.refreshButton.clicked.connect(self.refresh_data)
+        self.saveButton.clicked.connect(self.save)
+
+        self.refresh_data()
+
+
+def enable_instrumentation():
+    """
+    Wraps the main window slots and the dialog refreshes with timers, and
+    returns the recorder that keeps their latencies. Has to be called before
+    the main window is created, since the signals are connected to the
+    methods when the windows are initialized.
+    """
+    # Imported here so that the dialogs are only touched when enabled
+    from mainwindow import MainWindow
+    from recipe import RecipeOverview, AddRecipeWindow, EditRecipeWindow
+    from ingredients import IngredientsWindow, IngredientEdit
+    from instructions import InstructionsWindow, InstructionEdit
+    from shopping_list import ShoppingListDialog
+    from errordialog import ErrorDialog
+    from duplicates import DuplicatesDialog
+
+    recorder = LatencyRecorder()
+
+    instrument_class(recorder, MainWindow, ['add_recipe', 'import_recipe',
+        'export_recipe', 'open_recipe', 'refresh_list', 'delete_recipe',
+        'refresh_costs', 'merge_duplicates', 'sync_recipe_folder',
+        'import_archive', 'export_library', 'print_library',
+        'publish_library', 'sync_library', 'plan_cooking',
+        'manage_pantry'])
+    instrument_class(recorder, RecipeOverview, ['refresh_recipe_info',
+        'refresh_ingredients', 'refresh_instructions', 'refresh_nutrition',
+        'refresh_similar', 'refresh_image', 'undo', 'redo'])
+    instrument_class(recorder, EditRecipeWindow, ['refresh_data'])
+    instrument_class(recorder, IngredientEdit, ['refresh_suggestions'])
+    instrument_class(recorder, IngredientsWindow, ['add_ingredient',
+        'paste_ingredients', 'edit_ingredient', 'delete_ingredient', 'undo',
+        'redo'])
+    instrument_class(recorder, InstructionsWindow, ['add_instruction',
+        'edit_instruction', 'delete_instruction', 'move_instruction_up',
+        'move_instruction_down', 'undo', 'redo'])
+    instrument_class(recorder, ShoppingListDialog, ['initialize_list',
+        'mark_bought', 'mark_cooked'])
+
+    for dialog in [RecipeOverview, AddRecipeWindow, EditRecipeWindow,
+            IngredientsWindow, IngredientEdit, InstructionsWindow,
+            InstructionEdit, ShoppingListDialog, DuplicatesDialog, ErrorDialog,
+            QFileDialog, QMessageBox]:
+        instrument_modal(recorder, dialog)
+
+    return recorder
+
+def attach_panel(window, recorder, path):
+    """
+    Adds a Ctrl+Shift+L shortcut that opens the debug panel to the given
+    window, and dumps the histograms into the file when the app quits.
+    """
+    def show_panel():
+        panel = LatencyPanel(window, recorder, path)
+        panel.show()
+
+    window.latencyShortcut = QShortcut(QKeySequence("Ctrl+Shift+L"), window)
+    window.latencyShortcut.activated.connect(show_panel)
+
+    QApplication.instance().aboutToQuit.connect(lambda: recorder.dump(path))
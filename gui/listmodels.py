@@ -0,0 +1,217 @@
+###############################################################################
+#
+# listmodels.py
+#
+# Contains the list models used by the ingredients and instructions windows.
+# Instead of clearing and refilling a list widget after every change, the
+# windows edit their lists through these models, which tell the views exactly
+# which rows were inserted, removed, moved or changed.
+#
+###############################################################################
+
+# PySide imports
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+class RecipeListModel(QAbstractListModel):
+    """
+    The base class of the list models. Wraps a list of items (usually a
+    CopyOnWriteList) and turns every edit into the matching model signals.
+
+    Rows show their items as text; subclasses override format_item() to
+    show them some other way.
+    """
+    # Whether the rows display their position, in which case rows that get
+    # shifted around have to be redrawn
+    numbered = False
+
+    def __init__(self, items, parent=None):
+        super(RecipeListModel, self).__init__(parent)
+        self.items = items
+
+    def format_item(self, row, item):
+        """Returns the text displayed for an item: the item itself, as text."""
+        if isinstance(item, basestring):
+            return item
+        return str(item)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.items)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self.items):
+            return None
+        if role == Qt.DisplayRole:
+            return self.format_item(index.row(), self.items[index.row()])
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            # Dropping in between rows is allowed
+            return Qt.ItemIsDropEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def renumber(self, first, last):
+        """
+        Tells the views to redraw the rows from first to last, as their
+        numbering has changed. Does nothing for unnumbered lists.
+        """
+        if self.numbered and first <= last:
+            self.dataChanged.emit(self.index(first), self.index(last))
+
+    def append_item(self, item):
+        """Adds an item at the end of the list."""
+        row = len(self.items)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.items.append(item)
+        self.endInsertRows()
+
+    def set_item(self, row, item):
+        """Replaces the item in the given row."""
+        self.items[row] = item
+        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def remove_item(self, row):
+        """Removes the item in the given row and returns it."""
+        self.beginRemoveRows(QModelIndex(), row, row)
+        item = self.items.pop(row)
+        self.endRemoveRows()
+
+        # Everything below the removed row moved up by one
+        self.renumber(row, len(self.items) - 1)
+
+        return item
+
+    def move_item(self, source, target):
+        """
+        Moves the item in the source row so that it ends up in the target
+        row. Moving an item to a neighbouring row is a plain swap.
+        """
+        if source == target:
+            return
+
+        # Qt wants the row the item is put in front of, counted before the
+        # item is taken out
+        if target > source:
+            destinationChild = target + 1
+        else:
+            destinationChild = target
+
+        self.beginMoveRows(QModelIndex(), source, source, QModelIndex(),
+                destinationChild)
+        if abs(source - target) == 1:
+            self.items[source], self.items[target] = (self.items[target],
+                    self.items[source])
+        else:
+            self.items.insert(target, self.items.pop(source))
+        self.endMoveRows()
+
+        self.renumber(min(source, target), max(source, target))
+
+    def move_items(self, rows, destination):
+        """
+        Moves the items in the given rows, keeping their order, so that they
+        end up together in front of the item that was in the destination
+        row. Returns the rows the items ended up in.
+        """
+        above = sorted([row for row in rows if row < destination])
+        below = sorted([row for row in rows if row >= destination])
+
+        # The rows above the destination are moved starting from the one
+        # nearest to it, so that the rows still to be moved keep their
+        # positions
+        target = destination
+        for row in reversed(above):
+            target -= 1
+            self.move_item(row, target)
+        first = target
+
+        # The same goes for the rows below the destination
+        target = destination
+        for row in below:
+            self.move_item(row, target)
+            target += 1
+
+        return range(first, first + len(above) + len(below))
+
+    def reset_items(self, items):
+        """Replaces the entire contents of the list."""
+        self.beginResetModel()
+        self.items.replace(items)
+        self.endResetModel()
+
+
+class IngredientListModel(RecipeListModel):
+    """The list model of a recipe's ingredients."""
+    def format_item(self, row, ingredient):
+        return (ingredient['name'] + ': ' + str(ingredient['quantity']) +
+                ' ' + ingredient['unit'])
+
+
+class InstructionListModel(RecipeListModel):
+    """The list model of a recipe's instructions, numbered from 1."""
+    numbered = True
+
+    def format_item(self, row, instruction):
+        return str(row + 1) + '. ' + instruction
+
+
+class ReorderableList(QListView):
+    """
+    A list view whose rows can be reordered by dragging and dropping them,
+    several at a time. Meant to be used with a RecipeListModel.
+    """
+    # Emitted after rows have been moved by dragging them around
+    rowsDropped = Signal()
+
+    def __init__(self, parent=None):
+        super(ReorderableList, self).__init__(parent)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setDragEnabled(True)
+        self.setAcceptDrops(True)
+        self.setDropIndicatorShown(True)
+        self.setDragDropMode(QAbstractItemView.InternalMove)
+
+    def current_row(self):
+        """Returns the row of the current item, or -1 if there is none."""
+        return self.currentIndex().row()
+
+    def set_current_row(self, row):
+        """Makes the item in the given row the current item."""
+        self.setCurrentIndex(self.model().index(row))
+
+    def drop_row(self, position):
+        """Returns the row in front of which a drop at position would go."""
+        index = self.indexAt(position)
+        if not index.isValid():
+            return self.model().rowCount()
+        if self.dropIndicatorPosition() == QAbstractItemView.BelowItem:
+            return index.row() + 1
+        return index.row()
+
+    def dropEvent(self, event):
+        if event.source() is not self:
+            event.ignore()
+            return
+
+        rows = sorted(set([index.row() for index in self.selectedIndexes()]))
+        movedRows = self.model().move_items(rows, self.drop_row(event.pos()))
+
+        # Keep the moved rows selected
+        selection = QItemSelection()
+        for row in movedRows:
+            selection.select(self.model().index(row), self.model().index(row))
+        self.selectionModel().select(selection,
+                QItemSelectionModel.ClearAndSelect)
+
+        # The model already moved the rows itself, so make sure the drag does
+        # not go and remove the originals afterwards
+        event.setDropAction(Qt.CopyAction)
+        event.accept()
+
+        self.rowsDropped.emit()
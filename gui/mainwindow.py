@@ -8,7 +8,9 @@
 ###############################################################################
 
 import sys # for system calls we might need
-import simplejson as json # for JSON decoding and encoding
+import os # for checking files
+from models import codec # for JSON decoding and encoding
+from models.gcpause import gc_paused # for loading many recipes at once
 
 # Pyside imports
 from PySide.QtCore import *
@@ -26,8 +28,69 @@ from recipe import *
 # Generate shopping list dialog import
 from shopping_list import *
 
-# Qt App declaration
-app = QApplication(sys.argv)
+# Recipe costing import
+from models.costing import *
+
+# Ingredient name normalization import
+from models.normalize import *
+
+# Similar recipes index import
+from models.similarity import *
+
+# Streaming recipe file reading import
+from models.streaming import *
+
+# Recipe collection converters import
+from models.converters import *
+import csv # for errors in spreadsheets
+
+# Recipe archive import
+from models.archive import *
+
+# Recipe folder syncing import
+from models.recipefolder import *
+
+# Local HTTP API import
+from models.webapi import *
+
+# Static site publishing import
+from models.website import *
+
+# PDF binder printing import
+from models.binder import *
+
+# Library syncing import
+from models.librarysync import *
+import socket # for naming this machine's library in a shared folder
+
+# Duplicate recipe detection imports
+from models.dedup import *
+from duplicates import *
+
+# Cooking timeline dialog import
+from timeline import *
+
+# Pantry dialog import
+from pantry import *
+
+# How long the recipe folder has to stay quiet before it is scanned, in
+# milliseconds. Copying many files in changes it many times in a row
+FOLDER_SYNC_DELAY = 500
+
+# How often the progress of a binder being printed is checked, in milliseconds
+BINDER_POLL_INTERVAL = 100
+
+def scale_image(source, destination, width):
+    """
+    Makes the web version of a recipe image for the static site: no wider
+    than the given width. Returns whether it could be written.
+    """
+    image = QImage(source)
+    if image.isNull():
+        return False
+    if image.width() > width:
+        image = image.scaledToWidth(width, Qt.SmoothTransformation)
+    return image.save(destination)
 
 class MainWindow(QWidget):
     # The main window class, inherits QWidget
@@ -50,6 +113,368 @@ class MainWindow(QWidget):
         self.deleteRecipeButton.setEnabled(False)
         self.exportRecipeButton.setEnabled(False)
 
+    def recipe_sub_text(self, recipe):
+        """
+        Returns the sub-text of the shinylist item of a recipe: its course,
+        serving size and, if there is a price table, its cost.
+        """
+        text = (recipe.course + ', serves ' + str(recipe.servingSize) +
+                ' people')
+
+        engine = get_costing_engine()
+        if engine is not None:
+            cost = engine.compute(recipe)
+            text = (text + ', ' + format_money(cost.total, cost.currency) +
+                    ' (' + format_money(cost.per_serving()) + ' per serving)')
+            if not cost.is_complete():
+                text = text + '*'
+
+        return text
+
+    def refresh_costs(self):
+        """
+        Recomputes the costs of every recipe in one batch, then updates the
+        sub-text of every shinylist item. Called whenever the price table
+        changes.
+        """
+        engine = get_costing_engine()
+        if engine is None:
+            return
+
+        engine.recompute_library(self.recipes)
+
+        for index, recipe in enumerate(self.recipes):
+            self.shinyListItems[index].set_sub_text(
+                    self.recipe_sub_text(recipe))
+
+    def price_table_changed(self, path):
+        """
+        Called by the file watcher whenever the price table changes on disk.
+        """
+        # Editors that replace the file make the watcher forget about it
+        if path not in self.priceWatcher.files():
+            self.priceWatcher.addPath(path)
+
+        reload_prices(path)
+        self.refresh_costs()
+
+    def seed_ingredient_names(self):
+        """
+        Adds the foods of the nutrient and price tables to the vocabulary of
+        ingredient names, so they are suggested and merged into from the
+        start.
+        """
+        normalizer = get_normalizer()
+        for engine in [get_nutrition_engine(), get_costing_engine()]:
+            if engine is not None:
+                normalizer.add_names(engine.table.names)
+
+    def publish_library(self, changed=None):
+        """
+        Hands a fresh snapshot of the library to the HTTP API, if it is
+        running, and brings the static site up to date, if there is one. The
+        recipes that changed can be given, so that only those are
+        snapshotted and rendered again.
+        """
+        if self.libraryPublisher is not None:
+            self.libraryPublisher.publish(self.recipes, changed)
+
+        if self.siteBuilder is not None:
+            try:
+                written = self.siteBuilder.build(self.recipes, changed)
+            except (IOError, OSError), error:
+                print 'The static site could not be written: ' + str(error)
+            else:
+                if written:
+                    print (str(len(written)) + ' pages of the site written')
+
+        if self.syncIndex is not None:
+            self.syncIndex.refresh(self.recipes, changed)
+            if self.syncPublisher is not None:
+                self.syncPublisher.publish(self.syncIndex)
+
+    def publish_site(self, folder=DEFAULT_SITE_FOLDER):
+        """
+        Publishes the library as a static HTML site in a folder, and keeps
+        it up to date as recipes change.
+        """
+        self.siteBuilder = SiteBuilder(folder, scale_image)
+        self.publish_library()
+
+    def start_api_server(self, port=DEFAULT_PORT, host=DEFAULT_HOST):
+        """
+        Starts the local HTTP API that serves the library to other devices.
+        It runs in threads of its own, and is stopped when the app quits.
+        """
+        self.libraryPublisher = LibraryPublisher()
+        self.publish_library()
+
+        self.apiServer = LibraryServer(self.libraryPublisher, host, port)
+        self.apiServer.start()
+        QApplication.instance().aboutToQuit.connect(self.apiServer.stop)
+
+    def start_sync_server(self, port=DEFAULT_SYNC_PORT,
+            host=DEFAULT_SYNC_HOST):
+        """
+        Starts serving the library to other machines syncing with it, over
+        a socket. It runs in threads of its own, and is stopped when the app
+        quits.
+        """
+        self.syncPublisher = SyncPublisher()
+        self.syncPublisher.publish(self.library_index())
+
+        self.syncServer = SyncServer(self.syncPublisher, host, port)
+        self.syncServer.start()
+        QApplication.instance().aboutToQuit.connect(self.syncServer.stop)
+
+    def library_index(self):
+        """
+        Returns the Merkle tree index of the library, building it the first
+        time. From then on it is kept up to date as recipes change.
+        """
+        if self.syncIndex is None:
+            self.syncIndex = LibraryIndex()
+            self.syncIndex.refresh(self.recipes)
+        return self.syncIndex
+
+    def sync_library(self):
+        """
+        Syncs the library with other machines: with the one at
+        self.syncPeer over a socket if there is one, or else with every
+        library published in a shared folder the user picks, into which
+        this one is published too. Recipes changed on either side are
+        reported as conflicts and left alone.
+        """
+        index = self.library_index()
+        plans = []
+
+        if self.syncPeer is not None:
+            name = '%s:%d' % self.syncPeer
+            try:
+                peer = SocketPeer(*self.syncPeer)
+                try:
+                    plans.append((name, self.sync_with(index, peer, name)))
+                finally:
+                    peer.close()
+            except (IOError, ValueError), error:
+                QMessageBox.warning(self, "Sync Library",
+                        "Could not sync with " + name + ": " + str(error))
+                return
+        else:
+            folder = QFileDialog.getExistingDirectory(self,
+                    "Sync Library With Shared Folder")
+            if not folder:
+                return
+
+            own = socket.gethostname()
+            for name in sorted(os.listdir(folder)):
+                peer = SharedLibrary(os.path.join(folder, name))
+                if name == own or not peer.exists():
+                    continue
+                try:
+                    plans.append((name, self.sync_with(index, peer, name)))
+                except (IOError, OSError, ValueError), error:
+                    print 'Could not sync with ' + name + ': ' + str(error)
+
+            # Published last, so the others get what was pulled in too
+            try:
+                SharedLibrary(os.path.join(folder, own)).publish(index)
+            except (IOError, OSError), error:
+                QMessageBox.warning(self, "Sync Library",
+                        "The library could not be published: " + str(error))
+
+        # Tell the user what happened
+        lines = []
+        for name, plan in plans:
+            lines.append(name + ': ' + str(len(plan.pull)) + ' pulled, ' +
+                    str(len(plan.delete)) + ' deleted, ' +
+                    str(len(plan.conflicts)) + ' conflicts')
+            for key in plan.conflicts:
+                lines.append('    changed on both sides: ' + key)
+        if not lines:
+            lines.append('No other libraries to sync with were found.')
+        QMessageBox.information(self, "Sync Library", '\n'.join(lines))
+
+    def sync_with(self, index, peer, name):
+        """
+        Syncs the library with a peer: pulls in and deletes what the peer
+        changed since the last sync with it, and remembers what both sides
+        now agree on. Returns the SyncPlan that was carried out.
+        """
+        plan = prepare_sync(index, peer, name)
+        changed = []
+
+        for key, contentHash in plan.pull:
+            # Kept exactly as the peer sent it, so that it still has the
+            # content hash both sides now agree on
+            recipe = self.folder_recipe(codec.loads(
+                plan.documents[contentHash]), normalize=False)
+            changed.append(recipe)
+            old = index.recipes.get(key)
+
+            if old not in self.recipes:
+                self.append_recipe(recipe)
+                continue
+
+            position = self.recipes.index(old)
+            self.recipes[position] = recipe
+            self.similarIndex.remove(old)
+            self.similarIndex.add(recipe)
+            self.shinyListItems[position].set_main_text(recipe.name)
+            self.shinyListItems[position].set_sub_text(
+                    self.recipe_sub_text(recipe))
+
+        for key in plan.delete:
+            old = index.recipes.get(key)
+            if old in self.recipes:
+                position = self.recipes.index(old)
+                self.similarIndex.remove(self.recipes.pop(position))
+                self.shinyListItems.pop(position)
+
+        print (name + ': ' + str(len(plan.pull)) + ' recipes pulled, ' +
+                str(len(plan.delete)) + ' deleted and ' +
+                str(len(plan.conflicts)) + ' in conflict')
+
+        # Reinitialize the list
+        self.refresh_list()
+        self.disable_buttons()
+        self.publish_library(changed)
+
+        finish_sync(index, plan, name)
+        return plan
+
+    def append_recipe(self, recipe):
+        """
+        Adds a recipe to the end of the library, along with its shinylist
+        item.
+        """
+        # Create a shinylist item
+        item = ShinyListItem()
+
+        # Set the main and subtext of the shinylist item
+        item.set_main_text(recipe.name)
+        item.set_sub_text(self.recipe_sub_text(recipe))
+
+        # Add the item to the shinylist
+        self.recipeList.add_item(item)
+        # and to the list of shinylist items as well
+        self.shinyListItems.append(item)
+
+        # Add the recipe to the list of recipes
+        self.recipes.append(recipe)
+        self.similarIndex.add(recipe)
+
+    def folder_recipe(self, raw_recipe, normalize=True):
+        """
+        Makes a recipe out of a decoded recipe file of the recipe folder.
+        Its ingredient names are merged into the ones we know already,
+        unless normalize is False.
+        """
+        recipe = RecipeModel()
+        recipe.load_recipe(raw_recipe)
+        # The manifest keeps the decoded file, which must not be edited along
+        # with the recipe
+        recipe.ingredients = [dict(ingredient) for ingredient in
+                recipe.ingredients]
+        recipe.instructions = list(recipe.instructions)
+        recipe.images = list(recipe.images)
+
+        # Merge the ingredient names into the ones we know already
+        if normalize:
+            get_normalizer().normalize_ingredients(recipe.ingredients)
+        return recipe
+
+    def watch_folder(self, path=DEFAULT_RECIPE_FOLDER):
+        """
+        Keeps the library in sync with a folder of recipe files. The recipes
+        the folder had the last time come out of its manifest, then the
+        folder is scanned for the files that changed since, and watched for
+        more changes.
+        """
+        self.recipeFolder = RecipeFolder(path)
+
+        with gc_paused():
+            for name, raw_recipe in self.recipeFolder.recipes():
+                recipe = self.folder_recipe(raw_recipe)
+                self.folderRecipes[name] = recipe
+                self.append_recipe(recipe)
+        print (str(len(self.folderRecipes)) + ' recipes loaded from ' +
+                path)
+
+        self.sync_recipe_folder()
+        self.publish_library()
+
+        # Scan the folder again once it settles down after a change
+        self.folderTimer = QTimer(self)
+        self.folderTimer.setSingleShot(True)
+        self.folderTimer.setInterval(FOLDER_SYNC_DELAY)
+        self.folderTimer.timeout.connect(self.sync_recipe_folder)
+
+        self.folderWatcher = QFileSystemWatcher(self)
+        if os.path.isdir(path):
+            self.folderWatcher.addPath(path)
+        self.folderWatcher.directoryChanged.connect(
+                self.recipe_folder_changed)
+
+    def recipe_folder_changed(self, path):
+        """
+        Called by the file watcher whenever a file in the recipe folder is
+        added, deleted or replaced. Waits for the folder to settle down
+        before scanning it.
+        """
+        self.folderTimer.start()
+
+    def sync_recipe_folder(self):
+        """
+        Scans the recipe folder, and adds, updates or removes the recipes of
+        the files that were added, changed or deleted.
+        """
+        changes = self.recipeFolder.scan()
+        if not changes:
+            return
+
+        changed = []
+        for name, raw_recipe in changes.added:
+            recipe = self.folder_recipe(raw_recipe)
+            self.folderRecipes[name] = recipe
+            self.append_recipe(recipe)
+            changed.append(recipe)
+
+        for name, raw_recipe in changes.changed:
+            recipe = self.folder_recipe(raw_recipe)
+            old = self.folderRecipes.get(name)
+            self.folderRecipes[name] = recipe
+            changed.append(recipe)
+
+            if old not in self.recipes:
+                # The user deleted it from the library, but it changed since
+                self.append_recipe(recipe)
+                continue
+
+            index = self.recipes.index(old)
+            self.recipes[index] = recipe
+            self.similarIndex.remove(old)
+            self.similarIndex.add(recipe)
+            self.shinyListItems[index].set_main_text(recipe.name)
+            self.shinyListItems[index].set_sub_text(
+                    self.recipe_sub_text(recipe))
+
+        for name in changes.removed:
+            old = self.folderRecipes.pop(name, None)
+            if old in self.recipes:
+                index = self.recipes.index(old)
+                self.similarIndex.remove(self.recipes.pop(index))
+                self.shinyListItems.pop(index)
+
+        print (str(len(changes.added)) + ' recipes added, ' +
+                str(len(changes.changed)) + ' changed and ' +
+                str(len(changes.removed)) + ' removed from the recipe folder')
+
+        # Reinitialize the list
+        self.refresh_list()
+        self.disable_buttons()
+        self.publish_library(changed)
+
     def add_recipe(self):
         """
         Function that is called whenever the 'Add Recipe' button in the main
@@ -71,8 +496,7 @@ class MainWindow(QWidget):
 
             # Set shinylist text
             item.set_main_text(str(recipe.name))
-            item.set_sub_text(recipe.course + ', serves ' +
-                              str(recipe.servingSize) + ' people')
+            item.set_sub_text(self.recipe_sub_text(recipe))
 
             # Add the item to the shinylist
             self.recipeList.add_item(item)
@@ -83,18 +507,23 @@ class MainWindow(QWidget):
 
             # Add the recipe to the list of recipes
             self.recipes.append(recipe)
+            self.similarIndex.add(recipe)
+            self.publish_library([recipe])
 
     def import_recipe(self):
         """
         Imports a recipe file (.rcpe) from a directory in the user's filesystem
-        and then adds it to the current list of recipes.
+        and then adds it to the current list of recipes. Library exports
+        (JSON lists of recipes) and recipe archives (.rcpa) add every recipe
+        they have, and so do collections of recipes in other formats (CSV,
+        Markdown, plain text), which are converted as they are read.
         """
-        # Create a recipe object
-        recipe = RecipeModel()
         # Invoke a filedialog that will look for the .rcpe file
         fileDialog = QFileDialog(self, "Import Recipe", "./recipes/")
         fileDialog.setFileMode(QFileDialog.ExistingFile)
-        fileDialog.setNameFilter("Recipe File(*.rcpe)")
+        fileDialog.setNameFilter("Recipe File(*.rcpe);;" +
+                "Recipe Archive(*.rcpa);;Recipe Library(*.json);;" +
+                name_filter())
         
         # An empty file location
         file = None
@@ -103,33 +532,83 @@ class MainWindow(QWidget):
             filePath = fileDialog.selectedFiles()
             print filePath
 
-        if (filePath):
+        if filePath and filePath[0].endswith('.rcpa'):
+            # A whole archive of recipes
+            self.import_archive(filePath[0])
+        elif (filePath):
             # There is a file, so let's continue on
             # Read from the filepath
-            file = open(filePath[0], 'r')
-
-            # Load the file into the recipe
-            recipe.import_recipe(file.read())
-
-            # Create a shinylist item
-            item = ShinyListItem()
-
-            # Set the main and subtext of the shinylist item
-            item.set_main_text(recipe.name)
-            item.set_sub_text(recipe.course + ', serves ' +
-                              str(recipe.servingSize) + ' people')
-
-            # Add the item to the shinylist
-            self.recipeList.add_item(item)
-            # and to the list of shinylist items as well
-            self.shinyListItems.append(item)
-
-            # Add the recipe to the list of recipes
-            self.recipes.append(recipe)
+            file = open(filePath[0], 'rb')
+
+            # Collections in other formats are converted by worker
+            # processes as they are read
+            try:
+                source = iter_converted(file, converter_for(filePath[0]))
+            except ValueError:
+                source = iter_recipes(file)
+
+            # Load the recipes of the file one at a time, so that even huge
+            # library exports never have to fit in memory all at once
+            recipes = []
+            merged = 0
+            try:
+                for recipe in source:
+                    # Merge the ingredient names into the ones we know
+                    # already
+                    merged += get_normalizer().normalize_ingredients(
+                            recipe.ingredients)
+
+                    # Add the recipe and its shinylist item to the library
+                    self.append_recipe(recipe)
+                    recipes.append(recipe)
+            except (ValueError, KeyError, csv.Error), error:
+                QMessageBox.warning(self, "Import Recipe",
+                        "The recipe file could not be read past recipe " +
+                        str(len(recipes)) + ": " + str(error))
+            print str(merged) + ' ingredient names merged'
+
+            self.publish_library(recipes)
 
             # Close the file
             file.close()
 
+    def import_archive(self, path):
+        """
+        Adds every recipe of a recipe archive (.rcpa) to the library.
+        """
+        try:
+            recipes = read_archive(path)
+        except (IOError, ValueError), error:
+            QMessageBox.warning(self, "Import Recipe Archive",
+                    "The recipe archive could not be read: " + str(error))
+            return
+
+        normalizer = get_normalizer()
+        for recipe in recipes:
+            normalizer.normalize_ingredients(recipe.ingredients)
+            self.append_recipe(recipe)
+        print str(len(recipes)) + ' recipes imported from ' + path
+
+        self.publish_library(recipes)
+
+    def export_library(self):
+        """
+        Exports every recipe in the library into a single compressed recipe
+        archive (.rcpa).
+        """
+        # Create a filedialog for saving the file
+        fileDialog = QFileDialog(self, "Export Recipe Archive", "./recipes/")
+        fileDialog.setAcceptMode(QFileDialog.AcceptSave)
+        fileDialog.setFileMode(QFileDialog.AnyFile)
+        fileDialog.setNameFilter("Recipe Archive(*.rcpa)")
+        fileDialog.setDefaultSuffix("rcpa")
+
+        if fileDialog.exec_():
+            filePath = fileDialog.selectedFiles()[0]
+            write_archive(filePath, self.recipes)
+            print (str(len(self.recipes)) + ' recipes exported to ' +
+                    filePath)
+
     def export_recipe(self):
         """
         Exports the selected recipe in the list as a recipe file (.rcpe).
@@ -175,6 +654,13 @@ class MainWindow(QWidget):
             print file.read()
             file.close()
 
+            # Don't import the file again when the recipe folder is scanned
+            if (self.recipeFolder is not None and
+                    self.recipeFolder.contains(filePath[0])):
+                self.recipeFolder.track(filePath[0],
+                        codec.loads(json_recipe))
+                self.folderRecipes[os.path.basename(filePath[0])] = recipe
+
     def open_recipe(self):
         """
         Opens up a concise and detailed dialog containing essential
@@ -187,18 +673,19 @@ class MainWindow(QWidget):
         recipe = self.recipes[index]
 
         # Create a recipe overview dialog, pass the recipe to it
-        recipeDialog = RecipeOverview(self, recipe)
+        recipeDialog = RecipeOverview(self, recipe, self.similarIndex)
         # Execute that dialog
         recipeDialog.exec_()
 
         # Get the recipe from the dialog
         recipe = recipeDialog.get_recipe()
         self.recipes[index] = recipe
+        self.similarIndex.update(recipe)
+        self.publish_library([recipe])
 
         # Update the shinylist item the recipe is referred to
         self.shinyListItems[index].set_main_text(recipe.name)
-        self.shinyListItems[index].set_sub_text(recipe.course + ', serves ' +
-                str(recipe.servingSize) + ' people')
+        self.shinyListItems[index].set_sub_text(self.recipe_sub_text(recipe))
 
         # Refresh the list of recipes
         self.refresh_list()
@@ -225,7 +712,8 @@ class MainWindow(QWidget):
         recipeIndex = (self.recipeList.currentIndex()).row()
 
         # Delete that recipe from the list of recipes (non-visible list)
-        self.recipes.pop(recipeIndex)
+        self.similarIndex.remove(self.recipes.pop(recipeIndex))
+        self.publish_library([])
 
         # Delete that recipe from the list of recipes (shinylist)
         self.shinyListItems.pop(recipeIndex)
@@ -236,6 +724,106 @@ class MainWindow(QWidget):
         # Disable the buttons that have to be disabled
         self.disable_buttons()
 
+    def merge_duplicates(self):
+        """
+        Looks for near-duplicate recipes in the library, and lets the user
+        merge them in a dialog. The recipes the user merged away are deleted.
+        """
+        pairs = find_duplicates(self.recipes)
+        print str(len(pairs)) + ' pairs of duplicates found'
+
+        if not pairs:
+            QMessageBox.information(self, "Duplicate Recipes",
+                    "No duplicate recipes were found.")
+            return
+
+        duplicatesDialog = DuplicatesDialog(self, self.recipes, pairs)
+        duplicatesDialog.exec_()
+
+        # Delete the merged recipes, from the last to the first so the
+        # indexes stay valid
+        for index in duplicatesDialog.get_removed():
+            self.similarIndex.remove(self.recipes.pop(index))
+            self.shinyListItems.pop(index)
+
+        # Reinitialize the list
+        self.refresh_list()
+        self.disable_buttons()
+        self.publish_library([])
+
+    def plan_cooking(self):
+        """
+        Opens the dialog that plans cooking several recipes at once, with
+        the selected recipe ticked.
+        """
+        selected = (self.recipeList.currentIndex()).row()
+        timelineDialog = TimelineDialog(self, self.recipes, selected)
+        timelineDialog.exec_()
+
+    def manage_pantry(self):
+        """
+        Opens the dialog that shows and edits the ingredients on hand, which
+        shopping lists leave out.
+        """
+        pantryDialog = PantryDialog(self, get_pantry())
+        pantryDialog.exec_()
+
+    def print_library(self):
+        """
+        Prints every recipe in the library, with a shopping list of all of
+        them less what is in the pantry, into a PDF binder. The binder is
+        written in the background, with a progress dialog the user can
+        cancel it from.
+        """
+        # Create a filedialog for saving the file
+        fileDialog = QFileDialog(self, "Print Recipe Binder", "./recipes/")
+        fileDialog.setAcceptMode(QFileDialog.AcceptSave)
+        fileDialog.setFileMode(QFileDialog.AnyFile)
+        fileDialog.setNameFilter("PDF Document(*.pdf)")
+        fileDialog.setDefaultSuffix("pdf")
+
+        if not fileDialog.exec_():
+            return
+
+        self.binderJob = BinderJob(fileDialog.selectedFiles()[0],
+                self.recipes, pantry=get_pantry())
+        self.binderJob.start()
+        # One binder at a time
+        self.printButton.setEnabled(False)
+
+        self.binderProgress = QProgressDialog("Printing recipes...",
+                "Cancel", 0, max(self.binderJob.total, 1), self)
+        self.binderProgress.setWindowTitle("Print Recipe Binder")
+        self.binderProgress.canceled.connect(self.binderJob.cancel)
+        self.binderProgress.show()
+
+        # Follow the job until it is done
+        self.binderTimer = QTimer(self)
+        self.binderTimer.setInterval(BINDER_POLL_INTERVAL)
+        self.binderTimer.timeout.connect(self.binder_progress)
+        self.binderTimer.start()
+
+    def binder_progress(self):
+        """
+        Called by the binder timer to show how far the binder has come, and
+        to close the progress dialog once it is done.
+        """
+        job = self.binderJob
+        if not job.finished:
+            self.binderProgress.setValue(job.done)
+            return
+
+        self.binderTimer.stop()
+        self.binderProgress.reset()
+        self.printButton.setEnabled(True)
+
+        if job.error is not None:
+            QMessageBox.warning(self, "Print Recipe Binder",
+                    "The binder could not be written: " + str(job.error))
+        elif not job.cancelled:
+            print str(job.pages) + ' pages printed to ' + job.path
+        self.binderJob = None
+
     def init_ui(self):
         """
         Function that initializes the UI components of the app.
@@ -267,12 +855,42 @@ class MainWindow(QWidget):
         self.importRecipeButton = QPushButton("Import", self)
         # Tooltip for import recipe
         self.importRecipeButton.setToolTip("Loads a .rcpe recipe " +
-                "file from your filesystem.")
+                "file or a .rcpa recipe archive from your filesystem.")
         # Export Recipe button
         self.exportRecipeButton = QPushButton("Export", self)
         # Tooltip for export recipe
         self.exportRecipeButton.setToolTip("Saves the selected " +
                 "recipe to a .rcpe recipe file on your filesystem.")
+        # Export library button
+        self.archiveButton = QPushButton("Archive", self)
+        # Tooltip for export library
+        self.archiveButton.setToolTip("Saves every recipe to a " +
+                "compressed .rcpa recipe archive on your filesystem.")
+        # Print binder button
+        self.printButton = QPushButton("Print", self)
+        # Tooltip for print binder
+        self.printButton.setToolTip("Prints every recipe, with a " +
+                "shopping list of all of them, into a PDF binder.")
+        # Merge duplicates button
+        self.duplicatesButton = QPushButton("Duplicates", self)
+        # Tooltip for merge duplicates
+        self.duplicatesButton.setToolTip("Finds recipes that are " +
+                "near-duplicates of each other and lets you merge them.")
+        # Plan cooking button
+        self.planButton = QPushButton("Plan", self)
+        # Tooltip for plan cooking
+        self.planButton.setToolTip("Plans when to do every step of " +
+                "several recipes cooked at the same time.")
+        # Sync library button
+        self.syncButton = QPushButton("Sync", self)
+        # Tooltip for sync library
+        self.syncButton.setToolTip("Syncs the library with the ones of " +
+                "other machines, through a shared folder.")
+        # Pantry button
+        self.pantryButton = QPushButton("Pantry", self)
+        # Tooltip for pantry
+        self.pantryButton.setToolTip("Keeps track of the ingredients on " +
+                "hand, which shopping lists leave out.")
 
         # Disable the edit, delete, generate shopping list and export recipe
         # buttons because no recipe has been selected yet
@@ -293,6 +911,12 @@ class MainWindow(QWidget):
         self.buttonLayout.addWidget(self.deleteRecipeButton)
         self.buttonLayout.addWidget(self.importRecipeButton)
         self.buttonLayout.addWidget(self.exportRecipeButton)
+        self.buttonLayout.addWidget(self.archiveButton)
+        self.buttonLayout.addWidget(self.printButton)
+        self.buttonLayout.addWidget(self.duplicatesButton)
+        self.buttonLayout.addWidget(self.planButton)
+        self.buttonLayout.addWidget(self.syncButton)
+        self.buttonLayout.addWidget(self.pantryButton)
         
         # Initialize the buttons signals and slots
         self.addRecipeButton.clicked.connect(self.add_recipe)
@@ -306,6 +930,18 @@ class MainWindow(QWidget):
         self.importRecipeButton.clicked.connect(self.import_recipe)
         # Signal to export a recipe
         self.exportRecipeButton.clicked.connect(self.export_recipe)
+        # Signal to export the whole library
+        self.archiveButton.clicked.connect(self.export_library)
+        # Signal to print the whole library
+        self.printButton.clicked.connect(self.print_library)
+        # Signal to merge duplicate recipes
+        self.duplicatesButton.clicked.connect(self.merge_duplicates)
+        # Signal to plan cooking several recipes
+        self.planButton.clicked.connect(self.plan_cooking)
+        # Signal to sync the library with other machines
+        self.syncButton.clicked.connect(self.sync_library)
+        # Signal to manage the pantry
+        self.pantryButton.clicked.connect(self.manage_pantry)
 
         # Set the window title
         self.setWindowTitle("PyRecipe-4-U")
@@ -329,5 +965,32 @@ class MainWindow(QWidget):
 
         # Create list of recipes
         self.recipes = []
+        # Index of the recipes, for finding the ones similar to each other
+        self.similarIndex = SimilarityIndex()
+        # Hands snapshots of the library to the HTTP API, once it is started
+        self.libraryPublisher = None
+        # The folder of recipe files the library is kept in sync with, and
+        # the recipe of every file in it by file name
+        self.recipeFolder = None
+        self.folderRecipes = {}
+        # Keeps the static site up to date, once it is published
+        self.siteBuilder = None
+        # The binder being printed in the background, if any
+        self.binderJob = None
+        # The Merkle tree index of the library, built the first time the
+        # library is synced or served, and what hands it to the sync server
+        self.syncIndex = None
+        self.syncPublisher = None
+        # The (host, port) of the machine to sync with over a socket, if
+        # not through a shared folder
+        self.syncPeer = None
         # Create a list of shinylist items
         self.shinyListItems = []
+
+        # Watch the price table, so that costs are recomputed when it changes
+        self.priceWatcher = QFileSystemWatcher(self)
+        if os.path.exists(DEFAULT_PRICE_TABLE_PATH):
+            self.priceWatcher.addPath(DEFAULT_PRICE_TABLE_PATH)
+        self.priceWatcher.fileChanged.connect(self.price_table_changed)
+
+        self.seed_ingredient_names()
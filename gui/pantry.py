@@ -0,0 +1,134 @@
+###############################################################################
+#
+# pantry.py
+#
+# The dialog that shows and edits the pantry: the ingredients on hand, which
+# shopping lists leave out. Ingredients are added as text, a line each, the
+# way they are pasted into recipes.
+#
+###############################################################################
+
+# PySide imports
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+# Pantry import
+from models.pantry import *
+
+# Kitchen fraction formatting import
+from models.quantity import format_amount
+
+# Ingredient pasting dialog import
+from ingredients import IngredientPaste
+
+class PantryDialog(QDialog):
+    """
+    Dialog that lists what is in the pantry, and lets the user add
+    ingredients to it, use them up or remove them.
+    """
+    def refresh_list(self):
+        """Shows what is in the pantry again, after it changed."""
+        self.itemsList.clear()
+        self.listing = self.pantry.listing()
+        for name, quantity, unit in self.listing:
+            self.itemsList.addItem(name + " - (" +
+                    format_amount(quantity, unit) + ")")
+        self.removeButton.setEnabled(False)
+
+    def enable_buttons(self):
+        """Enables the Remove button once items are selected."""
+        self.removeButton.setEnabled(bool(self.itemsList.selectedItems()))
+
+    def selected_items(self):
+        """Returns the selected items, as (name, quantity, unit)."""
+        return [self.listing[self.itemsList.row(item)] for item in
+                self.itemsList.selectedItems()]
+
+    def paste_items(self, title, tooltip, items=[]):
+        """
+        Asks for ingredients as text, a line each, starting with the given
+        items. Returns them as (name, quantity, unit), or an empty list if
+        the user cancelled.
+        """
+        pasteDialog = IngredientPaste(self)
+        pasteDialog.setWindowTitle(title)
+        pasteDialog.addButton.setToolTip(tooltip)
+        pasteDialog.textData.setPlainText('\n'.join([format_amount(quantity,
+            unit) + ' ' + name for name, quantity, unit in items]))
+        if not pasteDialog.exec_():
+            return []
+        return [(ingredient['name'], ingredient['quantity'],
+            ingredient['unit']) for ingredient in
+            pasteDialog.get_ingredients()]
+
+    def add_items(self):
+        """Adds the ingredients the user types in to the pantry."""
+        items = self.paste_items("Add to Pantry",
+                "Adds these ingredients to the pantry")
+        if items:
+            self.pantry.add(items)
+            self.refresh_list()
+
+    def use_items(self):
+        """
+        Takes the ingredients the user types in out of the pantry. The
+        selected items are filled in to start with.
+        """
+        items = self.paste_items("Use from Pantry",
+                "Takes these ingredients out of the pantry",
+                self.selected_items())
+        if items:
+            self.pantry.take(items)
+            self.refresh_list()
+
+    def remove_items(self):
+        """Removes the selected items from the pantry altogether."""
+        self.pantry.discard(self.selected_items())
+        self.refresh_list()
+
+    def __init__(self, parent, pantry):
+        """Initializes the dialog with the pantry to show and edit."""
+        super(PantryDialog, self).__init__(parent)
+
+        self.pantry = pantry
+        self.listing = []
+
+        self.setWindowTitle("Pantry")
+
+        # Creation
+        self.mainLayout = QVBoxLayout()
+        self.buttonLayout = QHBoxLayout()
+
+        self.itemsList = QListWidget()
+        self.itemsList.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.itemsList.setToolTip("What is on hand. Shopping lists leave " +
+                "it out")
+
+        self.addButton = QPushButton("Add...")
+        self.addButton.setToolTip("Adds ingredients to the pantry, like " +
+                "\"2 cups flour\", a line each")
+        self.useButton = QPushButton("Use...")
+        self.useButton.setToolTip("Takes ingredients out of the pantry")
+        self.removeButton = QPushButton("Remove")
+        self.removeButton.setToolTip("Removes the selected ingredients " +
+                "from the pantry")
+        self.doneButton = QPushButton("Done")
+
+        # Layouting
+        self.setLayout(self.mainLayout)
+        self.mainLayout.addWidget(self.itemsList)
+        self.mainLayout.addLayout(self.buttonLayout)
+        self.buttonLayout.addWidget(self.addButton)
+        self.buttonLayout.addWidget(self.useButton)
+        self.buttonLayout.addWidget(self.removeButton)
+        self.buttonLayout.addStretch()
+        self.buttonLayout.addWidget(self.doneButton)
+
+        # Signals
+        self.itemsList.itemSelectionChanged.connect(self.enable_buttons)
+        self.addButton.clicked.connect(self.add_items)
+        self.useButton.clicked.connect(self.use_items)
+        self.removeButton.clicked.connect(self.remove_items)
+        self.doneButton.clicked.connect(self.accept)
+
+        self.refresh_list()
@@ -26,6 +26,24 @@ from instructions import *
 # Error dialog import
 from errordialog import *
 
+# Undo/redo history import
+from models.history import *
+
+# Copy-on-write recipe draft import
+from models.draft import *
+
+# Nutrition engine import
+from models.nutrition import *
+
+# Similar recipes index import
+from models.similarity import *
+
+# Instruction analysis import
+from models.analysis import get_instruction_analyzer, summarize
+
+# Generate shopping list dialog import
+from shopping_list import ShoppingListDialog
+
 import sys
 
 class RecipeOverview(QDialog):
@@ -74,6 +92,59 @@ class RecipeOverview(QDialog):
                     instruction + '\n')
             counter += 1
 
+        # What the instructions say about times, temperatures and equipment.
+        # Only steps that were edited are analyzed again
+        self.analysisData.setText(summarize(
+            get_instruction_analyzer().analyze(self.recipe)))
+
+    def refresh_nutrition(self):
+        """
+        Refreshes the nutrition totals of the recipe, per serving. Cheap when
+        the ingredients haven't changed, since the totals are cached.
+        """
+        engine = get_nutrition_engine()
+        if engine is None:
+            self.nutritionData.setText('No nutrient table available.')
+            return
+
+        facts = engine.compute(self.recipe)
+        values = facts.per_serving()
+
+        text = 'Per serving: '
+        for number, nutrient in enumerate(facts.nutrients):
+            if number > 0:
+                text = text + ', '
+            text = (text + nutrient + ' ' + ('%.1f' % values[number]) + ' ' +
+                    facts.units.get(nutrient, ''))
+
+        if len(facts.missing):
+            text = (text + '\n(No nutrition data for: ' +
+                    ', '.join(facts.missing) + ')')
+
+        self.nutritionData.setText(text)
+
+    def refresh_similar(self):
+        """
+        Refreshes the list of the recipes in the library most similar to the
+        recipe in view. The recipe is indexed again first, since it may have
+        been edited in this dialog.
+        """
+        self.similarData.clear()
+
+        if self.similarIndex is None:
+            self.similarData.addItem('No library to compare with.')
+            return
+
+        self.similarIndex.update(self.recipe)
+        similar = self.similarIndex.similar(self.recipe)
+
+        for similarity, recipe in similar:
+            self.similarData.addItem(recipe.name + ' (' +
+                    str(int(round(similarity * 100))) + '% similar)')
+
+        if len(similar) == 0:
+            self.similarData.addItem('No similar recipes found.')
+
     def edit_recipe_info(self):
         """Edits the essential data of the recipe in view"""
         # Create an edit recipe dialog
@@ -85,9 +156,12 @@ class RecipeOverview(QDialog):
         # Return the recipe from the dialog
         self.recipe = editRecipeDialog.get_recipe()
 
-        # Refresh the info displayed
+        # Refresh the info displayed, the serving size may have changed
         self.refresh_recipe_info()
-        
+        self.refresh_nutrition()
+        self.refresh_similar()
+        self.record_change('Edit recipe information')
+
     def edit_ingredients(self):
         """Edits the ingredients of the recipe in view"""
         # Create an ingredients dialog
@@ -99,8 +173,11 @@ class RecipeOverview(QDialog):
         # Get the updated list of ingredients from the dialog
         self.recipe.ingredients = ingredientsDialog.get_ingredients()
 
-        # Refresh the list of ingredients
+        # Refresh the list of ingredients and what they add up to
         self.refresh_ingredients()
+        self.refresh_nutrition()
+        self.refresh_similar()
+        self.record_change('Edit ingredients')
 
     def edit_instructions(self):
         """Edits the instructions of the recipe in view"""
@@ -116,6 +193,8 @@ class RecipeOverview(QDialog):
 
         # Refresh the list of instructions
         self.refresh_instructions()
+        self.refresh_similar()
+        self.record_change('Edit instructions')
 
     def import_image(self):
         """Imports an image to be used by the current recipe"""
@@ -147,6 +226,7 @@ class RecipeOverview(QDialog):
         self.imageLabel.setPixmap(QPixmap(path).scaledToWidth(420))
         # Refresh the image buttons
         self.toggle_image_buttons()
+        self.record_change('Import image')
         print self.selectedImage
 
     def delete_image(self):
@@ -168,8 +248,68 @@ class RecipeOverview(QDialog):
                 self.recipe.images[self.selectedImage]).scaledToWidth(420))
         # Refresh the buttons
         self.toggle_image_buttons()
+        self.record_change('Delete image')
         print str(deleted) + ' has been removed from the list of images!'
 
+    def refresh_image(self):
+        """
+        Refreshes the displayed image, making sure the selected image still
+        exists in the recipe. Usually done after an undo or a redo.
+        """
+        if self.selectedImage >= len(self.recipe.images):
+            self.selectedImage = max(len(self.recipe.images) - 1, 0)
+
+        if len(self.recipe.images):
+            self.imageLabel.setPixmap(QPixmap(
+                self.recipe.images[self.selectedImage]).scaledToWidth(420))
+        else:
+            self.imageLabel.setPixmap(QPixmap("./gui/images/placeholder.png"))
+
+        self.toggle_image_buttons()
+
+    def toggle_history_buttons(self):
+        """
+        Enables or disables the Undo and Redo buttons depending on whether
+        there is anything to undo or redo.
+        """
+        self.undoButton.setEnabled(self.history.can_undo())
+        self.redoButton.setEnabled(self.history.can_redo())
+
+    def record_change(self, label):
+        """
+        Records the current state of the recipe in its undo history. Called
+        after every edit made through this dialog.
+        """
+        self.history.record(label)
+        self.toggle_history_buttons()
+
+    def refresh_all(self):
+        """Refreshes everything displayed about the recipe."""
+        self.refresh_recipe_info()
+        self.refresh_ingredients()
+        self.refresh_instructions()
+        self.refresh_nutrition()
+        self.refresh_similar()
+        self.refresh_image()
+        self.toggle_history_buttons()
+
+    def open_shopping_list(self):
+        """
+        Opens the shopping list of the recipe, scaled to any serving size.
+        """
+        shoppingListDialog = ShoppingListDialog(self, self.recipe)
+        shoppingListDialog.exec_()
+
+    def undo(self):
+        """Undoes the last edit made to the recipe."""
+        self.history.undo()
+        self.refresh_all()
+
+    def redo(self):
+        """Redoes the last edit that was undone."""
+        self.history.redo()
+        self.refresh_all()
+
     def next_image(self):
         """
         Changes the currently displayed image to the next image in the recipe's
@@ -257,6 +397,10 @@ class RecipeOverview(QDialog):
         self.prevImageButton.clicked.connect(self.previous_image)
         self.nextImageButton.clicked.connect(self.next_image)
         self.deleteImageButton.clicked.connect(self.delete_image)
+        # Undo and redo buttons
+        self.undoButton.clicked.connect(self.undo)
+        self.redoButton.clicked.connect(self.redo)
+        self.shoppingListButton.clicked.connect(self.open_shopping_list)
 
     def init_ui(self):
         """Initializes the UI of the dialog"""
@@ -288,9 +432,24 @@ class RecipeOverview(QDialog):
         self.editInstructionsButton.setToolTip("Edit the instructions for " +
                 "this recipe.")
 
+        # Nutrition totals of the recipe
+        self.nutritionData = QLabel()
+        self.nutritionData.setWordWrap(True)
+
+        # Times, temperatures and equipment of the instructions
+        self.analysisData = QLabel()
+        self.analysisData.setWordWrap(True)
+
+        # The recipes most similar to this one
+        self.similarData = QListWidget()
+        self.similarData.setToolTip("The recipes in your library that are " +
+                "most like this one")
+
         # Refresh the ingredients and instructions list
         self.refresh_ingredients()
         self.refresh_instructions()
+        self.refresh_nutrition()
+        self.refresh_similar()
 
         self.buttonLayout = QHBoxLayout()
         self.editRecipeButton = QPushButton("Edit Recipe")
@@ -317,6 +476,18 @@ class RecipeOverview(QDialog):
         self.newImageButton = QPushButton("New Image")
         self.deleteImageButton = QPushButton("Delete Image")
 
+        # Undo and redo buttons
+        self.historyButtonsLayout = QHBoxLayout()
+        self.undoButton = QPushButton("Undo")
+        self.undoButton.setToolTip("Undoes the last change made to this " +
+                "recipe")
+        self.redoButton = QPushButton("Redo")
+        self.redoButton.setToolTip("Redoes the last change that was undone")
+        # Shopping list button
+        self.shoppingListButton = QPushButton("Shopping List")
+        self.shoppingListButton.setToolTip("Lists what to buy for this " +
+                "recipe, less what is in the pantry")
+
         # Layouting
         self.setLayout(self.mainLayout)
         self.mainLayout.addLayout(self.splitLayout)
@@ -339,6 +510,12 @@ class RecipeOverview(QDialog):
                 Qt.AlignTop)
         self.formLayout.addWidget(self.instructionData, 6, 1)
         self.formLayout.addWidget(self.editInstructionsButton, 7, 1)
+        self.formLayout.addWidget(QLabel("<b>Nutrition:</b>"), 8, 0,
+                Qt.AlignTop)
+        self.formLayout.addWidget(self.nutritionData, 8, 1)
+        self.formLayout.addWidget(QLabel("<b>Cooking:</b>"), 9, 0,
+                Qt.AlignTop)
+        self.formLayout.addWidget(self.analysisData, 9, 1)
 
         # Right hand side
         self.rightHandLayout.addWidget(self.imageLabel)
@@ -347,19 +524,34 @@ class RecipeOverview(QDialog):
         self.imageButtonsLayout.addWidget(self.newImageButton)
         self.imageButtonsLayout.addWidget(self.deleteImageButton)
         self.imageButtonsLayout.addWidget(self.nextImageButton)
+        self.rightHandLayout.addWidget(QLabel("<b>Similar Recipes:</b>"))
+        self.rightHandLayout.addWidget(self.similarData)
 
-        # Toggling the image buttons
+        # Undo and redo buttons go below everything else
+        self.mainLayout.addLayout(self.historyButtonsLayout)
+        self.historyButtonsLayout.addWidget(self.undoButton)
+        self.historyButtonsLayout.addWidget(self.redoButton)
+        self.historyButtonsLayout.addWidget(self.shoppingListButton)
+
+        # Toggling the image and history buttons
         self.toggle_image_buttons()
+        self.toggle_history_buttons()
 
-    def __init__(self, parent, recipe):
+    def __init__(self, parent, recipe, similarIndex=None):
         super(RecipeOverview, self).__init__(parent)
         self.recipe = recipe # Get the recipe passed
+        # The index of the library the recipe is in, for finding similar
+        # recipes
+        self.similarIndex = similarIndex
         self.setWindowTitle("Overview for " + self.recipe.name)
         # A counter variable that keeps track of the currently selected
         # image for the recipe
         # Initialized at 0 because we always start from the start.
         self.selectedImage = 0
 
+        # The undo history of the recipe being viewed
+        self.history = RecipeHistory(self.recipe)
+
         self.init_ui()
         self.init_signals()
 
@@ -400,6 +592,9 @@ class RecipeWindow(QDialog):
         self.submitButton = QPushButton("Submit")
 
         self.recipe = RecipeModel() # Create a model
+        # Changes are made on a draft of the recipe, and only written into
+        # the recipe once the form is submitted properly
+        self.draft = RecipeDraft(self.recipe)
 
     def get_recipe(self):
         """
@@ -412,13 +607,14 @@ class RecipeWindow(QDialog):
         Puts all the form data into a model and returns that model to the
         main screen
         """
-        self.recipe.name = self.nameData.text()
-        self.recipe.course = self.courseData.currentText()
-        self.recipe.servingSize = self.servingSizeData.value()
+        self.draft.name = self.nameData.text()
+        self.draft.course = self.courseData.currentText()
+        self.draft.servingSize = self.servingSizeData.value()
 
-        if not (self.recipe.name == '' or self.recipe.servingSize == 0.0):
+        if not (self.draft.name == '' or self.draft.servingSize == 0.0):
             # Everything seems to be in order, so carry on
             # Put all the information in the forms into the model
+            self.draft.commit()
             print 'Form submitted!'
             self.done(1)
         else:
@@ -427,6 +623,7 @@ class RecipeWindow(QDialog):
             errorDialog.exec_() # execute the dialog
             if (errorDialog.get_flag() == 1):
                 # User wanted to just discard the recipe
+                self.draft.discard()
                 self.done(1)
 
     def init_layout(self):
@@ -514,8 +711,9 @@ class EditRecipeWindow(RecipeWindow):
         # Initialize signals
         self.init_signals()
 
-        # Initialize the recipe to be edited
+        # Initialize the recipe to be edited, and the draft the changes go to
         self.recipe = recipe
+        self.draft = RecipeDraft(self.recipe)
 
         # Refresh the data fields to reflect the current recipe data
         self.refresh_data()
@@ -13,6 +13,18 @@ from PySide.QtGui import *
 
 import sys
 
+# Recipe costing import
+from models.costing import *
+
+# Kitchen fraction formatting import
+from models.quantity import format_amount
+
+# PDF printing import
+from models.binder import recipe_card, write_binder
+
+# Pantry import
+from models.pantry import get_pantry
+
 class ShoppingListDialog(QDialog):
     """
     Class of the dialog that pops up whenever the user wants to generate a
@@ -32,22 +44,90 @@ class ShoppingListDialog(QDialog):
         # Reinitialize the list
         self.initialize_list()
 
+    def print_list(self):
+        """
+        Prints the recipe and its shopping list, scaled to the new serving
+        size, into a PDF file.
+        """
+        fileDialog = QFileDialog(self, "Print Shopping List", "./recipes/")
+        fileDialog.setAcceptMode(QFileDialog.AcceptSave)
+        fileDialog.setFileMode(QFileDialog.AnyFile)
+        fileDialog.setNameFilter("PDF Document(*.pdf)")
+        fileDialog.setDefaultSuffix("pdf")
+
+        if fileDialog.exec_():
+            # A single recipe is quick enough to print right away
+            try:
+                write_binder(fileDialog.selectedFiles()[0],
+                        [recipe_card(self.recipe,
+                            self.newServingSizeData.value())], workers=1,
+                        pantry=self.pantry)
+            except (IOError, OSError), error:
+                QMessageBox.warning(self, "Print Shopping List",
+                        "The shopping list could not be written: " +
+                        str(error))
+
+    def scaled_ingredients(self):
+        """
+        Returns the ingredients of the recipe scaled to the new serving
+        size, as (name, quantity, unit). A recipe of no servings can't be
+        scaled, so its ingredients are returned as they are.
+        """
+        try:
+            ingredients = self.recipe.scale_ingredients(
+                    self.newServingSizeData.value(), exact=True)
+        except ValueError:
+            ingredients = self.recipe.ingredients
+        return [(ingredient['name'], ingredient['quantity'],
+            ingredient['unit']) for ingredient in ingredients]
+
+    def mark_bought(self):
+        """
+        Adds what is left to buy to the pantry, all of it at once, once the
+        user has done the shopping.
+        """
+        self.pantry.add(self.pantry.net_list(self.scaled_ingredients()))
+        self.initialize_list()
+
+    def mark_cooked(self):
+        """
+        Takes the ingredients of the recipe out of the pantry, all of them at
+        once, once the user has cooked it.
+        """
+        self.pantry.take(self.scaled_ingredients())
+        self.initialize_list()
+
     def initialize_list(self):
         """
         Initializes the list of ingredients displayed in the list. The
         ingredients' values are based on the new values inputted by the user
-        on the dialog's double spinbox.
+        on the dialog's double spinbox, less what is in the pantry.
         """
         # First we remove all the items in the list
         self.ingredientsList.clear()
 
-        for ingredient in self.recipe.ingredients:
+        for name, quantity, unit, onHand in self.pantry.offset(
+                self.scaled_ingredients()):
             # Loop for every ingredient in the list of ingredients of the
-            # given recipe
-            self.ingredientsList.addItem(str(ingredient[0]) + "- (" +
-                str((ingredient[1] / self.recipe.servingSize) *
-                self.newServingSizeData.value()) + " " +
-                str(ingredient[2]) + ")")
+            # given recipe, scaled to the new serving size
+            if not quantity:
+                self.ingredientsList.addItem(name + " - in the pantry")
+            elif onHand:
+                self.ingredientsList.addItem(name + " - (" +
+                    format_amount(quantity, unit) + ", " +
+                    format_amount(onHand, unit) + " in the pantry)")
+            else:
+                self.ingredientsList.addItem(name + " - (" +
+                    format_amount(quantity, unit) + ")")
+
+        # Refresh the cost as well, it scales the same way
+        engine = get_costing_engine()
+        if engine is not None:
+            cost = engine.compute(self.recipe)
+            self.costData.setText(format_money(cost.for_servings(
+                self.newServingSizeData.value()), cost.currency))
+        else:
+            self.costData.setText("No price table available")
 
     def init_signals(self):
         """
@@ -55,6 +135,9 @@ class ShoppingListDialog(QDialog):
         signals.
         """
         self.exitButton.clicked.connect(self.exit)
+        self.printButton.clicked.connect(self.print_list)
+        self.boughtButton.clicked.connect(self.mark_bought)
+        self.cookedButton.clicked.connect(self.mark_cooked)
         self.newServingSizeData.valueChanged.connect(self.refresh_data)
 
     def init_ui(self):
@@ -75,10 +158,28 @@ class ShoppingListDialog(QDialog):
         self.newServingSizeData = QDoubleSpinBox()
         # Set the data to the given recipe's
         self.newServingSizeData.setValue(self.recipe.servingSize)
+        if not self.recipe.servingSize:
+            # There is nothing to scale from
+            self.newServingSizeData.setEnabled(False)
+            self.newServingSizeData.setToolTip("The recipe has no serving " +
+                    "size to scale from")
 
         # List of ingredients
         self.ingredientsList = QListWidget()
 
+        # Estimated cost of the ingredients
+        self.costData = QLabel()
+
+        # Print button
+        self.printButton = QPushButton("Print...")
+        # Pantry buttons
+        self.pantryLayout = QHBoxLayout()
+        self.boughtButton = QPushButton("Bought")
+        self.boughtButton.setToolTip("Adds what is left to buy to the " +
+                "pantry")
+        self.cookedButton = QPushButton("Cooked")
+        self.cookedButton.setToolTip("Takes the ingredients out of the " +
+                "pantry")
         # Exit button
         self.exitButton = QPushButton("Return to Main Menu")
 
@@ -91,13 +192,18 @@ class ShoppingListDialog(QDialog):
         self.formLayout.addRow("Original Serving Size: ", 
                                self.origServingSizeData)
         self.formLayout.addRow("New Serving Size: ", self.newServingSizeData)
+        self.formLayout.addRow("Estimated Cost: ", self.costData)
 
         self.mainLayout.addWidget(self.ingredientsList)
         
         # Refresh the list
         self.initialize_list()
 
-        # Exit button
+        # Pantry, print and exit buttons
+        self.mainLayout.addLayout(self.pantryLayout)
+        self.pantryLayout.addWidget(self.boughtButton)
+        self.pantryLayout.addWidget(self.cookedButton)
+        self.mainLayout.addWidget(self.printButton)
         self.mainLayout.addWidget(self.exitButton)
 
     def __init__(self, parent, recipe):
@@ -108,6 +214,8 @@ class ShoppingListDialog(QDialog):
         super(ShoppingListDialog, self).__init__(parent)
         # Put the given recipe in this dialog's own copy
         self.recipe = recipe
+        # What is on hand, left out of the list
+        self.pantry = get_pantry()
 
         self.init_ui()
         self.init_signals()
@@ -0,0 +1,98 @@
+###############################################################################
+#
+# timeline.py
+#
+# The dialog that plans cooking several recipes at once: the user ticks the
+# recipes and says how many cooks there are, and gets a timeline of every
+# step of every recipe, laid out so all of them are done at the same time.
+#
+###############################################################################
+
+# PySide imports
+from PySide.QtCore import *
+from PySide.QtGui import *
+
+# Cooking timeline import
+from models.timeline import *
+
+class TimelineDialog(QDialog):
+    """
+    Dialog that lists the recipes of the library to pick from, and the
+    timeline of cooking the ones picked. The timeline is planned again
+    whenever the recipes or the number of cooks change.
+    """
+    def picked_recipes(self):
+        """Returns the recipes the user ticked, in the order of the list."""
+        return [self.recipes[row] for row in range(self.recipesList.count())
+                if self.recipesList.item(row).checkState() == Qt.Checked]
+
+    def refresh_plan(self, *arguments):
+        """
+        Plans the recipes picked again, and shows the plan. Called whenever
+        a recipe is ticked or the number of cooks changes.
+        """
+        self.planList.clear()
+        recipes = self.picked_recipes()
+        if not recipes:
+            self.planList.addItem("Tick the recipes to cook.")
+            return
+
+        plan = plan_service(recipes, self.cooksSpinBox.value())
+        for line in format_plan(plan):
+            self.planList.addItem(line)
+
+    def __init__(self, parent, recipes, selected=None):
+        """
+        Initializes the dialog with the recipes of the library, and the
+        index of the one to tick first, if any.
+        """
+        super(TimelineDialog, self).__init__(parent)
+
+        self.recipes = recipes
+
+        self.setWindowTitle("Cooking Timeline")
+
+        # Creation
+        self.mainLayout = QVBoxLayout()
+        self.listLayout = QHBoxLayout()
+        self.buttonLayout = QHBoxLayout()
+
+        self.recipesList = QListWidget()
+        self.recipesList.setToolTip("The recipes to cook at the same time")
+        for index, recipe in enumerate(recipes):
+            item = QListWidgetItem(recipe.name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            if index == selected:
+                item.setCheckState(Qt.Checked)
+            else:
+                item.setCheckState(Qt.Unchecked)
+            self.recipesList.addItem(item)
+
+        self.planList = QListWidget()
+        self.planList.setToolTip("When to do every step, in hours and " +
+                "minutes from the start of cooking")
+
+        self.cooksLabel = QLabel("Cooks:")
+        self.cooksSpinBox = QSpinBox()
+        self.cooksSpinBox.setRange(1, 10)
+        self.cooksSpinBox.setToolTip("How many people are cooking. Steps " +
+                "like baking or resting don't need anyone")
+        self.doneButton = QPushButton("Done")
+
+        # Layouting
+        self.setLayout(self.mainLayout)
+        self.mainLayout.addLayout(self.listLayout)
+        self.listLayout.addWidget(self.recipesList, 1)
+        self.listLayout.addWidget(self.planList, 3)
+        self.mainLayout.addLayout(self.buttonLayout)
+        self.buttonLayout.addWidget(self.cooksLabel)
+        self.buttonLayout.addWidget(self.cooksSpinBox)
+        self.buttonLayout.addStretch()
+        self.buttonLayout.addWidget(self.doneButton)
+
+        # Signals
+        self.recipesList.itemChanged.connect(self.refresh_plan)
+        self.cooksSpinBox.valueChanged.connect(self.refresh_plan)
+        self.doneButton.clicked.connect(self.accept)
+
+        self.refresh_plan()
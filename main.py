@@ -29,13 +29,65 @@
 # Main program/file. Run this to run the entire program.
 
 # Importing stuff
-import simplejson as json # json imports
 import sys
+import os
+
+# JSON codec import
+from models import codec
 
 # GUI stuff
 from gui.mainwindow import *
 
-print 'Hello world!'
+# Latency instrumentation, only enabled when asked for
+from gui.instrumentation import *
+
+# The binder printing workers run in processes of their own, which on
+# platforms without fork() import this file again; only start the app when
+# it is run
+if __name__ == '__main__':
+    print 'Hello world!'
+    print 'JSON codec: ' + codec.describe()
+
+    # Qt App declaration. Made here rather than when the GUI is imported, so
+    # the binder workers and the benchmarks don't each make one
+    app = QApplication(sys.argv)
+
+    # Set PYRECIPE_LATENCY to a file path to time the user's actions
+    latencyPath = os.environ.get('PYRECIPE_LATENCY')
+    if latencyPath:
+        recorder = enable_instrumentation()
+
+    window = MainWindow()
+
+    if latencyPath:
+        attach_panel(window, recorder, latencyPath)
+
+    # Set PYRECIPE_RECIPE_FOLDER to a folder (like ./recipes/) to keep the
+    # library in sync with the recipe files in it
+    recipeFolder = os.environ.get('PYRECIPE_RECIPE_FOLDER')
+    if recipeFolder:
+        window.watch_folder(recipeFolder)
+
+    # Set PYRECIPE_API_PORT to a port number to serve the library over HTTP
+    apiPort = os.environ.get('PYRECIPE_API_PORT')
+    if apiPort:
+        window.start_api_server(int(apiPort))
+
+    # Set PYRECIPE_SITE_FOLDER to a folder (like ./site/) to publish the
+    # library there as a static HTML site
+    siteFolder = os.environ.get('PYRECIPE_SITE_FOLDER')
+    if siteFolder:
+        window.publish_site(siteFolder)
+
+    # Set PYRECIPE_SYNC_PORT to a port number to let other machines sync
+    # with the library over a socket, and PYRECIPE_SYNC_PEER to the
+    # host:port of the machine to sync with, instead of a shared folder
+    syncPort = os.environ.get('PYRECIPE_SYNC_PORT')
+    if syncPort:
+        window.start_sync_server(int(syncPort))
+    syncPeer = os.environ.get('PYRECIPE_SYNC_PEER')
+    if syncPeer:
+        host, port = syncPeer.rsplit(':', 1)
+        window.syncPeer = (host, int(port))
 
-window = MainWindow()
-sys.exit(app.exec_())
+    sys.exit(app.exec_())
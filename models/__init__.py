@@ -1 +1,6 @@
-__all__ = ['recipemodel']
+__all__ = ['recipemodel', 'history', 'draft', 'foodtable', 'nutrition',
+        'costing', 'normalize', 'dedup', 'similarity', 'webapi',
+        'recipefolder', 'archive', 'streaming', 'codec', 'interning',
+        'quantity', 'pdf', 'binder', 'website', 'librarysync',
+        'timeline', 'analysis', 'ingredientparser', 'converters',
+        'pantry', 'gcpause']
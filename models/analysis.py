@@ -0,0 +1,317 @@
+###############################################################################
+#
+# analysis.py
+#
+# Reads what the instructions of recipes say: how long every step takes, the
+# oven temperatures and the equipment needed. Every instruction goes through
+# a pipeline of patterns compiled once, when the module is loaded, and every
+# pattern adds what it finds to the analysis of the instruction.
+#
+# Every step is analyzed once. The analyses of a recipe are cached by the
+# text of its steps, so when the instructions window edits or adds a step,
+# only that step is analyzed again. Moving or deleting steps doesn't
+# analyze anything. A whole library can be analyzed in worker processes
+# with analyze_library(), and every instruction that comes up in more than
+# one recipe is only analyzed once.
+#
+###############################################################################
+
+import multiprocessing
+import re
+import weakref
+
+# How many instructions a worker process analyzes at a time
+BATCH_SIZE = 512
+
+# Amounts of time: "20 minutes", "1 1/2 hours", "10-15 mins", "an hour"
+# (longer numbers first, so "forty-five" isn't read as "forty")
+NUMBER = (r'(?:\d+(?:\.\d+)?(?: \d+/\d+)?|\d+/\d+|an?|one|two|three|four|'
+        r'five|six|seven|eight|nine|ten|twelve|fifteen|twenty|thirty|'
+        r'forty-five|forty|sixty|half an?)')
+DURATION_PATTERN = re.compile(r'\b(' + NUMBER + r')(?:\s*(?:-|to|or)\s*(' +
+        NUMBER + r'))?\s*(seconds?|secs?|minutes?|mins?|hours?|hrs?|' +
+        r'overnight)\b|\b(overnight)\b', re.IGNORECASE)
+
+WORD_NUMBERS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4,
+        'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+        'twelve': 12, 'fifteen': 15, 'twenty': 20, 'thirty': 30,
+        'forty': 40, 'forty-five': 45, 'sixty': 60, 'half a': 0.5,
+        'half an': 0.5}
+
+# How long overnight is, in minutes
+OVERNIGHT_MINUTES = 8 * 60
+
+# Words that make a time say when or how often to do something during a
+# step ("rotating after 10 minutes", "stirring every 5 minutes") rather
+# than how long it takes
+INTERVAL_PATTERN = re.compile(r'\b(?:after|every|each)\s+(?:other\s+)?$',
+        re.IGNORECASE)
+
+# Temperatures: "350 degrees F", "180 degrees C", "425F", "gas mark 4". A
+# degree sign in a UTF-8 byte string comes after a \xc2, which the pattern
+# lets through. Without a scale, degrees are taken to be Fahrenheit. A bare
+# F or C after a number ("425F") is only a temperature in the range of an
+# oven, so "12 C sugar" is twelve cups
+TEMPERATURE_PATTERN = re.compile(u'\\b(\\d{2,3})\\s*(?:(?:\\xc2?\\xb0|'
+        u'[Dd]egrees?)\\s*([Ff]ahrenheit|[Cc]elsius|[Cc]entigrade|F|C)?|'
+        u'(F|C))\\b|\\b[Gg]as [Mm]ark (\\d)\\b')
+
+# The oven temperatures a bare F or C can stand for, in either scale
+OVEN_RANGES = {'F': (200, 550), 'C': (90, 290)}
+
+# Gas marks to degrees Fahrenheit
+GAS_MARKS = {1: 275, 2: 300, 3: 325, 4: 350, 5: 375, 6: 400, 7: 425,
+        8: 450, 9: 475}
+
+# Equipment, as it is written to the name it is listed under
+EQUIPMENT = {'oven': 'oven', 'dutch oven': 'dutch oven',
+        'skillet': 'skillet', 'frying pan': 'skillet', 'fry pan': 'skillet',
+        'saucepan': 'saucepan', 'sauce pan': 'saucepan', 'pot': 'pot',
+        'stockpot': 'pot', 'stock pot': 'pot', 'wok': 'wok',
+        'baking dish': 'baking dish', 'casserole dish': 'baking dish',
+        'baking sheet': 'baking sheet', 'sheet pan': 'baking sheet',
+        'cookie sheet': 'baking sheet', 'roasting pan': 'roasting pan',
+        'loaf pan': 'loaf pan', 'cake pan': 'cake pan',
+        'muffin tin': 'muffin tin', 'muffin pan': 'muffin tin',
+        'pie dish': 'pie dish', 'bowl': 'bowl', 'blender': 'blender',
+        'food processor': 'food processor', 'stand mixer': 'mixer',
+        'mixer': 'mixer', 'grill': 'grill', 'broiler': 'broiler',
+        'griddle': 'griddle', 'microwave': 'microwave',
+        'slow cooker': 'slow cooker', 'pressure cooker': 'pressure cooker',
+        'steamer': 'steamer', 'colander': 'colander', 'sieve': 'sieve',
+        'strainer': 'sieve', 'rolling pin': 'rolling pin',
+        'thermometer': 'thermometer', 'cutting board': 'cutting board',
+        'mortar and pestle': 'mortar and pestle', 'whisk': 'whisk'}
+
+# Longest names first, so "dutch oven" is found rather than "oven". "Whisk"
+# is only equipment after "a" or "the", otherwise it's what to do
+EQUIPMENT_PATTERN = re.compile(r'\b(' + '|'.join(
+    sorted([name for name in EQUIPMENT if name != 'whisk'], key=len,
+        reverse=True)) + r'|(?<=a )whisk|(?<=the )whisk)(?:e?s)?\b',
+    re.IGNORECASE)
+
+
+class InstructionAnalysis(object):
+    """
+    What an instruction says: how many minutes it takes (None if it doesn't
+    say), where in it the first time is, the oven temperatures it mentions
+    in degrees Fahrenheit, and the equipment it mentions.
+    """
+    __slots__ = ['minutes', 'timePosition', 'temperatures', 'equipment']
+
+    def __init__(self, minutes, timePosition, temperatures, equipment):
+        self.minutes = minutes
+        self.timePosition = timePosition
+        self.temperatures = temperatures
+        self.equipment = equipment
+
+    def __reduce__(self):
+        # Analyses come back from worker processes pickled
+        return (InstructionAnalysis, (self.minutes, self.timePosition,
+            self.temperatures, self.equipment))
+
+def parse_number(text):
+    """Returns the number of a duration, like '1 1/2' or 'an'."""
+    text = text.lower()
+    if text in WORD_NUMBERS:
+        return WORD_NUMBERS[text]
+    number = 0.0
+    for part in text.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            number += float(numerator) / float(denominator)
+        else:
+            number += float(part)
+    return number
+
+def read_duration(match):
+    """
+    Returns the minutes of a duration, taking the longest of a range ("10
+    to 15 minutes"), or None if it is an interval within the step ("after
+    10 minutes").
+    """
+    if INTERVAL_PATTERN.search(match.string, max(match.start() - 20, 0),
+            match.start()):
+        return None
+    first, last, unit, overnight = match.groups()
+    if overnight or unit.lower() == 'overnight':
+        return OVERNIGHT_MINUTES
+    minutes = parse_number(last or first)
+    unit = unit.lower()
+    if unit.startswith('h'):
+        minutes *= 60
+    elif unit.startswith('s'):
+        minutes /= 60.0
+    return minutes
+
+def read_temperature(match):
+    """
+    Returns a temperature in degrees Fahrenheit, or None if it can't be an
+    oven temperature.
+    """
+    degrees, scale, letter, gasMark = match.groups()
+    if gasMark is not None:
+        return GAS_MARKS.get(int(gasMark))
+    if letter is not None:
+        lowest, highest = OVEN_RANGES[letter]
+        if not lowest <= int(degrees) <= highest:
+            return None
+    scale = (scale or letter or 'F')[0].upper()
+    if scale == 'C':
+        return int(round(int(degrees) * 9 / 5.0 + 32))
+    return int(degrees)
+
+def read_equipment(match):
+    """Returns the name a piece of equipment is listed under."""
+    return EQUIPMENT[match.group(1).lower()]
+
+# The pipeline every instruction goes through: what each pattern finds, and
+# how to read each of its matches
+PIPELINE = [('durations', DURATION_PATTERN, read_duration),
+        ('temperatures', TEMPERATURE_PATTERN, read_temperature),
+        ('equipment', EQUIPMENT_PATTERN, read_equipment)]
+
+def analyze_instruction(instruction):
+    """
+    Returns the InstructionAnalysis of an instruction. The times it
+    mentions are added up ("simmer 10 minutes, then bake 30 minutes"),
+    leaving out intervals within the step ("stirring every 5 minutes");
+    temperatures and equipment are listed once each, in the order they come
+    up.
+    """
+    found = {}
+    timePosition = len(instruction)
+    for name, pattern, read in PIPELINE:
+        values = []
+        for match in pattern.finditer(instruction):
+            value = read(match)
+            if value is None:
+                continue
+            if name == 'durations':
+                timePosition = min(timePosition, match.start())
+            elif value in values:
+                continue
+            values.append(value)
+        found[name] = values
+
+    minutes = None
+    if found['durations']:
+        minutes = sum(found['durations'])
+    return InstructionAnalysis(minutes, timePosition,
+            tuple(found['temperatures']), tuple(found['equipment']))
+
+def analyze_batch(instructions):
+    """Analyzes a batch of instructions, in a worker process."""
+    return [analyze_instruction(instruction) for instruction in instructions]
+
+
+class InstructionAnalyzer(object):
+    """
+    Analyzes the instructions of recipes, and caches the analyses of every
+    recipe by the text of its steps.
+    """
+    def __init__(self):
+        # Recipe to a dictionary of its steps to their analyses
+        self.cache = weakref.WeakKeyDictionary()
+
+    def analyze(self, recipe):
+        """
+        Returns the analyses of the steps of a recipe, in order. Only the
+        steps that aren't cached are analyzed, and steps the recipe no
+        longer has are dropped from the cache.
+        """
+        cached = self.cache.get(recipe)
+        instructions = recipe.instructions
+        if cached is None or len(cached) != len(instructions) or not all(
+                [instruction in cached for instruction in instructions]):
+            fresh = {}
+            for instruction in instructions:
+                analysis = cached and cached.get(instruction)
+                if analysis is None:
+                    analysis = analyze_instruction(instruction)
+                fresh[instruction] = analysis
+            self.cache[recipe] = cached = fresh
+        return [cached[instruction] for instruction in instructions]
+
+    def forget(self, recipe):
+        """Drops the cached analyses of a recipe."""
+        self.cache.pop(recipe, None)
+
+    def analyze_library(self, recipes, workers=None):
+        """
+        Analyzes the steps of every recipe that aren't cached yet, in as
+        many worker processes as there are processors, or the given number.
+        Every instruction is analyzed once, however many recipes have it.
+        """
+        pending = []
+        seen = set()
+        for recipe in recipes:
+            cached = self.cache.get(recipe) or {}
+            for instruction in recipe.instructions:
+                if instruction not in cached and instruction not in seen:
+                    seen.add(instruction)
+                    pending.append(instruction)
+
+        analyses = {}
+        batches = [pending[start:start + BATCH_SIZE] for start in
+                xrange(0, len(pending), BATCH_SIZE)]
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1 or len(batches) <= 1:
+            results = [analyze_batch(batch) for batch in batches]
+        else:
+            pool = multiprocessing.Pool(min(workers, len(batches)))
+            try:
+                results = pool.map(analyze_batch, batches)
+            finally:
+                pool.terminate()
+                pool.join()
+        for batch, result in zip(batches, results):
+            analyses.update(zip(batch, result))
+
+        for recipe in recipes:
+            cached = self.cache.get(recipe) or {}
+            fresh = {}
+            for instruction in recipe.instructions:
+                fresh[instruction] = (cached.get(instruction) or
+                        analyses[instruction])
+            self.cache[recipe] = fresh
+
+def summarize(analyses):
+    """
+    Returns a line about the analyses of the steps of a recipe: how long
+    the steps that say so take in all, the oven temperatures and the
+    equipment.
+    """
+    minutes = sum([analysis.minutes for analysis in analyses if
+        analysis.minutes is not None])
+    temperatures = []
+    equipment = []
+    for analysis in analyses:
+        temperatures.extend([temperature for temperature in
+            analysis.temperatures if temperature not in temperatures])
+        equipment.extend([name for name in analysis.equipment if name not in
+            equipment])
+
+    parts = []
+    if minutes:
+        minutes = int(round(minutes))
+        parts.append('%d:%02d of timed steps' % (minutes // 60, minutes % 60))
+    if temperatures:
+        parts.append(', '.join([str(temperature) + ' F' for temperature in
+            temperatures]))
+    if equipment:
+        parts.append(', '.join(equipment))
+    return '; '.join(parts) or 'Nothing timed, heated or needing equipment.'
+
+
+# The analyzer shared by the whole application
+sharedAnalyzer = None
+
+def get_instruction_analyzer():
+    """Returns the analyzer shared by the application."""
+    global sharedAnalyzer
+
+    if sharedAnalyzer is None:
+        sharedAnalyzer = InstructionAnalyzer()
+    return sharedAnalyzer
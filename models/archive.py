@@ -0,0 +1,260 @@
+###############################################################################
+#
+# archive.py
+#
+# Recipe archives (.rcpa): a whole library of recipes in one compressed file.
+# Recipe JSON repeats itself a lot, the same keys, units, courses and
+# ingredient names show up in every recipe, so instead of compressing the
+# recipes one after the other, an archive stores them by column:
+#
+#   * courses, ingredient names and units are kept once each, in a table that
+#     acts as the shared dictionary of the archive, and the recipes only keep
+#     their numbers in it, as arrays of integers
+#   * the other fields (names, serving sizes, quantities, instructions and
+#     images) are kept as one JSON list per field
+#
+# and every column is compressed on its own with zlib. Similar values end up
+# next to each other, which compresses far better, and reading an archive
+# decodes a handful of big columns instead of thousands of small documents.
+#
+###############################################################################
+
+import array
+import struct
+import sys
+import zlib
+from itertools import izip
+
+from models import codec
+
+from models.gcpause import gc_paused
+from models.interning import get_string_pool
+from models.recipemodel import RecipeModel
+
+# The first bytes of every archive
+ARCHIVE_MAGIC = 'RCPA'
+ARCHIVE_VERSION = 1
+
+# The magic, the version and how many recipes there are
+HEADER_FORMAT = '<4sBI'
+
+# The columns of an archive, in the order they are stored. Every column is
+# either a JSON list ('json') or an array of unsigned integers ('ints')
+COLUMNS = [
+    ('names', 'json'), ('course_table', 'json'), ('courses', 'ints'),
+    ('serving_sizes', 'json'), ('ingredient_counts', 'ints'),
+    ('ingredient_table', 'json'), ('ingredient_names', 'ints'),
+    ('unit_table', 'json'), ('units', 'ints'), ('quantities', 'json'),
+    ('instruction_counts', 'ints'), ('instructions', 'json'),
+    ('image_counts', 'ints'), ('images', 'json')]
+
+# How hard zlib tries. Higher levels take much longer to write archives with
+# for a few percent smaller files, and reading is just as fast at any level
+COMPRESSION_LEVEL = 6
+
+def int_array(width, values=()):
+    """Returns an array of unsigned integers of 1, 2 or 4 bytes."""
+    # The typecodes of the sizes differ between platforms
+    for typecode in ['B', 'H', 'I', 'L']:
+        if array.array(typecode).itemsize == width:
+            return array.array(typecode, values)
+    raise ValueError('No ' + str(width) + ' byte array type on this platform')
+
+def encode_ints(values):
+    """
+    Encodes a list of integers as little endian unsigned integers, each as
+    small as the largest of them allows. The first byte is their size.
+    """
+    largest = max(values or [0])
+    if largest < 1 << 8:
+        width = 1
+    elif largest < 1 << 16:
+        width = 2
+    else:
+        width = 4
+
+    ints = int_array(width, values)
+    if sys.byteorder == 'big':
+        ints.byteswap()
+    return chr(width) + ints.tostring()
+
+def decode_ints(data):
+    """Decodes what encode_ints() encoded."""
+    ints = int_array(ord(data[0]))
+    ints.fromstring(data[1:])
+    if sys.byteorder == 'big':
+        ints.byteswap()
+    return ints.tolist()
+
+
+class StringTable(object):
+    """Numbers every distinct string it is given, in the order it sees them."""
+    def __init__(self):
+        self.strings = []
+        self.numbers = {}
+
+    def number(self, string):
+        """Returns the number of a string, adding it if it is new."""
+        number = self.numbers.get(string)
+        if number is None:
+            number = len(self.strings)
+            self.numbers[string] = number
+            self.strings.append(string)
+        return number
+
+
+def encode_library(recipes):
+    """Encodes a list of recipes into the contents of an archive."""
+    courseTable = StringTable()
+    ingredientTable = StringTable()
+    unitTable = StringTable()
+
+    columns = dict([(name, []) for name, kind in COLUMNS])
+    for recipe in recipes:
+        columns['names'].append(recipe.name)
+        columns['courses'].append(courseTable.number(recipe.course))
+        columns['serving_sizes'].append(recipe.servingSize)
+
+        columns['ingredient_counts'].append(len(recipe.ingredients))
+        for ingredient in recipe.ingredients:
+            columns['ingredient_names'].append(
+                    ingredientTable.number(ingredient['name']))
+            columns['units'].append(unitTable.number(ingredient['unit']))
+            columns['quantities'].append(ingredient['quantity'])
+
+        columns['instruction_counts'].append(len(recipe.instructions))
+        columns['instructions'].extend(recipe.instructions)
+        columns['image_counts'].append(len(recipe.images))
+        columns['images'].extend(recipe.images)
+
+    columns['course_table'] = courseTable.strings
+    columns['ingredient_table'] = ingredientTable.strings
+    columns['unit_table'] = unitTable.strings
+
+    parts = [struct.pack(HEADER_FORMAT, ARCHIVE_MAGIC, ARCHIVE_VERSION,
+        len(recipes))]
+    for name, kind in COLUMNS:
+        if kind == 'ints':
+            data = encode_ints(columns[name])
+        else:
+            data = codec.dumps(columns[name], separators=(',', ':'))
+        data = zlib.compress(data, COMPRESSION_LEVEL)
+        parts.append(struct.pack('<I', len(data)))
+        parts.append(data)
+
+    return ''.join(parts)
+
+def decode_columns(data):
+    """
+    Decodes the columns of an archive into a dictionary of lists, and
+    returns it with the number of recipes. Raises ValueError if the data
+    isn't an archive.
+    """
+    headerSize = struct.calcsize(HEADER_FORMAT)
+    if len(data) < headerSize:
+        raise ValueError('Not a recipe archive')
+    magic, version, count = struct.unpack(HEADER_FORMAT, data[:headerSize])
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError('Not a recipe archive')
+    if version != ARCHIVE_VERSION:
+        raise ValueError('Unsupported recipe archive version ' +
+                str(version))
+
+    columns = {}
+    offset = headerSize
+    for name, kind in COLUMNS:
+        if offset + 4 > len(data):
+            raise ValueError('Truncated recipe archive')
+        length = struct.unpack('<I', data[offset:offset + 4])[0]
+        offset += 4
+        try:
+            column = zlib.decompress(data[offset:offset + length])
+        except zlib.error:
+            raise ValueError('Corrupted recipe archive')
+        offset += length
+
+        if kind == 'ints':
+            if not column:
+                raise ValueError('Corrupted recipe archive')
+            columns[name] = decode_ints(column)
+        else:
+            columns[name] = codec.loads(column)
+
+    return columns, count
+
+def decode_library(data):
+    """
+    Decodes the contents of an archive into a list of recipes. Raises
+    ValueError if the data isn't an archive.
+    """
+    with gc_paused():
+        return decode_recipes(data)
+
+def decode_recipes(data):
+    """Does the work of decode_library()."""
+    columns, count = decode_columns(data)
+
+    # The tables hold every course, ingredient name and unit only once
+    # already, they only need to share them with the rest of the library
+    pool = get_string_pool()
+    for table in ['course_table', 'ingredient_table', 'unit_table']:
+        columns[table] = [pool.intern(string) for string in columns[table]]
+
+    courseTable = columns['course_table']
+    instructions = columns['instructions']
+    images = columns['images']
+
+    try:
+        # Every ingredient of every recipe is made in one go, then handed
+        # out to the recipes
+        ingredientTable = columns['ingredient_table']
+        unitTable = columns['unit_table']
+        ingredients = [{'name': ingredientTable[name], 'quantity': quantity,
+            'unit': unitTable[unit]} for name, unit, quantity in izip(
+                columns['ingredient_names'], columns['units'],
+                columns['quantities'])]
+    except IndexError:
+        raise ValueError('Corrupted recipe archive')
+
+    recipes = []
+    ingredientStart = instructionStart = imageStart = 0
+    try:
+        for number in xrange(count):
+            recipe = RecipeModel()
+            recipe.name = columns['names'][number]
+            recipe.course = courseTable[columns['courses'][number]]
+            recipe.servingSize = columns['serving_sizes'][number]
+
+            ingredientEnd = (ingredientStart +
+                    columns['ingredient_counts'][number])
+            recipe.ingredients = ingredients[ingredientStart:ingredientEnd]
+            ingredientStart = ingredientEnd
+
+            instructionEnd = (instructionStart +
+                    columns['instruction_counts'][number])
+            recipe.instructions = instructions[instructionStart:
+                    instructionEnd]
+            instructionStart = instructionEnd
+
+            imageEnd = imageStart + columns['image_counts'][number]
+            recipe.images = images[imageStart:imageEnd]
+            imageStart = imageEnd
+
+            recipes.append(recipe)
+    except IndexError:
+        raise ValueError('Corrupted recipe archive')
+
+    return recipes
+
+def write_archive(path, recipes):
+    """Writes a list of recipes into an archive file."""
+    file = open(path, 'wb')
+    file.write(encode_library(recipes))
+    file.close()
+
+def read_archive(path):
+    """Reads the recipes of an archive file."""
+    file = open(path, 'rb')
+    data = file.read()
+    file.close()
+    return decode_library(data)
@@ -0,0 +1,428 @@
+###############################################################################
+#
+# binder.py
+#
+# Prints recipes into a PDF binder: a recipe card for every recipe (its name,
+# course, serving size, first image, ingredients and instructions, over as
+# many pages as it takes), followed by one shopping list of the ingredients
+# of all of them added up, less what is in the pantry, if given one.
+#
+# Every card starts on a page of its own, so cards are laid out and drawn
+# independently of each other, in worker processes, a batch of recipes at a
+# time. The batches come back in order and are written to the file as they
+# arrive, so memory stays flat however many recipes are printed. Page
+# numbers are only known at the end, so they go into small streams of their
+# own, added to every page last.
+#
+# BinderJob runs all of it in a background thread, so printing a library of
+# a thousand recipes doesn't freeze the GUI.
+#
+###############################################################################
+
+import multiprocessing
+import os
+import threading
+import zlib
+
+from models.pdf import *
+from models.quantity import exact_quantity, format_amount
+
+# Room left around the pages, and the width left for text in between
+MARGIN = 54
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+
+# Where the text stops, to leave room for the page numbers
+BOTTOM = MARGIN + 24
+
+# The styles of text: font, size and the height of a line, in points
+STYLES = {'title': ('F2', 20, 26), 'subtitle': ('F1', 11, 18),
+        'heading': ('F2', 13, 22), 'body': ('F1', 11, 15),
+        'footer': ('F1', 9, 12)}
+
+# How tall the image of a card can be, in points
+IMAGE_HEIGHT = 216
+
+# How many recipes a worker lays out at a time. Big enough that handing
+# recipes to the workers costs little next to drawing them
+BATCH_SIZE = 16
+
+# How many images a worker keeps read. Libraries reuse the same few images
+IMAGE_CACHE_SIZE = 64
+
+# How many recipes a shopping list names at most
+SHOPPING_LIST_NAMES = 6
+
+# What ingredients are listed with
+BULLET = u'\u2022 '
+
+
+class BinderCancelled(Exception):
+    """Raised when a binder is cancelled while it's being written."""
+    pass
+
+
+class PageLayout(object):
+    """
+    Lays text and images out from the top of a page down, starting new pages
+    as they fill up.
+    """
+    def __init__(self):
+        # Every page's drawing operations, and the paths of the images it
+        # draws (the first one is /Im0, and so on)
+        self.pages = []
+        self.start_page()
+
+    def start_page(self):
+        """Starts a new page."""
+        self.operations = []
+        self.images = []
+        self.top = PAGE_HEIGHT - MARGIN
+        self.pages.append((self.operations, self.images))
+
+    def make_room(self, height):
+        """
+        Starts a new page if there isn't room for something as tall as the
+        given height on this one. Something taller than a whole page goes on
+        the current page if it is still empty.
+        """
+        if self.top - height < BOTTOM and self.operations:
+            self.start_page()
+
+    def skip(self, height):
+        """Leaves some space."""
+        self.top -= height
+
+    def line(self, data, style, x=MARGIN):
+        """Draws a line of encoded text."""
+        font, size, leading = STYLES[style]
+        self.make_room(leading)
+        self.top -= leading
+        self.operations.append('BT /' + font + ' ' + str(size) + ' Tf ' +
+                '%.2f %.2f Td (' % (x, self.top + leading - size) +
+                escape_text(data) + ') Tj ET')
+
+    def paragraph(self, text, style, prefix='', indent=0):
+        """
+        Draws text wrapped to the width of the page. The prefix (a bullet or
+        a number) goes before the first line only, and the lines after it
+        are lined up with the text after the prefix.
+        """
+        font, size, leading = STYLES[style]
+        prefix = encode_text(prefix)
+        offset = text_width(prefix, font) * size / 1000.0
+        x = MARGIN + indent
+
+        for paragraph in encode_text(text).splitlines() or ['']:
+            lines = wrap_text(paragraph, font, size,
+                    CONTENT_WIDTH - indent - offset)
+            for index, data in enumerate(lines):
+                if index == 0 and prefix:
+                    self.line(prefix + data, style, x)
+                    # Only the first paragraph gets the prefix
+                    prefix = ''
+                else:
+                    self.line(data, style, x + offset)
+
+    def heading(self, text):
+        """Draws a heading, keeping it on the same page as a line after it."""
+        self.make_room(STYLES['heading'][2] + STYLES['body'][2])
+        self.paragraph(text, 'heading')
+
+    def rule(self):
+        """Draws a thin line across the page."""
+        self.skip(6)
+        self.operations.append('0.7 G 0.5 w %.2f %.2f m %.2f %.2f l S 0 G' %
+                (MARGIN, self.top, PAGE_WIDTH - MARGIN, self.top))
+        self.skip(6)
+
+    def image(self, path, image):
+        """Draws an image as big as it fits, but no bigger than it is."""
+        scale = min(1.0, CONTENT_WIDTH / float(image.width),
+                IMAGE_HEIGHT / float(image.height))
+        width = image.width * scale
+        height = image.height * scale
+
+        self.make_room(height + 12)
+        self.skip(height + 6)
+        if path not in self.images:
+            self.images.append(path)
+        self.operations.append('q %.2f 0 0 %.2f %.2f %.2f cm /Im%d Do Q' %
+                (width, height, MARGIN, self.top, self.images.index(path)))
+        self.skip(6)
+
+    def finish(self):
+        """
+        Returns the pages laid out, as compressed content streams along with
+        the paths of the images they draw.
+        """
+        return [(zlib.compress('\n'.join(operations)), images)
+                for operations, images in self.pages]
+
+
+class RenderedCard(object):
+    """The pages of a recipe card, and the images they draw by path."""
+    def __init__(self, pages, images):
+        self.pages = pages
+        self.images = images
+
+# The images a worker has read, by path
+imageCache = {}
+
+def cached_image(path):
+    """Reads an image, or takes it from the ones read already."""
+    if path not in imageCache:
+        if len(imageCache) >= IMAGE_CACHE_SIZE:
+            imageCache.clear()
+        imageCache[path] = read_image(path)
+    return imageCache[path]
+
+def recipe_card(recipe, servings=None):
+    """
+    Takes what a recipe card shows out of a recipe, as plain values that can
+    be handed to a worker process: its name, course, serving size,
+    ingredients as (name, quantity, unit), instructions and images. The
+    ingredients are scaled to a serving size, if one is given and the recipe
+    has one to scale from.
+    """
+    if servings:
+        try:
+            ingredients = recipe.scale_ingredients(servings, exact=True)
+        except ValueError:
+            # A recipe of no servings is printed the way it is
+            servings = None
+    if not servings:
+        servings = recipe.servingSize
+        ingredients = recipe.ingredients
+    return (recipe.name, recipe.course, servings,
+            [(ingredient['name'], ingredient['quantity'], ingredient['unit'])
+                for ingredient in ingredients],
+            list(recipe.instructions), list(recipe.images))
+
+def format_servings(servings):
+    """Formats a serving size, without the .0 of whole numbers."""
+    return format_amount(servings, '')
+
+def render_card(card):
+    """Lays out and draws a recipe card, as a RenderedCard."""
+    name, course, servings, ingredients, instructions, images = card
+    layout = PageLayout()
+
+    layout.paragraph(name, 'title')
+    layout.paragraph(course + u'  \u2022  Serves ' +
+            format_servings(servings), 'subtitle')
+    layout.rule()
+
+    # The first image that can be read, if any
+    drawn = {}
+    for path in images:
+        image = cached_image(path)
+        if image is not None:
+            layout.image(path, image)
+            drawn[path] = image
+            break
+
+    layout.heading('Ingredients')
+    for ingredientName, quantity, unit in ingredients:
+        layout.paragraph(format_amount(quantity, unit) + ' ' +
+                ingredientName, 'body', BULLET)
+
+    layout.skip(6)
+    layout.heading('Instructions')
+    for number, instruction in enumerate(instructions):
+        layout.paragraph(instruction, 'body', str(number + 1) + '. ')
+        layout.skip(3)
+
+    return RenderedCard(layout.finish(), drawn)
+
+def render_batch(batch):
+    """Renders a batch of recipe cards. This is what the workers run."""
+    return [render_card(card) for card in batch]
+
+def render_cards(cards, workers=None):
+    """
+    Yields the given recipe cards rendered, in order. They are
+    rendered by as many worker processes as there are processors, or the
+    given number, unless there is only one batch to render.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    batches = [cards[start:start + BATCH_SIZE] for start in
+            xrange(0, len(cards), BATCH_SIZE)]
+
+    if workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            for card in render_batch(batch):
+                yield card
+        return
+
+    pool = multiprocessing.Pool(min(workers, len(batches)))
+    try:
+        for rendered in pool.imap(render_batch, batches):
+            for card in rendered:
+                yield card
+    finally:
+        # Also stops the workers if the binder was cancelled
+        pool.terminate()
+        pool.join()
+
+def aggregate_ingredients(cards):
+    """
+    Adds up the ingredients of recipe cards. Ingredients with the same name
+    and unit are added together. Returns a list of (name, quantity, unit),
+    sorted by name.
+    """
+    totals = {}
+    for card in cards:
+        for name, quantity, unit in card[3]:
+            key = (name.strip().lower(), unit.strip().lower())
+            if key in totals:
+                totals[key][1] += exact_quantity(quantity)
+            else:
+                totals[key] = [name.strip(), exact_quantity(quantity),
+                        unit.strip()]
+    return [tuple(totals[key]) for key in sorted(totals)]
+
+def render_shopping_list(cards, pantry=None):
+    """
+    Lays out the shopping list of the ingredients of recipe cards, as a
+    RenderedCard without images. What is in the pantry, if given one, is
+    taken off.
+    """
+    layout = PageLayout()
+    layout.paragraph('Shopping List', 'title')
+    # Which recipes it is for, unless there are too many to name
+    if len(cards) <= SHOPPING_LIST_NAMES:
+        description = ', '.join([card[0] for card in cards])
+    else:
+        description = 'For ' + str(len(cards)) + ' recipes'
+    ingredients = aggregate_ingredients(cards)
+    if pantry is not None and len(pantry):
+        ingredients = pantry.net_list(ingredients)
+        description += ', less what is in the pantry'
+    layout.paragraph(description, 'subtitle')
+    layout.rule()
+
+    for name, quantity, unit in ingredients:
+        layout.paragraph(format_amount(quantity, unit) + ' ' + name, 'body',
+                BULLET)
+
+    return RenderedCard(layout.finish(), {})
+
+def footer(number, count):
+    """Returns the compressed content stream of a page's page number."""
+    font, size, leading = STYLES['footer']
+    data = 'Page ' + str(number) + ' of ' + str(count)
+    x = (PAGE_WIDTH - text_width(data, font) * size / 1000.0) / 2
+    return zlib.compress('0.4 g BT /' + font + ' ' + str(size) + ' Tf ' +
+            '%.2f %.2f Td (' % (x, MARGIN) + data + ') Tj ET')
+
+def write_binder(path, cards, printCards=True, shoppingList=True,
+        workers=None, progress=None, cancelled=None, pantry=None):
+    """
+    Writes a PDF binder of recipe cards (see recipe_card()): the cards, the
+    shopping list of all of them, or both. The shopping list leaves out
+    what is in the pantry, if given one.
+
+    progress is called with the number of cards written so far, and
+    cancelled is asked between cards whether to stop, in which case
+    BinderCancelled is raised and the file is removed. Returns the number of
+    pages written.
+    """
+    file = open(path, 'wb')
+    try:
+        writer = PdfWriter(file)
+        pagesNumber = writer.reserve()
+        # Every page's content stream and images
+        pages = []
+        imageNumbers = {}
+
+        def add_card(card):
+            for imagePath, image in card.images.items():
+                if imagePath not in imageNumbers:
+                    imageNumbers[imagePath] = writer.add_image(image)
+            for content, images in card.pages:
+                pages.append((writer.add_stream('/Filter /FlateDecode',
+                    content), [imageNumbers[imagePath] for imagePath in
+                        images]))
+
+        printed = cards if printCards else []
+        for count, card in enumerate(render_cards(printed, workers)):
+            if cancelled is not None and cancelled():
+                raise BinderCancelled()
+            add_card(card)
+            if progress is not None:
+                progress(count + 1)
+
+        if shoppingList:
+            add_card(render_shopping_list(cards, pantry))
+
+        pageNumbers = []
+        for number, (content, images) in enumerate(pages):
+            pageFooter = writer.add_stream('/Filter /FlateDecode',
+                    footer(number + 1, len(pages)))
+            pageNumbers.append(writer.add_page(pagesNumber,
+                [content, pageFooter], images))
+        writer.close(pagesNumber, pageNumbers)
+    except:
+        # Don't leave half a binder behind
+        file.close()
+        os.remove(path)
+        raise
+    file.close()
+
+    return len(pages)
+
+
+class BinderJob(object):
+    """
+    Writes a binder in a background thread. The recipes, and the pantry if
+    given one, are copied when the job is made, so they can go on being
+    edited while it runs. The GUI polls done, finished and error to follow
+    it.
+    """
+    def __init__(self, path, recipes, servings=None, workers=None,
+            pantry=None):
+        self.path = path
+        self.cards = [recipe_card(recipe, servings) for recipe in recipes]
+        self.workers = workers
+        self.pantry = None
+        if pantry is not None:
+            self.pantry = pantry.copy()
+
+        # How many cards have been written, and how many there are
+        self.done = 0
+        self.total = len(recipes)
+        self.pages = 0
+        self.finished = False
+        self.cancelled = False
+        # What went wrong, if anything did
+        self.error = None
+
+        self.thread = None
+
+    def start(self):
+        """Starts writing the binder."""
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """Asks the job to stop. The file it was writing is removed."""
+        self.cancelled = True
+
+    def advance(self, done):
+        self.done = done
+
+    def run(self):
+        try:
+            self.pages = write_binder(self.path, self.cards,
+                    workers=self.workers, progress=self.advance,
+                    cancelled=lambda: self.cancelled, pantry=self.pantry)
+        except BinderCancelled:
+            pass
+        except Exception, error:
+            # Anything that goes wrong is shown, rather than leaving the
+            # GUI waiting on a job that never finishes
+            self.error = error
+        finally:
+            self.finished = True
@@ -0,0 +1,243 @@
+###############################################################################
+#
+# codec.py
+#
+# The JSON codec of the application. Every module encodes and decodes JSON
+# through here, and the fastest JSON library installed is picked at runtime,
+# separately for decoding and encoding: no single library is the fastest at
+# both (see the json_codecs benchmark, which times every installed library
+# over the same recipes).
+#
+# The libraries don't all write JSON the same way (escaping, float digits,
+# spacing), so a library is only used to encode with a given set of options
+# once it has written a set of probe documents byte for byte the same as the
+# standard library does. Decoders have to give back the same values for the
+# probe documents too. Libraries that don't are skipped for those options.
+#
+# Set PYRECIPE_JSON to the name of a library (like 'json') to use only that
+# one.
+#
+###############################################################################
+
+import os
+
+# The standard library is what every other library is compared against
+import json as referenceJson
+
+# The libraries that can be used, fastest first as measured by the json_codecs
+# benchmark over recipe documents. Libraries without their C speedups are
+# tried only after every library that has them. ujson would be the fastest
+# encoder, but writes floats its own way (1e22 instead of 1e+22), so it only
+# gets used if a later version writes them like the standard library does
+DECODERS = ['simplejson', 'ujson', 'json']
+ENCODERS = ['ujson', 'json', 'simplejson']
+
+# Libraries have to handle these the same way as the standard library to be
+# used
+PROBES = [
+    {'name': u'Cr\xe8me br\xfbl\xe9e', 'course': 'Dessert',
+        'serving_size': 4, 'images': ['./images/a/b.png'],
+        'ingredients': [{'name': 'heavy cream', 'quantity': 0.1,
+            'unit': 'cup'}, {'name': 'sugar', 'quantity': 1e-07,
+            'unit': 'tbsp'}, {'name': 'egg yolk', 'quantity': 6,
+            'unit': 'pc'}],
+        'instructions': ['Heat to 80\xc2\xb0C.\n\tStir "gently" \\ slowly',
+            u'\u2028 \U0001f370 </script>', '']},
+    [1.5, 2.0, 0.30000000000000004, 123456789.125, 1e+22, -0.0, 2 ** 53,
+        -17, True, False, None, [], {}, '', u'\x00\x1f\x7f'],
+]
+
+def load_library(name):
+    """Imports a JSON library. Returns None if it isn't installed."""
+    try:
+        module = __import__(name)
+    except ImportError:
+        return None
+    return module
+
+def has_speedups(name, module):
+    """Returns whether a JSON library runs on its C speedups."""
+    if name == 'json':
+        import json.decoder
+        import json.encoder
+        return (json.decoder.c_scanstring is not None and
+                json.encoder.c_make_encoder is not None)
+    if name == 'simplejson':
+        return module._import_c_make_encoder() is not None
+    # The others are written in C altogether
+    return True
+
+
+class Backend(object):
+    """A JSON library, with the calls of every library made to look alike."""
+    def __init__(self, name, module):
+        self.name = name
+        self.module = module
+        self.speedups = has_speedups(name, module)
+
+    def loads(self, data):
+        return self.module.loads(data)
+
+    def dumps(self, value, separators=None, indent=None, sortKeys=False):
+        if self.name == 'ujson':
+            # ujson can only leave out whitespace, and escapes slashes
+            # unless told not to
+            if separators != (',', ':') or indent is not None:
+                raise TypeError('ujson cannot lay JSON out like that')
+            return self.module.dumps(value, ensure_ascii=True,
+                    sort_keys=sortKeys, escape_forward_slashes=False)
+        return self.module.dumps(value, separators=separators, indent=indent,
+                sort_keys=sortKeys)
+
+    def raw_decoder(self):
+        """
+        Returns the raw_decode(string, index) function of the library, or
+        None if it has none.
+        """
+        if not hasattr(self.module, 'JSONDecoder'):
+            return None
+        return self.module.JSONDecoder().raw_decode
+
+
+class Codec(object):
+    """
+    Picks the fastest compatible library for decoding and for every set of
+    encoding options, the first time they are needed.
+    """
+    def __init__(self, only=None):
+        self.backends = []
+        for name in [only] if only else ENCODERS + DECODERS:
+            if name in [backend.name for backend in self.backends]:
+                continue
+            module = load_library(name)
+            if module is not None:
+                self.backends.append(Backend(name, module))
+        if not self.backends:
+            raise ImportError('No JSON library named ' + str(only))
+
+        self.decoder = None
+        self.rawDecoder = None
+        # (separators, indent, sort keys) to the backend encoding with them
+        self.encoders = {}
+
+    def ranked(self, preference):
+        """
+        Returns the installed backends in the order they should be tried:
+        the ones with their C speedups first, fastest first.
+        """
+        def rank(backend):
+            if backend.name in preference:
+                position = preference.index(backend.name)
+            else:
+                position = len(preference)
+            return (not backend.speedups, position)
+        return sorted(self.backends, key=rank)
+
+    def decodes_like_reference(self, backend):
+        """Returns whether a backend decodes the probes correctly."""
+        for probe in PROBES:
+            text = referenceJson.dumps(probe)
+            try:
+                if backend.loads(text) != referenceJson.loads(text):
+                    return False
+            except (ValueError, TypeError, OverflowError):
+                return False
+        return True
+
+    def encodes_like_reference(self, backend, options):
+        """
+        Returns whether a backend encodes the probes byte for byte like the
+        standard library does, with the given options.
+        """
+        separators, indent, sortKeys = options
+        for probe in PROBES:
+            try:
+                if (backend.dumps(probe, separators, indent, sortKeys) !=
+                        referenceJson.dumps(probe, separators=separators,
+                            indent=indent, sort_keys=sortKeys)):
+                    return False
+            except (ValueError, TypeError, OverflowError):
+                return False
+        return True
+
+    def get_decoder(self):
+        """Returns the backend used for decoding."""
+        if self.decoder is None:
+            for backend in self.ranked(DECODERS):
+                if self.decodes_like_reference(backend):
+                    self.decoder = backend
+                    break
+            else:
+                self.decoder = self.ranked(DECODERS)[-1]
+        return self.decoder
+
+    def get_encoder(self, options):
+        """Returns the backend used for encoding with the given options."""
+        encoder = self.encoders.get(options)
+        if encoder is None:
+            for backend in self.ranked(ENCODERS):
+                if self.encodes_like_reference(backend, options):
+                    encoder = backend
+                    break
+            else:
+                # Nothing writes it like the standard library, which must be
+                # the one asked for
+                encoder = self.ranked(ENCODERS)[-1]
+            self.encoders[options] = encoder
+        return encoder
+
+    def get_raw_decoder(self):
+        """
+        Returns the fastest raw_decode(string, index) function, which decodes
+        the value starting at the index and returns it with the index where
+        it ends.
+        """
+        if self.rawDecoder is None:
+            for backend in self.ranked(DECODERS):
+                rawDecoder = backend.raw_decoder()
+                if (rawDecoder is not None and
+                        self.decodes_like_reference(backend)):
+                    self.rawDecoder = rawDecoder
+                    break
+            else:
+                self.rawDecoder = referenceJson.JSONDecoder().raw_decode
+        return self.rawDecoder
+
+
+# The codec used by the whole application
+sharedCodec = None
+
+def get_codec():
+    """Returns the codec shared by the application."""
+    global sharedCodec
+    if sharedCodec is None:
+        sharedCodec = Codec(os.environ.get('PYRECIPE_JSON'))
+    return sharedCodec
+
+def loads(data):
+    """Decodes a JSON document. Raises ValueError if it isn't valid JSON."""
+    return get_codec().get_decoder().loads(data)
+
+def dumps(value, separators=None, indent=None, sort_keys=False):
+    """
+    Encodes a value as JSON, byte for byte the way the standard library's
+    json.dumps does with the same options.
+    """
+    if separators is not None:
+        separators = tuple(separators)
+    return get_codec().get_encoder((separators, indent,
+        sort_keys)).dumps(value, separators, indent, sort_keys)
+
+def raw_decoder():
+    """
+    Returns a raw_decode(string, index) function, for decoding JSON values
+    out of the middle of a string.
+    """
+    return get_codec().get_raw_decoder()
+
+def describe():
+    """Describes the libraries in use, for the startup messages."""
+    codec = get_codec()
+    return ('decoding with ' + codec.get_decoder().name +
+            ', encoding with ' + codec.get_encoder(((',', ':'), None,
+                False)).name)
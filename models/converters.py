@@ -0,0 +1,549 @@
+###############################################################################
+#
+# converters.py
+#
+# Converts collections of recipes kept in other formats into the library:
+# spreadsheets saved as CSV (a row per recipe), Markdown files (a heading per
+# recipe, with "Ingredients" and "Instructions" sections) and plain text
+# files written the same way. Every format is a converter plugin, registered
+# by name and file extensions, made of two functions: one that splits a file
+# into the pieces of text of its recipes, and one that builds a recipe (a
+# dictionary, the way .rcpe files have them) out of a piece.
+#
+# Files are never read into memory whole. Splitting is done as the file is
+# read, in the main process, and the pieces are built into recipes (and
+# encoded as .rcpe, when converting to files) by worker processes, a batch at
+# a time. Only a few batches are handed out at once, so memory stays bounded
+# however many recipes the file has. From the top folder of the project:
+#
+#   python -m models.converters recipes.csv notes.md --output ./recipes/
+#   python -m models.converters cookbook.txt --output library.json
+#
+###############################################################################
+
+import collections
+import csv
+import multiprocessing
+import os
+import re
+import sys
+
+from models import codec
+
+from models.ingredientparser import COUNT_UNIT, parse_lines
+from models.recipemodel import RecipeModel
+from models.website import slugify
+
+# How many recipes a worker process builds at a time
+BATCH_SIZE = 256
+
+# How many batches every worker process is handed at most before the ones
+# already built are taken back
+BATCHES_PER_WORKER = 2
+
+# What recipes that don't say are taken to be
+DEFAULT_COURSE = 'Main'
+DEFAULT_SERVING_SIZE = 4.0
+
+# Courses as they are written, to the courses of the library. Courses that
+# aren't here are main courses
+COURSES = {}
+for course, spellings in [
+        ('Appetizer', ['appetizer', 'appetizers', 'starter', 'starters',
+            'snack', 'snacks', 'side', 'sides', 'side dish', 'salad',
+            'soup', 'hors d\'oeuvre', 'hors d\'oeuvres']),
+        ('Dessert', ['dessert', 'desserts', 'sweet', 'sweets', 'pudding',
+            'cake', 'cakes', 'cookies', 'baking', 'pastry'])]:
+    for spelling in spellings:
+        COURSES[spelling] = course
+
+# Names of the sections of a recipe, in Markdown and plain text
+INGREDIENT_SECTIONS = frozenset(['ingredients', 'ingredient list',
+    'you will need', 'you\'ll need', 'what you need'])
+INSTRUCTION_SECTIONS = frozenset(['instructions', 'directions', 'method',
+    'steps', 'preparation', 'how to make it'])
+OTHER_SECTIONS = frozenset(['notes', 'note', 'tips', 'variations',
+    'serving suggestions', 'nutrition', 'source'])
+SECTIONS = INGREDIENT_SECTIONS | INSTRUCTION_SECTIONS | OTHER_SECTIONS
+
+# Lines longer than this don't name a section, even with some markup
+SECTION_LENGTH = max([len(name) for name in SECTIONS]) + 8
+
+# Columns of CSV files, as they are written (in lower case), to the fields
+# of recipes
+COLUMNS = {}
+for field, spellings in [
+        ('name', ['name', 'title', 'recipe', 'recipe name']),
+        ('course', ['course', 'category', 'type', 'meal']),
+        ('serving_size', ['servings', 'serving size', 'serving_size',
+            'serves', 'yield', 'portions']),
+        ('ingredients', ['ingredients', 'ingredient list']),
+        ('instructions', ['instructions', 'directions', 'method', 'steps',
+            'preparation']),
+        ('images', ['image', 'images', 'photo', 'picture'])]:
+    for spelling in spellings:
+        COLUMNS[spelling] = field
+
+# Markdown headings, and what they say
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s*(.*?)[\s#]*$')
+
+# Metadata lines: "Serves: 4", "Serves 2", "**Course:** Dessert", "Yield: 6
+# servings"
+META_PATTERN = re.compile(r'^[*_]*(serves|servings|serving size|yield|makes|'
+        r'portions|course|category)\b[*_]*\s*:?[*_]*\s*(.+)$',
+        re.IGNORECASE)
+
+# Images in Markdown, "![Cake](images/cake.jpg)", or in plain text
+IMAGE_PATTERN = re.compile(r'^!\[[^\]]*\]\(([^)\s]+)[^)]*\)$|^(?:image|photo|'
+        r'picture)\s*:\s*(\S+)$', re.IGNORECASE)
+
+# List items: "- flour", "* flour", "+ flour", "1. Preheat", "2) Mix"
+ITEM_PATTERN = re.compile(u'^(?:[-*+\u2022]|\\d+[.)])\\s+(.*)$')
+
+# Steps written out in a single line, in a CSV cell: "1. Mix. 2. Bake."
+NUMBERED_STEPS_PATTERN = re.compile(r'(?:^|\s+)\d+[.)]\s+')
+
+# Lines that end a recipe in plain text files: "---", "===", "***", or a
+# form feed
+SEPARATOR_PATTERN = re.compile(r'^\s*(?:[-=*_~]{3,}|\f)\s*$')
+
+# The first number of a serving size, "6-8 people"
+SERVINGS_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+def text(value):
+    """Returns text read out of a file as unicode, stripped."""
+    if isinstance(value, str):
+        value = value.decode('utf-8', 'replace')
+    return value.strip()
+
+def read_course(value):
+    """Returns the course of the library a course as written belongs to."""
+    return COURSES.get(value.strip().lower(), DEFAULT_COURSE)
+
+def read_serving_size(value):
+    """
+    Returns the serving size a serving size as written ("6-8 people") stands
+    for, or the default one if it has no number.
+    """
+    match = SERVINGS_PATTERN.search(value)
+    if match is None or float(match.group()) <= 0:
+        return DEFAULT_SERVING_SIZE
+    return float(match.group())
+
+def section_name(value):
+    """Returns the name of a section as written, "Ingredients:", to look up."""
+    return value.strip().strip('*_:').strip().lower()
+
+def make_recipe(name, course, servingSize, ingredientLines, instructions,
+        images):
+    """
+    Returns a recipe, a dictionary the way .rcpe files have them, with the
+    ingredients parsed out of their lines. Lines the parser can't read are
+    kept whole as the name of an ingredient, one of it, so nothing is lost
+    in a conversion; only headers ("For the sauce:") are left out. Returns
+    None if it has no name, or neither ingredients nor instructions.
+    """
+    ingredients = []
+    for line, parsed in zip(ingredientLines, parse_lines(ingredientLines)):
+        if parsed is None:
+            line = text(line)
+            if not line or line.endswith(':'):
+                continue
+            parsed = (line, 1.0, COUNT_UNIT)
+        ingredients.append({'name': parsed[0], 'quantity': parsed[1],
+            'unit': parsed[2]})
+    if not name or not (ingredients or instructions):
+        return None
+    return {'name': name, 'course': course, 'serving_size': servingSize,
+            'ingredients': ingredients, 'instructions': instructions,
+            'images': images}
+
+
+# The converters, by name: their file extensions, how they split a file into
+# the pieces of its recipes, and how they build a recipe out of a piece
+converters = collections.OrderedDict()
+
+def register_converter(name, extensions, split, build):
+    """
+    Registers a converter plugin. split(file) yields the pieces of text of
+    the recipes of an open file, and build(piece) returns the recipe of a
+    piece, or None if there isn't one. Pieces and recipes are pickled on
+    their way to and from the worker processes, and build() runs in them,
+    so it must be a function of a module.
+    """
+    converters[name] = (tuple([extension.lower() for extension in
+        extensions]), split, build)
+
+def converter_for(path):
+    """
+    Returns the name of the converter for a file, by its extension. Raises
+    ValueError if there is none.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    for name, (extensions, split, build) in converters.items():
+        if extension in extensions:
+            return name
+    raise ValueError('No converter reads ' + (extension or 'files without '
+        'an extension') + ' files')
+
+def name_filter():
+    """Returns the file dialog name filter of every converter."""
+    return ';;'.join([name + '(' + ' '.join(['*' + extension for extension
+        in extensions]) + ')' for name, (extensions, split, build) in
+        converters.items()])
+
+
+def split_csv(file):
+    """
+    Yields the rows of a CSV file, as dictionaries of the fields of recipes
+    to their cells. The first row names the columns.
+    """
+    reader = csv.reader(file)
+    fields = None
+    for row in reader:
+        if fields is None:
+            # A byte order mark comes before the first column
+            if row:
+                row[0] = row[0].lstrip('\xef\xbb\xbf')
+            fields = [COLUMNS.get(text(column).lower()) for column in row]
+            if 'name' not in fields:
+                raise ValueError('The CSV file has no name column')
+            continue
+        yield dict([(field, cell) for field, cell in zip(fields, row) if
+            field is not None])
+
+def split_cell(cell):
+    """
+    Returns the lines of a cell that holds a list: a line per item, or items
+    separated by semicolons or bars if it is a single line.
+    """
+    cell = text(cell)
+    if '\n' in cell:
+        lines = cell.splitlines()
+    elif '|' in cell:
+        lines = cell.split('|')
+    else:
+        lines = cell.split(';')
+    return [line.strip() for line in lines if line.strip()]
+
+def build_csv(row):
+    """Builds the recipe of a row of a CSV file."""
+    instructions = text(row.get('instructions', ''))
+    if NUMBERED_STEPS_PATTERN.match(instructions) and '\n' not in instructions:
+        # All the steps in a single line, numbered
+        instructions = NUMBERED_STEPS_PATTERN.split(instructions)
+    else:
+        instructions = split_cell(instructions)
+    instructions = [ITEM_PATTERN.sub(r'\1', step.strip()) for step in
+            instructions if step.strip()]
+
+    return make_recipe(text(row.get('name', '')),
+            read_course(text(row.get('course', ''))),
+            read_serving_size(text(row.get('serving_size', ''))),
+            split_cell(row.get('ingredients', '')), instructions,
+            split_cell(row.get('images', '')))
+
+def split_markdown(file):
+    """
+    Yields the lines of every recipe of a Markdown file. A recipe starts at
+    a heading that doesn't name a section, and goes on until the next one at
+    the same level or above. Headings before any section of a recipe (the
+    title of the whole collection) start the next recipe too.
+    """
+    lines = []
+    level = None
+    sectioned = False
+    for line in file:
+        heading = HEADING_PATTERN.match(line.strip())
+        if heading is not None:
+            if section_name(heading.group(2)) in SECTIONS:
+                sectioned = True
+            elif (level is None or not sectioned or
+                    len(heading.group(1)) <= level):
+                if lines:
+                    yield lines
+                lines = []
+                level = len(heading.group(1))
+                sectioned = False
+        lines.append(line)
+    if lines:
+        yield lines
+
+def build_lines(lines, markdown):
+    """
+    Builds the recipe of the lines of a Markdown or plain text recipe. The
+    first line (or heading) is the name, and the lines under a section
+    heading ("Ingredients", "Directions:") are its ingredients or steps, a
+    line each. Lines before any section can say the serving size and
+    course ("Serves: 4").
+    """
+    name = None
+    course = DEFAULT_COURSE
+    servingSize = DEFAULT_SERVING_SIZE
+    ingredients = []
+    instructions = []
+    images = []
+    section = None
+
+    # The whole recipe is decoded at once, rather than a line at a time
+    for line in text(''.join(lines)).splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        heading = markdown and line[0] == '#' and HEADING_PATTERN.match(line)
+        if heading:
+            line = heading.group(2)
+        if name is None:
+            name = line
+            continue
+
+        # A section heading: a Markdown heading, or a line of its own that
+        # names a section, "Ingredients:"
+        sectionName = (heading or len(line) <= SECTION_LENGTH) and (
+                section_name(line))
+        if heading or sectionName in SECTIONS:
+            if sectionName in INGREDIENT_SECTIONS:
+                section = 'ingredients'
+            elif sectionName in INSTRUCTION_SECTIONS:
+                section = 'instructions'
+            elif sectionName in OTHER_SECTIONS:
+                section = None
+            # Any other heading is a part of the section it is in ("For
+            # the sauce"), and isn't an ingredient or a step itself
+            continue
+
+        image = (line[0] == '!' or ':' in line) and IMAGE_PATTERN.match(line)
+        if image:
+            images.append(image.group(1) or image.group(2))
+            continue
+
+        item = ITEM_PATTERN.match(line)
+        if item is not None:
+            line = item.group(1).strip()
+        if section == 'ingredients':
+            ingredients.append(line)
+        elif section == 'instructions':
+            instructions.append(line)
+        elif section is None and not ingredients and not instructions:
+            meta = META_PATTERN.match(line)
+            if meta is not None:
+                if meta.group(1).lower() in ('course', 'category'):
+                    course = read_course(meta.group(2))
+                else:
+                    servingSize = read_serving_size(meta.group(2))
+
+    return make_recipe(name, course, servingSize, ingredients, instructions,
+            images)
+
+def build_markdown(lines):
+    """Builds the recipe of the lines of a Markdown recipe."""
+    return build_lines(lines, True)
+
+def split_text(file):
+    """
+    Yields the lines of every recipe of a plain text file. Recipes are
+    separated by a line of dashes or equals signs ("---"), a form feed, or
+    two blank lines in a row.
+    """
+    lines = []
+    blank = 0
+    for line in file:
+        if SEPARATOR_PATTERN.match(line):
+            blank = 2
+        elif not line.strip():
+            blank += 1
+            continue
+        else:
+            if blank >= 2 and lines:
+                yield lines
+                lines = []
+            blank = 0
+            lines.append(line)
+            continue
+        if lines:
+            yield lines
+        lines = []
+    if lines:
+        yield lines
+
+def build_text(lines):
+    """Builds the recipe of the lines of a plain text recipe."""
+    return build_lines(lines, False)
+
+register_converter('Spreadsheet', ['.csv'], split_csv, build_csv)
+register_converter('Markdown', ['.md', '.markdown'], split_markdown,
+        build_markdown)
+register_converter('Text', ['.txt', '.text'], split_text, build_text)
+
+
+def build_batch(arguments):
+    """
+    Builds the recipes of a batch of pieces, in a worker process, with the
+    named converter. If asked to, recipes are encoded as .rcpe, and come
+    back as pairs of their names and .rcpe text. Pieces that aren't recipes
+    are None.
+    """
+    name, pieces, encode = arguments
+    build = converters[name][2]
+    recipes = [build(piece) for piece in pieces]
+    if encode:
+        recipes = [recipe and (recipe['name'], codec.dumps(recipe,
+            separators=(',', ':'))) for recipe in recipes]
+    return recipes
+
+
+class Conversion(object):
+    """
+    Iterates over the recipes of a file in another format, one at a time:
+    dictionaries the way .rcpe files have them, or pairs of their names and
+    .rcpe text if encode is set. The recipes are built by as many worker
+    processes as there are processors, or the given number, and come out in
+    the order of the file. Keeps count of the recipes converted and of the
+    pieces of the file that weren't recipes.
+    """
+    def __init__(self, file, name, workers=None, encode=False,
+            batchSize=BATCH_SIZE):
+        self.file = file
+        self.name = name
+        self.encode = encode
+        self.batchSize = batchSize
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+        self.count = 0
+        self.skipped = 0
+
+    def batches(self):
+        """Yields the pieces of the recipes of the file, a batch at a time."""
+        batch = []
+        for piece in converters[self.name][1](self.file):
+            batch.append(piece)
+            if len(batch) >= self.batchSize:
+                yield (self.name, batch, self.encode)
+                batch = []
+        if batch:
+            yield (self.name, batch, self.encode)
+
+    def built(self):
+        """
+        Yields the built batches, in order. With worker processes, only a
+        few batches are handed out at once, rather than the whole file.
+        """
+        if self.workers <= 1:
+            for batch in self.batches():
+                yield build_batch(batch)
+            return
+
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            pending = collections.deque()
+            for batch in self.batches():
+                pending.append(pool.apply_async(build_batch, (batch,)))
+                if len(pending) >= self.workers * BATCHES_PER_WORKER:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __iter__(self):
+        for recipes in self.built():
+            for recipe in recipes:
+                if recipe is None:
+                    self.skipped += 1
+                else:
+                    self.count += 1
+                    yield recipe
+
+def iter_converted(file, name, workers=None):
+    """
+    Yields the recipes of a file in another format one at a time as
+    RecipeModels, built with the named converter.
+    """
+    for raw_recipe in Conversion(file, name, workers):
+        recipe = RecipeModel()
+        recipe.load_recipe(raw_recipe)
+        yield recipe
+
+def convert_file(path, output, workers=None, name=None):
+    """
+    Converts a file in another format into .rcpe files in the output folder,
+    named after the recipes, or into a single library export if the output
+    ends in .json. The converter is picked by the extension of the file, or
+    by its name. Returns the Conversion, for its counts.
+    """
+    if name is None:
+        name = converter_for(path)
+    library = output.lower().endswith('.json')
+    if not library and not os.path.isdir(output):
+        os.makedirs(output)
+
+    source = open(path, 'rb')
+    conversion = Conversion(source, name, workers, encode=True)
+    try:
+        if library:
+            # The recipes of a library export, written as they are built
+            target = open(output, 'wb')
+            try:
+                target.write('[')
+                for index, (recipeName, document) in enumerate(conversion):
+                    if index:
+                        target.write(',\n')
+                    target.write(document)
+                target.write(']\n')
+            finally:
+                target.close()
+        else:
+            used = set([os.path.splitext(fileName)[0] for fileName in
+                os.listdir(output)])
+            for recipeName, document in conversion:
+                base = slug = slugify(recipeName)
+                number = 1
+                while slug in used:
+                    number += 1
+                    slug = base + '-' + str(number)
+                used.add(slug)
+
+                target = open(os.path.join(output, slug + '.rcpe'), 'wb')
+                try:
+                    target.write(document)
+                finally:
+                    target.close()
+    finally:
+        source.close()
+    return conversion
+
+def main(arguments):
+    """Converts the files given on the command line."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Converts recipe '
+            'collections in CSV, Markdown or plain text into .rcpe files.')
+    parser.add_argument('files', nargs='+', help='the files to convert')
+    parser.add_argument('--output', default='./recipes/', help='the folder '
+            'to write .rcpe files into, or a .json file to write a library '
+            'export to')
+    parser.add_argument('--format', choices=list(converters), help='the '
+            'converter to use, rather than the one for the file extension')
+    parser.add_argument('--workers', type=int, help='how many worker '
+            'processes build the recipes (one per processor by default)')
+    options = parser.parse_args(arguments)
+
+    if options.output.lower().endswith('.json') and len(options.files) > 1:
+        parser.error('Only a single file can be converted into a .json file')
+
+    for path in options.files:
+        try:
+            conversion = convert_file(path, options.output, options.workers,
+                    options.format)
+        except (IOError, OSError, ValueError, csv.Error), error:
+            print >> sys.stderr, path + ': ' + str(error)
+            return 1
+        print (path + ': ' + str(conversion.count) + ' recipes converted, ' +
+                str(conversion.skipped) + ' skipped')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
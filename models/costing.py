@@ -0,0 +1,141 @@
+###############################################################################
+#
+# costing.py
+#
+# Computes how much recipes cost to make, from a local ingredient price table
+# (by default ./data/prices.json), using the food table machinery in
+# foodtable.py. Costs are cached per recipe, and when the prices change the
+# costs of the whole library are recomputed in one batched pass.
+#
+###############################################################################
+
+from models import codec
+
+from models.foodtable import *
+
+# Where the price table is loaded from by default
+DEFAULT_PRICE_TABLE_PATH = './data/prices.json'
+
+class PriceTable(FoodTable):
+    """
+    A table of ingredient prices per gram. The price table file maps food
+    names to the price of a given quantity and unit ("price", "quantity",
+    "unit"), plus the density in grams per milliliter ("density") and the
+    weight of one of some other unit in grams ("grams_per") for converting
+    recipe quantities.
+    """
+    def __init__(self, currency, prices):
+        self.currency = currency
+
+        foods = {}
+        for name, entry in prices.items():
+            density = entry.get('density', 1.0)
+            gramsPer = entry.get('grams_per', {})
+            grams = grams_per_unit(entry['unit'], density, gramsPer)
+            if not grams or not entry['quantity']:
+                print 'Price of ' + name + ' has an unknown unit, skipped'
+                continue
+
+            foods[name] = ([entry['price'] / (grams * entry['quantity'])],
+                    density, gramsPer)
+
+        super(PriceTable, self).__init__(['cost'], foods)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PRICE_TABLE_PATH):
+        """
+        Loads a price table file. Raises ValueError or KeyError if the file
+        is broken.
+        """
+        file = open(path, 'r')
+        raw_table = codec.loads(file.read())
+        file.close()
+
+        if not isinstance(raw_table, dict):
+            raise ValueError('Not a price table: ' + path)
+
+        return cls(raw_table.get('currency', ''), raw_table['prices'])
+
+
+class RecipeCost(object):
+    """The cost of making a single recipe."""
+    def __init__(self, total, servingSize, missing, currency):
+        self.total = total
+        self.servingSize = servingSize
+        # Names of the ingredients that have no price
+        self.missing = missing
+        self.currency = currency
+
+    def for_servings(self, servingSize):
+        """
+        Returns the cost of making the recipe for the given number of
+        people. Scaled the same way as the shopping list scales ingredients.
+        """
+        if not self.servingSize:
+            return self.total
+        return (self.total / float(self.servingSize)) * servingSize
+
+    def per_serving(self):
+        """Returns the cost of a single serving."""
+        return self.for_servings(1)
+
+    def is_complete(self):
+        """Returns whether every ingredient of the recipe had a price."""
+        return len(self.missing) == 0
+
+
+def format_money(amount, currency=''):
+    """Formats an amount of money, like "USD 12.50"."""
+    if currency:
+        return currency + ' ' + ('%.2f' % amount)
+    return '%.2f' % amount
+
+
+class CostingEngine(TotalsEngine):
+    """Computes and caches the RecipeCost of recipes."""
+    def make_result(self, recipe, entry):
+        return RecipeCost(entry.totals[0], recipe.servingSize, entry.missing,
+                self.table.currency)
+
+
+# The engine shared by the whole application, loaded on first use
+sharedEngine = None
+
+def get_costing_engine(path=DEFAULT_PRICE_TABLE_PATH):
+    """
+    Returns the engine shared by the application, loading the price table
+    the first time. Returns None if there is no price table, or it can't be
+    read.
+    """
+    global sharedEngine
+
+    if sharedEngine is None:
+        try:
+            sharedEngine = CostingEngine(PriceTable.load(path))
+        except IOError:
+            print 'No price table found at ' + path
+            return None
+        except (ValueError, KeyError, TypeError), error:
+            print ('The price table at ' + path + ' could not be read: ' +
+                    str(error))
+            return None
+
+    return sharedEngine
+
+def reload_prices(path=DEFAULT_PRICE_TABLE_PATH):
+    """
+    Loads the price table again into the shared engine, which makes every
+    cached cost stale. Returns the engine, or None if there is no price
+    table.
+    """
+    engine = get_costing_engine(path)
+    if engine is None:
+        return None
+
+    try:
+        engine.set_table(PriceTable.load(path))
+    except (IOError, ValueError, KeyError, TypeError):
+        # The file may be in the middle of being written, keep the old prices
+        print 'Could not reload the price table at ' + path
+
+    return engine
@@ -0,0 +1,256 @@
+###############################################################################
+#
+# dedup.py
+#
+# Finds recipes in the library that are near-duplicates of each other. Every
+# recipe is turned into a set of shingles (its normalized ingredient names
+# and every three consecutive words of its instructions), and every set of
+# shingles into a short MinHash signature. Recipes whose signatures agree on
+# a whole band of values land in the same bucket (locality-sensitive
+# hashing), so only recipes that share a bucket are ever compared, instead of
+# every pair of recipes in the library.
+#
+###############################################################################
+
+import re
+import random
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from models.foodtable import normalize_name
+from models.gcpause import gc_paused
+
+# The signature is made of BANDS bands of ROWS values each. Two recipes with
+# a similarity of s share at least one band with a probability of
+# 1 - (1 - s ** ROWS) ** BANDS, which is about 0.6 at s = 0.7 and above 0.99
+# at s = 0.85
+BANDS = 16
+ROWS = 8
+SIGNATURE_SIZE = BANDS * ROWS
+
+# How similar two recipes have to be (as the share of shingles they have in
+# common) to be shown as duplicates
+DUPLICATE_THRESHOLD = 0.7
+
+# How many recipes get their signatures made at once with numpy, which keeps
+# the temporary arrays small
+SIGNATURE_CHUNK_SIZE = 256
+
+# How many words make an instruction shingle
+WORDS_PER_SHINGLE = 3
+
+# The hash functions are multiply-shift hashes: the top 32 bits of the 64 bit
+# product a * x + b, which numpy computes without any division. They are made
+# with a fixed seed so that signatures stay comparable between runs
+WORD_MASK = (1 << 64) - 1
+EMPTY_HASH = 1 << 32
+HASH_SEED = 1234
+
+# Anything that isn't a letter or a digit splits words
+WORD_SPLITTER = re.compile('[^a-z0-9]+')
+
+def recipe_shingles(recipe):
+    """
+    Returns the set of shingles of a recipe: its normalized ingredient names
+    and the three word sequences of its instructions.
+    """
+    shingles = set()
+
+    for ingredient in recipe.ingredients:
+        shingles.add('i:' + normalize_name(ingredient['name']))
+
+    for instruction in recipe.instructions:
+        words = [word for word in WORD_SPLITTER.split(instruction.lower())
+                if word]
+        if len(words) < WORDS_PER_SHINGLE:
+            shingles.add('w:' + ' '.join(words))
+        for start in range(len(words) - WORDS_PER_SHINGLE + 1):
+            shingles.add('w:' + ' '.join(words[start:start +
+                WORDS_PER_SHINGLE]))
+
+    return shingles
+
+def hash_shingle(shingle):
+    """Hashes a shingle into 32 bits, the same way in every run."""
+    if isinstance(shingle, unicode):
+        shingle = shingle.encode('utf-8')
+    return zlib.crc32(shingle) & 0xffffffff
+
+def jaccard(first, second):
+    """Returns the share of elements two sets have in common."""
+    if not first and not second:
+        return 1.0
+    common = len(first & second)
+    return common / float(len(first) + len(second) - common)
+
+
+class MinHasher(object):
+    """Turns sets of shingles into MinHash signatures."""
+    def __init__(self, size=SIGNATURE_SIZE, seed=HASH_SEED):
+        rng = random.Random(seed)
+        self.size = size
+        # Multipliers have to be odd
+        self.a = [rng.getrandbits(64) | 1 for number in range(size)]
+        self.b = [rng.getrandbits(64) for number in range(size)]
+
+        if numpy is not None:
+            self.aArray = numpy.array(self.a, dtype=numpy.uint64)[:, None]
+            self.bArray = numpy.array(self.b, dtype=numpy.uint64)[:, None]
+
+    def signature(self, shingles):
+        """
+        Returns the signature of a set of shingles: the smallest value every
+        hash function gives over the shingles.
+        """
+        values = [hash_shingle(shingle) for shingle in shingles]
+        if not values:
+            return tuple([EMPTY_HASH] * self.size)
+
+        if numpy is not None:
+            hashes = self.hash_values(numpy.array(values, dtype=numpy.uint64))
+            return tuple(hashes.min(axis=1).tolist())
+
+        return tuple([min([((a * value + b) & WORD_MASK) >> 32 for value in
+            values]) for a, b in zip(self.a, self.b)])
+
+    def hash_values(self, values):
+        """
+        Hashes an array of shingle hashes with every hash function, one row
+        per function. The products wrap around at 64 bits, as they should.
+        """
+        hashes = self.aArray * values
+        hashes += self.bArray
+        hashes >>= numpy.uint64(32)
+        return hashes
+
+    def signatures(self, shingleSets):
+        """
+        Returns the signatures of many sets of shingles. With numpy, the
+        shingles of a whole chunk of sets are hashed in one go and the
+        minimum of every set is taken with a single reduceat.
+        """
+        if numpy is None:
+            return [self.signature(shingles) for shingles in shingleSets]
+
+        signatures = []
+        for start in range(0, len(shingleSets), SIGNATURE_CHUNK_SIZE):
+            chunk = shingleSets[start:start + SIGNATURE_CHUNK_SIZE]
+
+            values = []
+            offsets = []
+            for shingles in chunk:
+                offsets.append(len(values))
+                values.extend([hash_shingle(shingle) for shingle in
+                    shingles])
+
+            if not values:
+                signatures.extend([self.signature(shingles) for shingles in
+                    chunk])
+                continue
+
+            hashes = self.hash_values(numpy.array(values, dtype=numpy.uint64))
+            # Every range of reduceat ends where the next one starts, so it
+            # is only given the offsets of the sets that have shingles
+            filled = [offset for shingles, offset in zip(chunk, offsets) if
+                    shingles]
+            minimums = iter(numpy.minimum.reduceat(hashes, filled,
+                axis=1).T.tolist())
+
+            for shingles in chunk:
+                if shingles:
+                    signatures.append(tuple(next(minimums)))
+                else:
+                    signatures.append(self.signature(shingles))
+
+        return signatures
+
+
+class DuplicateFinder(object):
+    """
+    Keeps the shingles, signatures and LSH buckets of a library of recipes,
+    and finds the pairs of recipes that are near-duplicates.
+    """
+    def __init__(self, threshold=DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self.hasher = MinHasher()
+        self.shingles = []
+        self.signatures = []
+        # (band, band values) to the list of recipe numbers in that bucket
+        self.buckets = {}
+
+    def add(self, recipe):
+        """Adds a recipe to the finder. Returns its number."""
+        shingles = recipe_shingles(recipe)
+        return self.add_signature(shingles, self.hasher.signature(shingles))
+
+    def add_signature(self, shingles, signature):
+        """
+        Adds the shingles and signature of a recipe to the finder. Returns its
+        number.
+        """
+        number = len(self.shingles)
+        self.shingles.append(shingles)
+        self.signatures.append(signature)
+
+        # Empty recipes would all share the same buckets
+        if not shingles:
+            return number
+
+        for band in range(BANDS):
+            key = (band, signature[band * ROWS:(band + 1) * ROWS])
+            if key in self.buckets:
+                self.buckets[key].append(number)
+            else:
+                self.buckets[key] = [number]
+
+        return number
+
+    def add_recipes(self, recipes):
+        """Adds many recipes to the finder, making their signatures in bulk."""
+        with gc_paused():
+            shingleSets = [recipe_shingles(recipe) for recipe in recipes]
+            for shingles, signature in zip(shingleSets,
+                    self.hasher.signatures(shingleSets)):
+                self.add_signature(shingles, signature)
+
+    def candidates(self):
+        """
+        Returns the set of (first, second) recipe number pairs that share at
+        least one bucket.
+        """
+        pairs = set()
+        for numbers in self.buckets.values():
+            if len(numbers) < 2:
+                continue
+            for position, first in enumerate(numbers):
+                for second in numbers[position + 1:]:
+                    pairs.add((first, second))
+        return pairs
+
+    def duplicates(self):
+        """
+        Returns the (similarity, first, second) triples of every candidate
+        pair that is similar enough, most similar first.
+        """
+        found = []
+        for first, second in self.candidates():
+            similarity = jaccard(self.shingles[first], self.shingles[second])
+            if similarity >= self.threshold:
+                found.append((similarity, first, second))
+
+        found.sort(key=lambda triple: (-triple[0], triple[1], triple[2]))
+        return found
+
+
+def find_duplicates(recipes, threshold=DUPLICATE_THRESHOLD):
+    """
+    Returns the (similarity, first, second) triples of the near-duplicate
+    recipes in a list, where first and second are indexes into the list.
+    """
+    finder = DuplicateFinder(threshold)
+    finder.add_recipes(recipes)
+    return finder.duplicates()
@@ -0,0 +1,152 @@
+###############################################################################
+#
+# draft.py
+#
+# Provides copy-on-write views of recipes and their lists for the edit
+# dialogs. A dialog works on a view instead of the recipe itself, so nothing is
+# copied until the user actually changes something, and cancelling the dialog
+# is just a matter of dropping the view.
+#
+###############################################################################
+
+from models.interning import intern_recipe
+
+class CopyOnWriteList(object):
+    """
+    A list that reads from a shared base list until it is modified for the
+    first time, at which point it makes its own private copy.
+
+    Items are copied with the given copy function, which is needed whenever
+    the items themselves are mutable (like ingredient dictionaries).
+    """
+    def __init__(self, base, copyItem=None):
+        self.base = base
+        self.copyItem = copyItem
+        # The private copy, only created once a change is made
+        self.copy = None
+
+    def items(self):
+        """Returns whatever list currently holds the items."""
+        if self.copy is None:
+            return self.base
+        return self.copy
+
+    def writable(self):
+        """Returns the private copy of the list, making it if needed."""
+        if self.copy is None:
+            if self.copyItem is None:
+                self.copy = list(self.base)
+            else:
+                self.copy = [self.copyItem(item) for item in self.base]
+        return self.copy
+
+    def is_modified(self):
+        """Returns whether the list has been changed at all."""
+        return self.copy is not None
+
+    def to_list(self):
+        """
+        Returns the list of items: the base list itself if nothing has been
+        changed, otherwise the private copy.
+        """
+        return self.items()
+
+    def discard(self):
+        """Throws away every change made to the list."""
+        self.copy = None
+
+    def append(self, item):
+        self.writable().append(item)
+
+    def insert(self, index, item):
+        self.writable().insert(index, item)
+
+    def pop(self, index=-1):
+        return self.writable().pop(index)
+
+    def replace(self, items):
+        """Replaces the whole contents of the list."""
+        self.copy = list(items)
+
+    def __setitem__(self, index, item):
+        self.writable()[index] = item
+
+    def __delitem__(self, index):
+        del self.writable()[index]
+
+    def __getitem__(self, index):
+        return self.items()[index]
+
+    def __len__(self):
+        return len(self.items())
+
+    def __iter__(self):
+        return iter(self.items())
+
+
+def copy_ingredient(ingredient):
+    """Returns a copy of an ingredient dictionary."""
+    return dict(ingredient)
+
+
+class RecipeDraft(object):
+    """
+    A copy-on-write view of a recipe. Reading a field reads straight from the
+    recipe; setting a field or asking for a writable list stores the change
+    in the draft only. Call commit() to write the changes back into the
+    recipe, or just drop the draft to cancel.
+    """
+    # The fields of a recipe that are lists
+    LIST_FIELDS = ('ingredients', 'instructions', 'images')
+
+    def __init__(self, recipe):
+        # Go through the dictionary directly, __setattr__ is overridden
+        self.__dict__['recipe'] = recipe
+        self.__dict__['changes'] = {}
+
+    def __getattr__(self, name):
+        changes = self.__dict__['changes']
+        if name in changes:
+            return changes[name]
+        return getattr(self.__dict__['recipe'], name)
+
+    def __setattr__(self, name, value):
+        self.changes[name] = value
+
+    def writable(self, field):
+        """
+        Returns a list field of the draft that is safe to modify. The list is
+        copied from the recipe the first time this is called for that field.
+        """
+        if field not in self.LIST_FIELDS:
+            raise ValueError(field + ' is not a list field of a recipe')
+
+        if field not in self.changes:
+            if field == 'ingredients':
+                self.changes[field] = [copy_ingredient(ingredient) for
+                        ingredient in getattr(self.recipe, field)]
+            else:
+                self.changes[field] = list(getattr(self.recipe, field))
+
+        return self.changes[field]
+
+    def is_modified(self):
+        """Returns whether anything has been changed in the draft."""
+        return len(self.changes) > 0
+
+    def commit(self):
+        """
+        Writes every change made in the draft into the recipe and returns
+        the recipe.
+        """
+        for field, value in self.changes.items():
+            setattr(self.recipe, field, value)
+        if 'course' in self.changes or 'ingredients' in self.changes:
+            intern_recipe(self.recipe)
+        self.__dict__['changes'] = {}
+
+        return self.recipe
+
+    def discard(self):
+        """Throws away every change made in the draft."""
+        self.__dict__['changes'] = {}
@@ -0,0 +1,361 @@
+###############################################################################
+#
+# foodtable.py
+#
+# The shared machinery behind the nutrition and costing engines: a table of
+# per-gram values for every known food, the unit conversions needed to turn
+# recipe quantities into grams, and an engine that joins the ingredients of
+# recipes against such a table and caches the totals per recipe.
+#
+# Ingredients are joined through an index of normalized food names that is
+# built once when the table is loaded. Every distinct (name, unit) pair seen
+# in an ingredient gets a key, so when the table is replaced only the keys
+# have to be joined again, after which a whole library is summed with a few
+# numpy array operations (or in plain Python, if numpy is not installed).
+#
+###############################################################################
+
+import weakref
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from models.gcpause import gc_paused
+
+# Grams in one of each unit of mass
+MASS_UNITS = {'g': 1.0, 'gram': 1.0, 'grams': 1.0, 'kg': 1000.0,
+        'oz': 28.35, 'ounce': 28.35, 'ounces': 28.35, 'lb': 453.59,
+        'lbs': 453.59, 'pound': 453.59, 'pounds': 453.59}
+
+# Milliliters in one of each unit of volume
+VOLUME_UNITS = {'ml': 1.0, 'l': 1000.0, 'liter': 1000.0, 'liters': 1000.0,
+        'tsp': 4.93, 'teaspoon': 4.93, 'teaspoons': 4.93, 'tbsp': 14.79,
+        'tablespoon': 14.79, 'tablespoons': 14.79, 'cup': 236.59,
+        'cups': 236.59, 'fl oz': 29.57, 'pinch': 0.31, 'dash': 0.62}
+
+# How many recipes are summed at once when recomputing a library with numpy,
+# which keeps the temporary arrays small
+LIBRARY_CHUNK_SIZE = 50000
+
+def normalize_name(name):
+    """
+    Normalizes an ingredient name for looking it up in a food table:
+    lowercase, single spaces, and the most common English plurals turned
+    into singulars ("Tomatoes" becomes "tomato").
+    """
+    name = ' '.join(name.lower().split())
+
+    if name.endswith('ies') and len(name) > 4:
+        return name[:-3] + 'y'
+    if name.endswith('oes') and len(name) > 4:
+        return name[:-2]
+    if name.endswith(('ches', 'shes', 'sses', 'xes')):
+        return name[:-2]
+    if name.endswith('s') and not name.endswith('ss') and len(name) > 3:
+        return name[:-1]
+    return name
+
+def grams_per_unit(unit, density=1.0, gramsPer={}):
+    """
+    Returns how many grams one unit of a food weighs, given its density in
+    grams per milliliter and the weights of its own units (like "pc" or
+    "clove"). Returns None if the unit can't be converted.
+    """
+    unit = unit.strip().lower()
+
+    if unit in gramsPer:
+        return float(gramsPer[unit])
+    if unit in MASS_UNITS:
+        return MASS_UNITS[unit]
+    if unit in VOLUME_UNITS:
+        return VOLUME_UNITS[unit] * density
+    if unit.endswith('s') and unit[:-1] in gramsPer:
+        return float(gramsPer[unit[:-1]])
+    return None
+
+def ingredients_fingerprint(ingredients):
+    """
+    Returns a value that is equal for two lists of ingredients if and only
+    if they have the same names, quantities and units.
+    """
+    return tuple([(ingredient['name'], ingredient['quantity'],
+        ingredient['unit']) for ingredient in ingredients])
+
+
+class FoodTable(object):
+    """
+    A table of values per gram of food (nutrients, prices...), plus what is
+    needed to turn recipe quantities into grams.
+    """
+    # Every table gets a new version, so cached results know when the table
+    # they were computed from has been replaced
+    lastVersion = 0
+
+    def __init__(self, columns, foods):
+        """
+        Builds the table. columns names the values kept for every food, and
+        foods maps food names to (values per gram, density in grams per
+        milliliter, dictionary of unit weights in grams) triples.
+        """
+        FoodTable.lastVersion += 1
+        self.version = FoodTable.lastVersion
+
+        self.columns = columns
+        self.names = sorted(foods.keys())
+
+        rows = []
+        self.densities = []
+        self.gramsPer = []
+        self.index = {}
+
+        for row, name in enumerate(self.names):
+            values, density, gramsPer = foods[name]
+            rows.append(values)
+            self.densities.append(density)
+            self.gramsPer.append(gramsPer)
+            self.index[normalize_name(name)] = row
+
+        # Values per gram, one row per food
+        if numpy is not None:
+            self.perGram = numpy.array(rows, dtype=numpy.float64).reshape(
+                    len(rows), len(columns))
+        else:
+            self.perGram = rows
+
+        # Lookups that have been made already: (name, unit) to (row, grams
+        # per unit), or None when the ingredient can't be resolved
+        self.resolved = {}
+
+    def find(self, name):
+        """Returns the row of the named food, or None if it isn't known."""
+        return self.index.get(normalize_name(name))
+
+    def grams_per_unit(self, row, unit):
+        """
+        Returns how many grams one unit of the food in the given row weighs,
+        or None if the unit can't be converted.
+        """
+        return grams_per_unit(unit, self.densities[row], self.gramsPer[row])
+
+    def resolve(self, name, unit):
+        """
+        Joins an ingredient name and unit against the table. Returns a pair
+        of (row, grams per unit), or None if either can't be found.
+        """
+        key = (name, unit)
+        if key not in self.resolved:
+            row = self.find(name)
+            result = None
+            if row is not None:
+                grams = self.grams_per_unit(row, unit)
+                if grams is not None:
+                    result = (row, grams)
+            self.resolved[key] = result
+
+        return self.resolved[key]
+
+
+class TotalsEngine(object):
+    """
+    Computes and caches the totals of recipes over a FoodTable. A cached
+    result is used for as long as the recipe's ingredients and the table stay
+    the same.
+
+    Results are the totals by column; subclasses override make_result() to
+    hand out something richer.
+    """
+    def __init__(self, table):
+        self.table = table
+        # (name, unit) to key, and the other way around
+        self.keys = {}
+        self.keyNames = []
+        # The join of the keys against the table: the row of each key (or -1
+        # when it can't be resolved) and its grams per unit
+        self.keyRows = []
+        self.keyGrams = []
+        self.keyVersion = table.version
+        # Recipe to a CacheEntry
+        self.cache = weakref.WeakKeyDictionary()
+
+    def make_result(self, recipe, entry):
+        """
+        Turns a cache entry into a result: a dictionary of the totals of the
+        recipe by the column of the table they are of.
+        """
+        return dict(zip(self.table.columns, entry.totals))
+
+    def set_table(self, table):
+        """
+        Replaces the table. Every cached result becomes stale, call
+        recompute_library() to bring them all up to date in one go.
+        """
+        self.table = table
+
+    def join_keys(self):
+        """
+        Joins every key that hasn't been joined against the current table
+        yet. Returns the rows and grams per unit of every key.
+        """
+        if self.keyVersion != self.table.version:
+            # A new table, every key has to be joined again
+            self.keyRows = []
+            self.keyGrams = []
+            self.keyVersion = self.table.version
+
+        for name, unit in self.keyNames[len(self.keyRows):]:
+            resolved = self.table.resolve(name, unit)
+            if resolved is None:
+                self.keyRows.append(-1)
+                self.keyGrams.append(0.0)
+            else:
+                self.keyRows.append(resolved[0])
+                self.keyGrams.append(resolved[1])
+
+        return self.keyRows, self.keyGrams
+
+    def encode(self, ingredients):
+        """Turns ingredients into a list of keys and a list of quantities."""
+        keys = self.keys
+        ids = []
+        quantities = []
+
+        for ingredient in ingredients:
+            name = (ingredient['name'], ingredient['unit'])
+            if name not in keys:
+                keys[name] = len(self.keyNames)
+                self.keyNames.append(name)
+            ids.append(keys[name])
+            quantities.append(ingredient['quantity'])
+
+        return ids, quantities
+
+    def entry(self, recipe):
+        """
+        Returns the cache entry of a recipe, making a new one if the
+        recipe's ingredients changed since it was cached.
+        """
+        fingerprint = ingredients_fingerprint(recipe.ingredients)
+        entry = self.cache.get(recipe)
+
+        if entry is None or entry.fingerprint != fingerprint:
+            ids, quantities = self.encode(recipe.ingredients)
+            entry = CacheEntry(fingerprint, ids, quantities)
+            self.cache[recipe] = entry
+
+        return entry
+
+    def missing_names(self, ids, keyRows):
+        """Returns the names of the ingredients that couldn't be joined."""
+        return [self.keyNames[key][0] for key in ids if keyRows[key] < 0]
+
+    def compute(self, recipe):
+        """Returns the result for a recipe, from the cache if still valid."""
+        entry = self.entry(recipe)
+
+        if entry.version != self.table.version:
+            keyRows, keyGrams = self.join_keys()
+            totals = [0.0] * len(self.table.columns)
+            for key, quantity in zip(entry.ids, entry.quantities):
+                row = keyRows[key]
+                if row < 0:
+                    continue
+                weight = keyGrams[key] * quantity
+                for column in range(len(totals)):
+                    totals[column] += self.table.perGram[row][column] * weight
+
+            entry.version = self.table.version
+            entry.totals = totals
+            entry.missing = self.missing_names(entry.ids, keyRows)
+
+        return self.make_result(recipe, entry)
+
+    def recompute_library(self, recipes):
+        """
+        Brings the cached results of every given recipe up to date, in as
+        few passes as possible. Useful after the table has been replaced.
+        Returns the list of results, in the same order as recipes.
+        """
+        recipes = list(recipes)
+
+        with gc_paused():
+            entries = [self.entry(recipe) for recipe in recipes]
+            stale = [entry for entry in entries if
+                    entry.version != self.table.version]
+
+            if numpy is None:
+                for recipe, entry in zip(recipes, entries):
+                    if entry.version != self.table.version:
+                        self.compute(recipe)
+            else:
+                for start in range(0, len(stale), LIBRARY_CHUNK_SIZE):
+                    self.recompute_chunk(stale[start:start +
+                        LIBRARY_CHUNK_SIZE])
+
+            results = [self.make_result(recipe, entry) for recipe, entry in
+                    zip(recipes, entries)]
+
+        return results
+
+    def recompute_chunk(self, entries):
+        """
+        Recomputes a chunk of stale cache entries with numpy. The keys and
+        quantities of the whole chunk go into flat arrays, are joined against
+        the table in one go, and the totals of each recipe are summed with a
+        bincount per column.
+        """
+        keyRows, keyGrams = self.join_keys()
+        keyRows = numpy.array(keyRows, dtype=numpy.intp)
+        keyGrams = numpy.array(keyGrams, dtype=numpy.float64)
+
+        ids = []
+        quantities = []
+        lengths = []
+        for entry in entries:
+            ids.extend(entry.ids)
+            quantities.extend(entry.quantities)
+            lengths.append(len(entry.ids))
+
+        ids = numpy.array(ids, dtype=numpy.intp)
+        owners = numpy.repeat(numpy.arange(len(entries)), lengths)
+        rows = keyRows[ids]
+        found = rows >= 0
+
+        weights = (keyGrams[ids] * numpy.array(quantities,
+            dtype=numpy.float64))[found]
+        perGram = self.table.perGram[rows[found]]
+        foundOwners = owners[found]
+
+        columns = []
+        for column in range(len(self.table.columns)):
+            columns.append(numpy.bincount(foundOwners, weights=weights *
+                perGram[:, column], minlength=len(entries)))
+        totals = numpy.column_stack(columns).tolist()
+
+        # Only the recipes with unknown ingredients need their names looked up
+        incomplete = set(owners[~found].tolist())
+        keyRows = keyRows.tolist()
+
+        for number, entry in enumerate(entries):
+            entry.version = self.table.version
+            entry.totals = totals[number]
+            if number in incomplete:
+                entry.missing = self.missing_names(entry.ids, keyRows)
+            else:
+                entry.missing = []
+
+
+class CacheEntry(object):
+    """What a TotalsEngine remembers about a single recipe."""
+    __slots__ = ['fingerprint', 'ids', 'quantities', 'version', 'totals',
+            'missing']
+
+    def __init__(self, fingerprint, ids, quantities):
+        self.fingerprint = fingerprint
+        self.ids = ids
+        self.quantities = quantities
+        # The version of the table the totals were computed with
+        self.version = None
+        self.totals = None
+        self.missing = None
@@ -0,0 +1,25 @@
+###############################################################################
+#
+# gcpause.py
+#
+# Loading a library makes lots of small objects (dictionaries, lists, stat
+# results) that all stay alive. Every few hundred of them, Python's cyclic
+# garbage collector walks every object made so far looking for cycles that
+# aren't there, so bulk loads pause it while they run.
+#
+###############################################################################
+
+import gc
+
+class gc_paused(object):
+    """
+    Pauses the cyclic garbage collector while the with block runs. It is
+    only turned back on afterwards if it was on before, so pauses nest.
+    """
+    def __enter__(self):
+        self.collecting = gc.isenabled()
+        gc.disable()
+
+    def __exit__(self, *exception):
+        if self.collecting:
+            gc.enable()
@@ -0,0 +1,331 @@
+###############################################################################
+#
+# history.py
+#
+# Provides the undo/redo machinery used by the recipe dialogs. Instead of deep
+# copying a recipe every time it is edited, every state kept on the undo stack
+# is built out of persistent (immutable) chunked sequences. A new state reuses
+# every chunk of the previous state that did not change, even if items were
+# inserted or removed before it, so keeping hundreds of undo levels only
+# costs memory for the parts of the recipe that were actually edited.
+#
+###############################################################################
+
+import bisect
+
+class PersistentList(object):
+    """
+    An immutable sequence that is stored as a tuple of chunks of at most
+    CHUNK_SIZE items.
+
+    A PersistentList built from another one shares every chunk of it that
+    still holds the same items, wherever they ended up: inserting or
+    removing an item only stores the chunk around it again, and every chunk
+    after it is shared too. That is what keeps the undo history small.
+    """
+    # How many items go into a single chunk
+    CHUNK_SIZE = 32
+
+    def __init__(self, chunks=(), length=0):
+        self.chunks = chunks
+        self.length = length
+        # Where every chunk starts, for finding the one an index is in
+        self.starts = []
+        position = 0
+        for chunk in chunks:
+            self.starts.append(position)
+            position += len(chunk)
+
+    @classmethod
+    def from_sequence(cls, items, base=None):
+        """
+        Builds a PersistentList out of the given items. If a base list is
+        given, the chunks it starts and ends with are reused as long as the
+        items hold them unchanged, so only the items between the first and
+        the last change are stored again.
+        """
+        items = tuple(items)
+        baseChunks = ()
+        if base is not None:
+            baseChunks = base.chunks
+
+        # The unchanged chunks at the front
+        chunks = []
+        start = 0
+        first = 0
+        while (first < len(baseChunks) and
+                items[start:start + len(baseChunks[first])] ==
+                baseChunks[first]):
+            chunks.append(baseChunks[first])
+            start += len(baseChunks[first])
+            first += 1
+
+        # The unchanged chunks at the back, which moved if items were
+        # inserted or removed before them
+        tail = []
+        end = len(items)
+        last = len(baseChunks)
+        while last > first:
+            chunk = baseChunks[last - 1]
+            if (end - len(chunk) < start or
+                    items[end - len(chunk):end] != chunk):
+                break
+            tail.append(chunk)
+            end -= len(chunk)
+            last -= 1
+
+        # A few changed items are stored with a chunk next to them, so
+        # removing items doesn't wear the chunks down to single items
+        if 0 < end - start < cls.CHUNK_SIZE // 2:
+            if chunks:
+                start -= len(chunks.pop())
+            elif tail:
+                end += len(tail.pop())
+
+        # What changed in between goes into new chunks of even sizes
+        count = -(-(end - start) // cls.CHUNK_SIZE)
+        for piece in range(count):
+            chunks.append(items[start + (end - start) * piece // count:
+                start + (end - start) * (piece + 1) // count])
+        chunks.extend(reversed(tail))
+
+        return cls(tuple(chunks), len(items))
+
+    def locate(self, index):
+        """
+        Returns which chunk the item at the given index is in, and where in
+        that chunk. Raises IndexError if there is no such item.
+        """
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('PersistentList index out of range')
+
+        chunkIndex = bisect.bisect_right(self.starts, index) - 1
+        return chunkIndex, index - self.starts[chunkIndex]
+
+    def set(self, index, value):
+        """
+        Returns a new PersistentList with the item at the given index
+        replaced. Only the chunk holding that item gets copied.
+        """
+        chunkIndex, offset = self.locate(index)
+        chunk = self.chunks[chunkIndex]
+        chunk = chunk[:offset] + (value,) + chunk[offset + 1:]
+
+        return PersistentList(self.chunks[:chunkIndex] + (chunk,) +
+                self.chunks[chunkIndex + 1:], self.length)
+
+    def to_list(self):
+        """Returns a plain, mutable Python list of the items."""
+        items = []
+        for chunk in self.chunks:
+            items.extend(chunk)
+        return items
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            for item in chunk:
+                yield item
+
+    def __getitem__(self, index):
+        chunkIndex, offset = self.locate(index)
+        return self.chunks[chunkIndex][offset]
+
+    def __eq__(self, other):
+        if not isinstance(other, PersistentList):
+            return NotImplemented
+        if self.length != other.length:
+            return False
+        # Equal lists built apart can be chunked differently
+        return (self.chunks == other.chunks or
+                self.to_list() == other.to_list())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+
+def freeze_ingredient(ingredient):
+    """Turns an ingredient dictionary into an immutable tuple."""
+    return (ingredient['name'], ingredient['quantity'], ingredient['unit'])
+
+def thaw_ingredient(ingredient):
+    """Turns a frozen ingredient tuple back into an ingredient dictionary."""
+    return {'name': ingredient[0], 'quantity': ingredient[1],
+            'unit': ingredient[2]}
+
+def freeze_ingredients(ingredients, base=None):
+    """
+    Freezes a list of ingredient dictionaries into a PersistentList, sharing
+    unchanged chunks with the base list if one is given.
+    """
+    return PersistentList.from_sequence(
+            [freeze_ingredient(ingredient) for ingredient in ingredients],
+            base)
+
+def thaw_ingredients(ingredients):
+    """Returns a new list of ingredient dictionaries from a frozen list."""
+    return [thaw_ingredient(ingredient) for ingredient in ingredients]
+
+
+class RecipeSnapshot(object):
+    """
+    An immutable picture of a recipe at some point in time. The ingredients,
+    instructions and images are kept as PersistentLists.
+    """
+    def __init__(self, name, course, servingSize, ingredients, instructions,
+            images):
+        self.name = name
+        self.course = course
+        self.servingSize = servingSize
+        self.ingredients = ingredients
+        self.instructions = instructions
+        self.images = images
+
+    def __eq__(self, other):
+        if not isinstance(other, RecipeSnapshot):
+            return NotImplemented
+        return (self.name == other.name and self.course == other.course and
+                self.servingSize == other.servingSize and
+                self.ingredients == other.ingredients and
+                self.instructions == other.instructions and
+                self.images == other.images)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+
+def snapshot_recipe(recipe, base=None):
+    """
+    Takes a snapshot of the given recipe. If a base snapshot is given, the
+    new snapshot shares all of the unchanged parts with it.
+    """
+    baseIngredients = baseInstructions = baseImages = None
+    if base is not None:
+        baseIngredients = base.ingredients
+        baseInstructions = base.instructions
+        baseImages = base.images
+
+    return RecipeSnapshot(recipe.name, recipe.course, recipe.servingSize,
+            freeze_ingredients(recipe.ingredients, baseIngredients),
+            PersistentList.from_sequence(recipe.instructions,
+                baseInstructions),
+            PersistentList.from_sequence(recipe.images, baseImages))
+
+def restore_recipe(recipe, snapshot):
+    """
+    Puts the contents of a snapshot back into the given recipe. The recipe
+    gets brand new lists so that the snapshot is never modified.
+    """
+    recipe.name = snapshot.name
+    recipe.course = snapshot.course
+    recipe.servingSize = snapshot.servingSize
+    recipe.ingredients = thaw_ingredients(snapshot.ingredients)
+    recipe.instructions = snapshot.instructions.to_list()
+    recipe.images = snapshot.images.to_list()
+
+
+class UndoStack(object):
+    """
+    A plain undo/redo stack of immutable states. The current state is always
+    kept at the top of the undo list; undoing moves it to the redo list.
+    """
+    # The default number of undo levels kept around
+    DEFAULT_LIMIT = 500
+
+    def __init__(self, initialState, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        # Pairs of (label, state), the last one being the current state
+        self.undoStates = [(None, initialState)]
+        self.redoStates = []
+
+    def current(self):
+        """Returns the current state."""
+        return self.undoStates[-1][1]
+
+    def push(self, state, label=None):
+        """
+        Pushes a new state onto the stack and forgets everything that could
+        have been redone. States equal to the current one are ignored.
+        """
+        if state == self.current():
+            return False
+
+        self.undoStates.append((label, state))
+        self.redoStates = []
+
+        if len(self.undoStates) > self.limit + 1:
+            # Drop the oldest undo level
+            self.undoStates.pop(0)
+
+        return True
+
+    def can_undo(self):
+        """Returns whether there is anything to undo."""
+        return len(self.undoStates) > 1
+
+    def can_redo(self):
+        """Returns whether there is anything to redo."""
+        return len(self.redoStates) > 0
+
+    def undo_label(self):
+        """Returns the label of the change that would be undone."""
+        if self.can_undo():
+            return self.undoStates[-1][0]
+        return None
+
+    def redo_label(self):
+        """Returns the label of the change that would be redone."""
+        if self.can_redo():
+            return self.redoStates[-1][0]
+        return None
+
+    def undo(self):
+        """Steps one state back and returns the new current state."""
+        if self.can_undo():
+            self.redoStates.append(self.undoStates.pop())
+        return self.current()
+
+    def redo(self):
+        """Steps one state forward and returns the new current state."""
+        if self.can_redo():
+            self.undoStates.append(self.redoStates.pop())
+        return self.current()
+
+
+class RecipeHistory(object):
+    """
+    Keeps the undo history of a single recipe. Call record() after every
+    edit, then undo() and redo() to move the recipe through its history.
+    """
+    def __init__(self, recipe, limit=UndoStack.DEFAULT_LIMIT):
+        self.recipe = recipe
+        self.stack = UndoStack(snapshot_recipe(recipe), limit)
+
+    def record(self, label=None):
+        """Records the current contents of the recipe as a new state."""
+        return self.stack.push(snapshot_recipe(self.recipe,
+            self.stack.current()), label)
+
+    def can_undo(self):
+        return self.stack.can_undo()
+
+    def can_redo(self):
+        return self.stack.can_redo()
+
+    def undo(self):
+        """Rolls the recipe back to its previous state."""
+        restore_recipe(self.recipe, self.stack.undo())
+
+    def redo(self):
+        """Rolls the recipe forward to its next state."""
+        restore_recipe(self.recipe, self.stack.redo())
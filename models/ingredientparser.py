@@ -0,0 +1,192 @@
+###############################################################################
+#
+# ingredientparser.py
+#
+# Reads ingredients written out as text, a line each, the way recipes print
+# them: "2 1/2 cups flour, sifted", "1 (14 oz) can tomatoes", "2 cups (250
+# g) flour", "a pinch of salt". Every line is taken apart by a single
+# pattern compiled when the module is loaded, into the name, quantity and
+# unit of an ingredient. Units are turned into the ones the rest of the
+# library uses ("tablespoons" and "T" are "tbsp"), and notes after a comma
+# or in parentheses are dropped.
+#
+# The same lines come up over and over again in a corpus of recipes ("1 tsp
+# salt"), so what every line parses to is memoized, and bulk conversion
+# mostly costs a dictionary lookup per line.
+#
+###############################################################################
+
+import re
+
+# The unit of ingredients that are counted rather than measured ("2 eggs")
+COUNT_UNIT = 'pc'
+
+# How many decimals quantities are kept to, like the quantity spinbox
+QUANTITY_DECIMALS = 2
+
+# Units as they are written, to the units of the library. "T" and "t" are
+# told apart by case, every other unit is looked up in lower case
+UNITS = {'T': 'tbsp', 't': 'tsp'}
+for unit, spellings in [
+        ('tsp', ['tsp', 'tsps', 'teaspoon', 'teaspoons', 'tspn']),
+        ('tbsp', ['tbsp', 'tbsps', 'tbs', 'tbl', 'tablespoon',
+            'tablespoons']),
+        ('cup', ['cup', 'cups', 'c']),
+        ('g', ['g', 'gr', 'gram', 'grams', 'gramme', 'grammes']),
+        ('kg', ['kg', 'kgs', 'kilogram', 'kilograms', 'kilo', 'kilos']),
+        ('ml', ['ml', 'milliliter', 'milliliters', 'millilitre',
+            'millilitres']),
+        ('l', ['l', 'liter', 'liters', 'litre', 'litres']),
+        ('fl oz', ['fl oz', 'fl. oz', 'fluid ounce', 'fluid ounces']),
+        ('oz', ['oz', 'ounce', 'ounces']),
+        ('lb', ['lb', 'lbs', 'pound', 'pounds']),
+        ('qt', ['qt', 'quart', 'quarts']),
+        ('pt', ['pt', 'pint', 'pints']),
+        ('pinch', ['pinch', 'pinches']),
+        ('dash', ['dash', 'dashes']),
+        ('clove', ['clove', 'cloves']),
+        ('slice', ['slice', 'slices']),
+        ('stalk', ['stalk', 'stalks']),
+        ('sprig', ['sprig', 'sprigs']),
+        ('bunch', ['bunch', 'bunches']),
+        ('head', ['head', 'heads']),
+        ('stick', ['stick', 'sticks']),
+        ('handful', ['handful', 'handfuls']),
+        ('can', ['can', 'cans']),
+        ('tin', ['tin', 'tins']),
+        ('package', ['package', 'packages', 'pkg', 'packet', 'packets']),
+        ('pc', ['pc', 'pcs', 'piece', 'pieces'])]:
+    for spelling in spellings:
+        UNITS[spelling] = unit
+
+# Fractions written as single characters
+VULGAR_FRACTIONS = dict([(u'\u00bc', 0.25), (u'\u00bd', 0.5),
+        (u'\u00be', 0.75), (u'\u2153', 1 / 3.0), (u'\u2154', 2 / 3.0),
+        (u'\u215b', 0.125), (u'\u215c', 0.375), (u'\u215d', 0.625),
+        (u'\u215e', 0.875)])
+
+# The fraction characters as a pattern. In a UTF-8 byte string, a unicode
+# pattern sees every one of them as two latin-1 characters
+FRACTION = u'(?:' + u'|'.join([character + u'|' + character.encode(
+    'utf-8').decode('latin-1') for character in VULGAR_FRACTIONS]) + u')'
+
+# A quantity: "1/2", "2", "1.5", "2 1/2", "1\u00bd", "\u00bd" or "a"
+NUMBER = (u'(?:\\d+/\\d+|\\d+(?:\\.\\d+)?(?:\\s+\\d+/\\d+|\\s*' +
+        FRACTION + u')?|' + FRACTION + u'|an?(?=\\s))')
+
+# A whole line: a bullet, the quantity (or a range of them), a size ("(14
+# oz)", "-inch"), the unit and what it comes to ("cups (250 g)"), "of", the
+# name, and notes
+LINE_PATTERN = re.compile(u'\\s*(?:[-*]\\s*|\u2022\\s*)?'
+        u'(?:(' + NUMBER + u')(?:\\s*(?:-|to|\u2013)\\s*(' + NUMBER +
+        u'))?(?:-?\\s*(?:inch(?:es)?\\b|cm\\b|in\\.))?\\s*)?'
+        u'(?:\\([^)]*\\)\\s*)?'
+        u'(?:(' + u'|'.join([re.escape(spelling) for spelling in
+            sorted(UNITS, key=len, reverse=True)]) +
+        u')\\.?(?:\\s*\\([^)]*\\))?\\s+(?:of\\s+)?)?'
+        u'(.*?)[\\s.]*(?:[,(;].*)?$', re.IGNORECASE)
+
+# How many lines the memos keep at most before they start over
+MEMO_SIZE = 1 << 17
+
+# Line to what it parses to (None for lines that aren't ingredients), and
+# quantity as written to its value
+lineMemo = {}
+quantityMemo = {}
+
+def parse_quantity(text):
+    """
+    Returns the value of a quantity as written, like '2 1/2', or None if it
+    has no value ('1/0').
+    """
+    value = quantityMemo.get(text, False)
+    if value is not False:
+        return value
+
+    written = text
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    value = 0.0
+    for part in text.split():
+        if part.lower() in ('a', 'an'):
+            value += 1.0
+        elif '/' in part:
+            numerator, denominator = part.split('/')
+            if not float(denominator or 1):
+                value = None
+                break
+            value += float(numerator) / float(denominator or 1)
+        else:
+            # A whole number can have a fraction character stuck to it
+            digits = part.rstrip(u''.join(VULGAR_FRACTIONS))
+            if digits:
+                value += float(digits)
+            if digits != part:
+                value += VULGAR_FRACTIONS[part[len(digits):]]
+
+    if len(quantityMemo) >= MEMO_SIZE:
+        quantityMemo.clear()
+    quantityMemo[written] = value
+    return value
+
+def read_line(line):
+    """
+    Returns an ingredient line as a (name, quantity, unit) tuple, or None
+    if it has no name ("2 cups") or is a header ("For the sauce:"). A range
+    of quantities ("2-3") is read as the larger one. Lines without a
+    quantity, or with one that has no value ("1/0"), are taken to mean one
+    of something, and lines without a unit a count of it.
+    """
+    match = LINE_PATTERN.match(line)
+    first, last, unit, name = match.group(1, 2, 3, 4)
+    if not name or name.endswith(':'):
+        return None
+    # A quantity and a unit with nothing after them, which isn't named
+    # after its unit
+    if first and not unit and (name in UNITS or name.lower() in UNITS):
+        return None
+    quantities = [parse_quantity(written) for written in (first, last) if
+            written]
+    quantities = [value for value in quantities if value is not None]
+    quantity = 1.0
+    if quantities:
+        quantity = max(quantities)
+    quantity = round(quantity, QUANTITY_DECIMALS)
+
+    if unit:
+        unit = UNITS.get(unit) or UNITS[unit.lower()]
+    else:
+        unit = COUNT_UNIT
+    return (name, quantity, unit)
+
+def parse_line(line):
+    """Like read_line(), but memoized."""
+    parsed = lineMemo.get(line, False)
+    if parsed is False:
+        parsed = read_line(line)
+        if len(lineMemo) >= MEMO_SIZE:
+            lineMemo.clear()
+        lineMemo[line] = parsed
+    return parsed
+
+def parse_lines(lines):
+    """
+    Parses many ingredient lines at once, for converting whole corpora.
+    Returns a (name, quantity, unit) tuple for every line, or None for the
+    ones that aren't ingredients (blank lines, headers without a name).
+    """
+    get = lineMemo.get
+    parsed = [get(line, False) for line in lines]
+    if False in parsed:
+        for index in [index for index, value in enumerate(parsed) if value
+                is False]:
+            parsed[index] = parse_line(lines[index])
+    return parsed
+
+def parse_ingredients(text):
+    """
+    Parses text pasted in, a line per ingredient, into a list of ingredient
+    dictionaries. Lines that aren't ingredients are left out.
+    """
+    return [{'name': name, 'quantity': quantity, 'unit': unit} for name,
+            quantity, unit in filter(None, parse_lines(text.splitlines()))]
@@ -0,0 +1,71 @@
+###############################################################################
+#
+# interning.py
+#
+# A table of the strings that repeat all over the library: courses,
+# ingredient names and units. Every recipe file decodes into its own copies
+# of "cup", "Main" and "salt", and so does every ingredient dictionary of its
+# keys; passing recipes through the table when they are read or edited makes
+# all of them share a single copy of every string instead.
+#
+# Python's own intern() only takes byte strings, while decoded recipes are a
+# mix of byte and unicode strings, so the table is a dictionary of its own.
+#
+###############################################################################
+
+class StringPool(object):
+    """Keeps a single copy of every string it is given."""
+    def __init__(self):
+        self.strings = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, string):
+        """
+        Returns the copy of a string kept in the table, keeping this one if
+        it is new.
+        """
+        return self.strings.setdefault(string, string)
+
+    def intern_ingredient(self, ingredient):
+        """
+        Returns a copy of an ingredient whose name and unit are the copies
+        kept in the table. The keys are the ones written below, which every
+        ingredient made this way shares.
+        """
+        return {'name': self.intern(ingredient['name']),
+                'quantity': ingredient['quantity'],
+                'unit': self.intern(ingredient['unit'])}
+
+    def intern_recipe(self, recipe):
+        """
+        Makes the course and ingredients of a recipe share the strings kept
+        in the table. Names and instructions rarely repeat, so they are left
+        alone rather than filling the table.
+        """
+        intern = self.strings.setdefault
+        recipe.course = intern(recipe.course, recipe.course)
+        # The same as intern_ingredient(), written out since this is done to
+        # every ingredient that is read
+        recipe.ingredients = [{'name': intern(ingredient['name'],
+            ingredient['name']), 'quantity': ingredient['quantity'],
+            'unit': intern(ingredient['unit'], ingredient['unit'])} for
+            ingredient in recipe.ingredients]
+
+
+# The table shared by the whole application
+sharedPool = None
+
+def get_string_pool():
+    """Returns the string table shared by the application."""
+    global sharedPool
+
+    if sharedPool is None:
+        sharedPool = StringPool()
+
+    return sharedPool
+
+def intern_recipe(recipe):
+    """Makes a recipe share the strings of the shared table."""
+    get_string_pool().intern_recipe(recipe)
@@ -0,0 +1,706 @@
+###############################################################################
+#
+# librarysync.py
+#
+# Keeps the libraries of several machines in sync. Every library keeps a
+# Merkle tree of its recipes: recipes are spread over the leaves of a fixed
+# tree by the hash of their name (their key), every leaf is the hash of the
+# (key, content hash) pairs of its recipes, and every node above is the hash
+# of its children. Two libraries that are mostly the same have the same
+# hashes almost everywhere, so comparing them only walks down the few
+# branches whose hashes differ, a level at a time, and only the recipes of
+# the leaves that differ are ever compared, let alone sent over.
+#
+# The other library (the peer) can be:
+#
+#   * a shared folder, which every machine publishes its library into (in a
+#     subfolder of its own) and reads the others' from. The files are laid
+#     out so only the nodes and leaves asked for are read
+#   * a local socket, served by SyncServer, asked one level at a time
+#   * a LibraryIndex in the same process
+#
+# Syncing pulls in what the peer changed since the last sync with it (the
+# base, kept in the sync folder), and reports the recipes both sides changed
+# as conflicts instead of picking one. What only this side changed is left
+# for the peer to pull.
+#
+###############################################################################
+
+import hashlib
+import os
+import re
+import socket
+import SocketServer
+import struct
+import threading
+from itertools import izip
+
+from models import codec
+
+# The shape of the tree: how many children every node has, and how many
+# levels there are below the root. 65536 leaves keep one or two recipes
+# each in a library of 100,000
+FANOUT = 16
+DEPTH = 4
+LEAVES = FANOUT ** DEPTH
+
+# The hash of an empty subtree. Every library has the same, so empty
+# branches are never walked down
+EMPTY_DIGEST = '\0' * 16
+
+# Every peer has to build its tree the same way
+SYNC_VERSION = 1
+
+# Where the bases of the last syncs are kept
+DEFAULT_SYNC_FOLDER = './sync/'
+
+# The files of a library published in a shared folder
+TREE_FILE = 'tree.bin'
+BUCKET_FILE = 'buckets.bin'
+DOCUMENT_FOLDER = 'recipes'
+
+# The first bytes of the tree file: the magic, the version, the fanout and
+# the depth
+TREE_MAGIC = 'RCPT'
+TREE_HEADER = '<4sBBB'
+
+# Reading more than this share of a level of a shared tree, it is read
+# whole instead of a node at a time
+WHOLE_LEVEL = 0.125
+
+DEFAULT_SYNC_HOST = '127.0.0.1'
+DEFAULT_SYNC_PORT = 8643
+
+# Names to their keys. Making a key is slow next to the rest of a refresh,
+# and names rarely change
+keyMemo = {}
+
+def recipe_key(name):
+    """
+    Returns the key that matches recipes across libraries: their name,
+    without case or extra spaces.
+    """
+    key = keyMemo.get(name)
+    if key is None:
+        if isinstance(name, unicode):
+            key = name.encode('utf-8')
+        else:
+            key = name
+        key = ' '.join(key.lower().split())
+        if len(keyMemo) >= 1 << 17:
+            keyMemo.clear()
+        keyMemo[name] = key
+    return key
+
+def recipe_keys(recipes):
+    """
+    Returns the key of every recipe. Recipes with the same name get #2, #3
+    and so on, in the order they come.
+    """
+    used = set()
+    keys = []
+    for recipe in recipes:
+        base = key = recipe_key(recipe.name)
+        number = 1
+        while key in used:
+            number += 1
+            key = base + '#' + str(number)
+        used.add(key)
+        keys.append(key)
+    return keys
+
+def leaf_of(key):
+    """Returns the leaf of the tree a recipe key belongs to."""
+    return struct.unpack('<I', hashlib.md5(key).digest()[:4])[0] % LEAVES
+
+def leaf_digest(bucket):
+    """Returns the hash of a leaf, from its recipes' keys and hashes."""
+    if not bucket:
+        return EMPTY_DIGEST
+    return hashlib.md5(''.join([key + '\0' + bucket[key] + '\n' for key in
+        sorted(bucket)])).digest()
+
+def node_digest(children):
+    """Returns the hash of a node, from its children's."""
+    joined = ''.join(children)
+    if joined == EMPTY_DIGEST * len(children):
+        return EMPTY_DIGEST
+    return hashlib.md5(joined).digest()
+
+
+class LibraryTree(object):
+    """
+    The Merkle tree of a library. Leaves are dictionaries of recipe key to
+    content hash, never changed once made (changes make new ones), so that
+    copies of the tree can be handed to other threads cheaply.
+    """
+    def __init__(self):
+        # Leaf number to its recipes
+        self.buckets = {}
+        # The hashes of every level, from the root down to the leaves
+        self.levels = [[EMPTY_DIGEST] * (FANOUT ** level) for level in
+                range(DEPTH + 1)]
+        # The leaves whose hashes are out of date
+        self.dirty = set()
+
+    def get(self, key):
+        """Returns the content hash of a recipe, or None."""
+        return self.buckets.get(leaf_of(key), {}).get(key)
+
+    def set(self, key, contentHash):
+        """Sets the content hash of a recipe."""
+        leaf = leaf_of(key)
+        bucket = self.buckets.get(leaf, {})
+        if bucket.get(key) != contentHash:
+            bucket = dict(bucket)
+            bucket[key] = contentHash
+            self.buckets[leaf] = bucket
+            self.dirty.add(leaf)
+
+    def remove(self, key):
+        """Removes a recipe."""
+        leaf = leaf_of(key)
+        bucket = self.buckets.get(leaf, {})
+        if key in bucket:
+            bucket = dict(bucket)
+            del bucket[key]
+            if bucket:
+                self.buckets[leaf] = bucket
+            else:
+                del self.buckets[leaf]
+            self.dirty.add(leaf)
+
+    def update(self):
+        """
+        Brings the hashes of the leaves that changed, and of the nodes above
+        them, up to date.
+        """
+        if not self.dirty:
+            return
+        dirty = self.dirty
+        self.dirty = set()
+
+        leaves = self.levels[DEPTH]
+        for leaf in dirty:
+            leaves[leaf] = leaf_digest(self.buckets.get(leaf))
+
+        for level in range(DEPTH - 1, -1, -1):
+            dirty = set([index // FANOUT for index in dirty])
+            children = self.levels[level + 1]
+            nodes = self.levels[level]
+            for index in dirty:
+                nodes[index] = node_digest(children[index * FANOUT:
+                    (index + 1) * FANOUT])
+
+    def root(self):
+        """Returns the hash of the whole library."""
+        self.update()
+        return self.levels[0][0]
+
+    def copy(self):
+        """Returns an up to date copy of the tree."""
+        self.update()
+        tree = LibraryTree.__new__(LibraryTree)
+        tree.buckets = dict(self.buckets)
+        tree.levels = [list(level) for level in self.levels]
+        tree.dirty = set()
+        return tree
+
+    def node_hashes(self, level, indexes):
+        """Returns the hashes of the given nodes of a level."""
+        self.update()
+        nodes = self.levels[level]
+        return [nodes[index] for index in indexes]
+
+    def bucket_entries(self, leaves):
+        """
+        Returns the recipes of the given leaves, as one dictionary of key to
+        content hash.
+        """
+        entries = {}
+        for leaf in leaves:
+            entries.update(self.buckets.get(leaf, {}))
+        return entries
+
+    def entries(self):
+        """Returns every recipe, as a dictionary of key to content hash."""
+        return self.bucket_entries(self.buckets.keys())
+
+
+class LibraryIndex(object):
+    """
+    Lives on the GUI side. Keeps the tree of the library up to date as it
+    changes, and acts as a peer for the other side of a sync.
+    """
+    def __init__(self):
+        self.tree = LibraryTree()
+        # Recipe to its content hash, as of the last refresh. Only the
+        # recipes of the library are kept, so a plain dictionary does
+        self.hashes = {}
+        # Key to recipe, and key to content hash
+        self.recipes = {}
+        self.entries = {}
+
+    def refresh(self, recipes, changed=None):
+        """
+        Brings the tree up to date with the library. If the recipes that
+        changed are given, only those are hashed again; otherwise every
+        recipe is. Only the leaves of recipes that changed are touched.
+        """
+        if changed is not None:
+            changed = set(changed)
+        hashes = {}
+        current = {}
+        entries = self.entries
+        for recipe, key in izip(recipes, recipe_keys(recipes)):
+            contentHash = self.hashes.get(recipe)
+            if contentHash is None or changed is None or recipe in changed:
+                contentHash = hashlib.md5(recipe.export_recipe()).hexdigest()
+            hashes[recipe] = contentHash
+            current[key] = recipe
+            if entries.get(key) != contentHash:
+                entries[key] = contentHash
+                self.tree.set(key, contentHash)
+
+        for key in [key for key in entries if key not in current]:
+            del entries[key]
+            self.tree.remove(key)
+        self.hashes = hashes
+        self.recipes = current
+        self.tree.update()
+
+    def shape(self):
+        return (SYNC_VERSION, FANOUT, DEPTH)
+
+    def node_hashes(self, level, indexes):
+        return self.tree.node_hashes(level, indexes)
+
+    def bucket_entries(self, leaves):
+        return self.tree.bucket_entries(leaves)
+
+    def documents(self, hashes):
+        """
+        Returns the .rcpe documents of the recipes with the given content
+        hashes, by hash.
+        """
+        wanted = set(hashes)
+        documents = {}
+        for recipe in self.recipes.itervalues():
+            contentHash = self.hashes.get(recipe)
+            if contentHash in wanted:
+                document = recipe.export_recipe()
+                # Edited since the last refresh: the peer gets it next time
+                if hashlib.md5(document).hexdigest() == contentHash:
+                    documents[contentHash] = document
+        return documents
+
+
+class LibraryDiff(object):
+    """
+    The recipes two libraries don't agree on, with their content hashes on
+    either side (None where a side doesn't have one).
+    """
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+        self.keys = sorted([key for key in set(local) | set(remote) if
+            local.get(key) != remote.get(key)])
+
+    def __len__(self):
+        return len(self.keys)
+
+def diff_libraries(local, remote):
+    """
+    Compares two libraries (any two peers), walking down only the branches
+    of their trees whose hashes differ. Raises ValueError if their trees
+    aren't built the same way.
+    """
+    if tuple(local.shape()) != tuple(remote.shape()):
+        raise ValueError('The libraries are synced differently: ' +
+                str(local.shape()) + ' and ' + str(remote.shape()))
+
+    differing = [0]
+    for level in range(DEPTH + 1):
+        if level > 0:
+            differing = [index * FANOUT + child for index in differing for
+                    child in xrange(FANOUT)]
+        localHashes = local.node_hashes(level, differing)
+        remoteHashes = remote.node_hashes(level, differing)
+        differing = [index for index, localHash, remoteHash in
+                zip(differing, localHashes, remoteHashes) if
+                localHash != remoteHash]
+        if not differing:
+            return LibraryDiff({}, {})
+
+    return LibraryDiff(local.bucket_entries(differing),
+            remote.bucket_entries(differing))
+
+
+class SyncPlan(object):
+    """
+    What syncing with a peer does to this library: the recipes to pull from
+    the peer (key and content hash), the ones to delete, and the conflicts,
+    the recipes both sides changed since the last sync.
+    """
+    def __init__(self):
+        self.pull = []
+        self.delete = []
+        self.conflicts = []
+        # The ones only this side changed, which the peer pulls instead
+        self.pushed = []
+        # The ones the peer couldn't send, left for the next sync
+        self.skipped = []
+        # The documents to pull, by content hash, and the base the plan was
+        # made from
+        self.documents = {}
+        self.base = {}
+
+def plan_sync(diff, base):
+    """
+    Works out what to do about every recipe two libraries don't agree on,
+    given what they agreed on the last time they synced (the base, key to
+    content hash).
+    """
+    plan = SyncPlan()
+    for key in diff.keys:
+        local = diff.local.get(key)
+        remote = diff.remote.get(key)
+        agreed = base.get(key)
+        if local == agreed:
+            # Only the peer changed it
+            if remote is None:
+                plan.delete.append(key)
+            else:
+                plan.pull.append((key, remote))
+        elif remote == agreed:
+            plan.pushed.append(key)
+        else:
+            plan.conflicts.append(key)
+    return plan
+
+def next_base(plan, entries):
+    """
+    Returns the base of the next sync, once a plan has been carried out:
+    every recipe as it is now, except the ones the sides still disagree on,
+    which keep the hash they last agreed on. Pulled recipes are taken to be
+    the way the peer has them, even if reading them changed them a little.
+    """
+    agreed = dict(entries)
+    for key, contentHash in plan.pull:
+        agreed[key] = contentHash
+    for key in plan.pushed + plan.conflicts + plan.skipped:
+        if key in plan.base:
+            agreed[key] = plan.base[key]
+        else:
+            agreed.pop(key, None)
+    return agreed
+
+def peer_name(name):
+    """Returns a peer's name made safe for a file name."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+
+def load_base(peer, folder=DEFAULT_SYNC_FOLDER):
+    """Returns the base of the last sync with a peer, empty if none."""
+    try:
+        with open(os.path.join(folder, peer_name(peer) + '.json')) as file:
+            return codec.loads(file.read())
+    except (IOError, ValueError):
+        return {}
+
+def save_base(peer, base, folder=DEFAULT_SYNC_FOLDER):
+    """
+    Saves the base of a sync with a peer. It is written to a temporary file
+    first, so a crash never leaves half a base.
+    """
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    path = os.path.join(folder, peer_name(peer) + '.json')
+    file = open(path + '.tmp', 'w')
+    file.write(codec.dumps(base, separators=(',', ':')))
+    file.close()
+
+    # Windows can't rename over an existing file
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(path + '.tmp', path)
+
+
+def prepare_sync(index, peer, name, folder=DEFAULT_SYNC_FOLDER):
+    """
+    Compares the library with a peer, and fetches the recipes to pull from
+    it. Returns the SyncPlan; once it has been carried out, finish_sync()
+    remembers the result as the base of the next sync.
+    """
+    base = load_base(name, folder)
+    plan = plan_sync(diff_libraries(index, peer), base)
+    plan.base = base
+
+    plan.documents = peer.documents([contentHash for key, contentHash in
+        plan.pull])
+    plan.skipped = [key for key, contentHash in plan.pull if contentHash
+            not in plan.documents]
+    plan.pull = [(key, contentHash) for key, contentHash in plan.pull if
+            contentHash in plan.documents]
+    return plan
+
+def finish_sync(index, plan, name, folder=DEFAULT_SYNC_FOLDER):
+    """
+    Saves the base of the next sync with a peer, once the library index is
+    up to date with the plan carried out.
+    """
+    save_base(name, next_base(plan, index.tree.entries()), folder)
+
+
+class SharedLibrary(object):
+    """
+    A library published in a folder, usually a subfolder of a shared one.
+    Reading it only reads the parts of its files that are asked for.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def exists(self):
+        return os.path.exists(self.path(TREE_FILE))
+
+    def publish(self, index):
+        """
+        Publishes a library into the folder: the recipe documents that
+        aren't there yet, then the tree and leaves, then removes the
+        documents that are no longer used. Documents are named by their
+        content hash, so unchanged recipes are never written again.
+        """
+        documentFolder = self.path(DOCUMENT_FOLDER)
+        if not os.path.isdir(documentFolder):
+            os.makedirs(documentFolder)
+
+        entries = index.tree.entries()
+        existing = set(os.listdir(documentFolder))
+        wanted = set([contentHash + '.rcpe' for contentHash in
+            entries.itervalues()])
+        missing = set([name[:-5] for name in wanted - existing])
+        for contentHash, document in index.documents(missing).iteritems():
+            file = open(os.path.join(documentFolder, contentHash + '.rcpe'),
+                    'w')
+            file.write(document)
+            file.close()
+
+        tree = index.tree
+        tree.update()
+        self.replace(TREE_FILE, struct.pack(TREE_HEADER, TREE_MAGIC,
+            SYNC_VERSION, FANOUT, DEPTH) + ''.join([''.join(level) for level
+                in tree.levels]))
+
+        # The offsets of every leaf's entries, then the entries
+        offsets = []
+        chunks = []
+        size = 0
+        for leaf in xrange(LEAVES):
+            offsets.append(size)
+            bucket = tree.buckets.get(leaf)
+            if bucket:
+                chunk = ''.join([key + '\0' + bucket[key] + '\n' for key in
+                    sorted(bucket)])
+                chunks.append(chunk)
+                size += len(chunk)
+        offsets.append(size)
+        self.replace(BUCKET_FILE, struct.pack('<' + str(LEAVES + 1) + 'I',
+            *offsets) + ''.join(chunks))
+
+        for name in existing - wanted:
+            try:
+                os.remove(os.path.join(documentFolder, name))
+            except OSError:
+                pass
+
+    def replace(self, name, data):
+        """Writes a file of the folder through a temporary file."""
+        path = self.path(name)
+        file = open(path + '.tmp', 'wb')
+        file.write(data)
+        file.close()
+
+        # Windows can't rename over an existing file
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
+
+    def shape(self):
+        with open(self.path(TREE_FILE), 'rb') as file:
+            header = file.read(struct.calcsize(TREE_HEADER))
+        magic, version, fanout, depth = struct.unpack(TREE_HEADER, header)
+        if magic != TREE_MAGIC:
+            raise ValueError(self.folder + ' has no recipe library')
+        return (version, fanout, depth)
+
+    def node_hashes(self, level, indexes):
+        # Where the level starts: after the header and the levels above
+        start = (struct.calcsize(TREE_HEADER) + 16 * sum([FANOUT ** above
+            for above in range(level)]))
+        with open(self.path(TREE_FILE), 'rb') as file:
+            if len(indexes) > WHOLE_LEVEL * FANOUT ** level:
+                file.seek(start)
+                data = file.read(16 * FANOUT ** level)
+                return [data[index * 16:index * 16 + 16] for index in
+                        indexes]
+
+            hashes = []
+            for index in indexes:
+                file.seek(start + 16 * index)
+                hashes.append(file.read(16))
+            return hashes
+
+    def bucket_entries(self, leaves):
+        entries = {}
+        entriesStart = 4 * (LEAVES + 1)
+        with open(self.path(BUCKET_FILE), 'rb') as file:
+            for leaf in leaves:
+                file.seek(4 * leaf)
+                start, end = struct.unpack('<2I', file.read(8))
+                if start == end:
+                    continue
+                file.seek(entriesStart + start)
+                for line in file.read(end - start).splitlines():
+                    key, contentHash = line.split('\0')
+                    entries[key] = contentHash
+        return entries
+
+    def documents(self, hashes):
+        documents = {}
+        for contentHash in hashes:
+            try:
+                with open(os.path.join(self.path(DOCUMENT_FOLDER),
+                        contentHash + '.rcpe')) as file:
+                    documents[contentHash] = file.read()
+            except IOError:
+                # Republished since its tree was read; the next sync gets it
+                pass
+        return documents
+
+
+class SyncRequestHandler(SocketServer.StreamRequestHandler):
+    """
+    Answers the requests of a peer: one JSON request per line, one JSON
+    answer per line. Hashes go over as hex.
+    """
+    def handle(self):
+        for line in self.rfile:
+            index = self.server.publisher.index
+            try:
+                request = codec.loads(line)
+                operation = request['op']
+                if operation == 'shape':
+                    answer = index.shape()
+                elif operation == 'nodes':
+                    answer = [digest.encode('hex') for digest in
+                        index.node_hashes(request['level'],
+                            request['indexes'])]
+                elif operation == 'entries':
+                    answer = index.bucket_entries(request['leaves'])
+                elif operation == 'documents':
+                    answer = index.documents(request['hashes'])
+                else:
+                    raise ValueError('Unknown request ' + operation)
+                response = {'answer': answer}
+            except (ValueError, KeyError, TypeError, IndexError), error:
+                response = {'error': str(error)}
+            self.wfile.write(codec.dumps(response, separators=(',', ':')) +
+                    '\n')
+            self.wfile.flush()
+
+
+class SyncPublisher(object):
+    """
+    Lives on the GUI side. Hands copies of the library index to the sync
+    server, so it never sees one half refreshed. Documents are still made
+    from the recipes themselves when asked for, and left out if the recipe
+    changed since.
+    """
+    def __init__(self):
+        self.index = LibraryIndex()
+
+    def publish(self, index):
+        """Publishes a copy of an up to date index."""
+        snapshot = LibraryIndex()
+        snapshot.tree = index.tree.copy()
+        # Refreshing makes new dictionaries of these, so they can be shared
+        snapshot.recipes = index.recipes
+        snapshot.hashes = index.hashes
+        # A single assignment, so the server sees either the old index or
+        # the new one
+        self.index = snapshot
+
+
+class SyncServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    Serves the library to peers over a local socket, answering every peer
+    in a thread of its own. The server itself runs in a background thread
+    too, see start().
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, publisher, host=DEFAULT_SYNC_HOST,
+            port=DEFAULT_SYNC_PORT):
+        SocketServer.TCPServer.__init__(self, (host, port),
+                SyncRequestHandler)
+        self.publisher = publisher
+        self.thread = None
+
+    def start(self):
+        """Starts serving in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        print 'Serving library sync on %s:%d' % self.server_address
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.shutdown()
+        self.server_close()
+
+
+class SocketPeer(object):
+    """A library served by a SyncServer, on this machine or another."""
+    def __init__(self, host=DEFAULT_SYNC_HOST, port=DEFAULT_SYNC_PORT):
+        self.connection = socket.create_connection((host, port))
+        self.file = self.connection.makefile('rb')
+
+    def request(self, operation, **arguments):
+        """
+        Sends a request and returns its answer. Raises ValueError if the
+        peer couldn't answer it.
+        """
+        arguments['op'] = operation
+        self.connection.sendall(codec.dumps(arguments,
+            separators=(',', ':')) + '\n')
+        line = self.file.readline()
+        if not line:
+            raise IOError('The peer closed the connection')
+        response = codec.loads(line)
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response['answer']
+
+    def close(self):
+        self.file.close()
+        self.connection.close()
+
+    def shape(self):
+        return tuple(self.request('shape'))
+
+    def node_hashes(self, level, indexes):
+        return [digest.decode('hex') for digest in self.request('nodes',
+            level=level, indexes=indexes)]
+
+    def bucket_entries(self, leaves):
+        # Keys went over as JSON strings, and come back as unicode
+        return dict([(key.encode('utf-8'), str(contentHash)) for key,
+            contentHash in self.request('entries', leaves=leaves).items()])
+
+    def documents(self, hashes):
+        return dict([(str(contentHash), document.encode('utf-8')) for
+            contentHash, document in self.request('documents',
+                hashes=list(hashes)).items()])
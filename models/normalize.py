@@ -0,0 +1,327 @@
+###############################################################################
+#
+# normalize.py
+#
+# Keeps the vocabulary of canonical ingredient names, so that "tomato",
+# "Tomatoes" and "tomatos" all end up as the same ingredient. Names are
+# looked up in three steps:
+#
+#   1. an exact lookup of the normalized name (lowercase, singular);
+#   2. a prefix lookup in a sorted list of names, for suggestions while the
+#      user is typing;
+#   3. a fuzzy lookup in an index of trigrams (every three letters of the
+#      name), for misspellings.
+#
+# Names are only merged without asking when they are variants of each other:
+# the same words, each spelled the same or off by a letter or so ("chilli",
+# "chili"). Names that are merely similar ("salted butter", "unsalted
+# butter") are only suggested.
+#
+# The fuzzy lookup only reads the postings of the rarest trigrams of a name,
+# and only compares the names that show up in at least two of them (prefix
+# filtering), which keeps it below a millisecond even with a vocabulary of a
+# hundred thousand names.
+#
+###############################################################################
+
+import bisect
+import math
+
+from models.foodtable import normalize_name
+
+# How similar two names have to be (as the share of trigrams they have in
+# common) to be suggested, and to be considered for merging without asking
+SUGGEST_THRESHOLD = 0.3
+MERGE_THRESHOLD = 0.4
+
+# How similar every word of two names has to be for them to be variants of
+# each other, as one less the share of letters that have to be edited. One
+# letter off in a word of five or more letters is a variant, "beef" and
+# "beet" are not
+WORD_THRESHOLD = 0.8
+
+# How many suggestion lists are remembered before the memory is cleared
+SUGGESTION_CACHE_SIZE = 1000
+
+def prefix_key(text):
+    """
+    Returns the key used for prefix lookups: lowercase, single spaces, but
+    not made singular, since the user hasn't finished typing yet.
+    """
+    return ' '.join(text.lower().split())
+
+def trigrams(key):
+    """
+    Returns the set of trigrams of a normalized name. The name is padded
+    with spaces, so the start and end of the name get trigrams of their own.
+    """
+    padded = '  ' + key + ' '
+    return frozenset([padded[start:start + 3] for start in
+        range(len(padded) - 2)])
+
+
+def edit_distance(first, second):
+    """
+    Returns how many letters have to be inserted, deleted or replaced to
+    turn one word into the other.
+    """
+    previous = range(len(second) + 1)
+    for row, letter in enumerate(first):
+        current = [row + 1]
+        for column, other in enumerate(second):
+            current.append(min(previous[column + 1] + 1, current[column] + 1,
+                previous[column] + (letter != other)))
+        previous = current
+    return previous[-1]
+
+def is_variant(key, other):
+    """
+    Returns whether two normalized names are variants of each other: the
+    same number of words, and every word spelled nearly the same.
+    """
+    words = key.split()
+    otherWords = other.split()
+    if len(words) != len(otherWords):
+        return False
+    for word, otherWord in zip(words, otherWords):
+        if word == otherWord:
+            continue
+        length = max(len(word), len(otherWord))
+        if 1 - edit_distance(word, otherWord) / float(length) < WORD_THRESHOLD:
+            return False
+    return True
+
+
+class IngredientNormalizer(object):
+    """
+    The vocabulary of canonical ingredient names, with the indexes needed to
+    suggest and merge names quickly.
+    """
+    def __init__(self, names=[]):
+        # The canonical names, and their normalized keys, by id
+        self.names = []
+        self.keys = []
+        # Normalized key to id
+        self.ids = {}
+        # The trigrams of every name, by id
+        self.trigramSets = []
+        # Trigram to the list of ids of the names that have it
+        self.postings = {}
+        # Sorted (prefix key, id) pairs for prefix lookups
+        self.prefixes = []
+        # Suggestions that have been made already, cleared whenever the
+        # vocabulary changes
+        self.suggestions = {}
+
+        self.add_names(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return normalize_name(name) in self.ids
+
+    def add(self, name):
+        """
+        Adds a name to the vocabulary, unless a name with the same normalized
+        key is there already. Returns the canonical name.
+        """
+        key = normalize_name(name)
+        if key in self.ids:
+            return self.names[self.ids[key]]
+
+        id = len(self.names)
+        self.names.append(name)
+        self.keys.append(key)
+        self.ids[key] = id
+
+        grams = trigrams(key)
+        self.trigramSets.append(grams)
+        for gram in grams:
+            if gram in self.postings:
+                self.postings[gram].append(id)
+            else:
+                self.postings[gram] = [id]
+
+        bisect.insort(self.prefixes, (prefix_key(name), id))
+        self.suggestions.clear()
+
+        return name
+
+    def add_names(self, names):
+        """Adds many names to the vocabulary."""
+        for name in names:
+            if name.strip():
+                self.add(name)
+
+    def find(self, name):
+        """
+        Returns the canonical name with the same normalized key as the given
+        name, or None if there is none.
+        """
+        id = self.ids.get(normalize_name(name))
+        if id is None:
+            return None
+        return self.names[id]
+
+    def complete(self, text, limit=10):
+        """Returns up to limit canonical names that start with the text."""
+        prefix = prefix_key(text)
+        if not prefix:
+            return []
+
+        start = bisect.bisect_left(self.prefixes, (prefix, -1))
+        completions = []
+        for key, id in self.prefixes[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            completions.append(self.names[id])
+
+        return completions
+
+    def similar(self, name, limit=10, threshold=SUGGEST_THRESHOLD):
+        """
+        Returns up to limit (similarity, canonical name) pairs of the names
+        that share at least the threshold of their trigrams with the given
+        name, most similar first. The similarity is the Jaccard index of the
+        two sets of trigrams.
+        """
+        grams = trigrams(normalize_name(name))
+        size = len(grams)
+
+        # A name that shares the threshold of its trigrams has at least this
+        # many trigrams in common with the given name. So it has to have at
+        # least two of the rarest (size - overlap + 2) of them, and only the
+        # names found twice in those postings have to be compared at all
+        overlap = int(math.ceil(threshold * size - 1e-9))
+        rarest = sorted(grams, key=lambda gram: len(self.postings.get(gram,
+            ())))[:size - overlap + 2]
+
+        seen = set()
+        candidates = set()
+        for gram in rarest:
+            ids = self.postings.get(gram, ())
+            if overlap >= 2:
+                candidates.update(seen.intersection(ids))
+            else:
+                candidates.update(ids)
+            seen.update(ids)
+
+        # Names much longer or shorter than the given name can't be similar
+        # enough either
+        smallest = threshold * size
+        largest = size / threshold
+
+        scored = []
+        for id in candidates:
+            other = self.trigramSets[id]
+            if not smallest <= len(other) <= largest:
+                continue
+            common = len(grams & other)
+            similarity = common / float(size + len(other) - common)
+            if similarity >= threshold:
+                scored.append((similarity, self.names[id]))
+
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return scored[:limit]
+
+    def suggest(self, text, limit=10):
+        """
+        Returns up to limit canonical names to suggest while the user is
+        typing: names that start with the text first, then names that are
+        spelled similarly.
+        """
+        cacheKey = (prefix_key(text), limit)
+        if cacheKey in self.suggestions:
+            return self.suggestions[cacheKey]
+
+        suggestions = self.complete(text, limit)
+        if len(suggestions) < limit and cacheKey[0]:
+            for similarity, name in self.similar(text, limit):
+                if name not in suggestions:
+                    suggestions.append(name)
+            suggestions = suggestions[:limit]
+
+        if len(self.suggestions) >= SUGGESTION_CACHE_SIZE:
+            self.suggestions.clear()
+        self.suggestions[cacheKey] = suggestions
+
+        return suggestions
+
+    def variant(self, name, threshold=MERGE_THRESHOLD):
+        """
+        Returns the most similar canonical name that is a variant of the
+        given name (see is_variant()), or None if there is none.
+        """
+        key = normalize_name(name)
+        for similarity, other in self.similar(name, 10, threshold):
+            if is_variant(key, normalize_name(other)):
+                return other
+        return None
+
+    def suggestion(self, name):
+        """
+        Returns the canonical name to suggest instead of the given name, or
+        None if the name is canonical already or nothing is like it. Only a
+        suggestion: it may well be a different ingredient.
+        """
+        name = ' '.join(name.split())
+        if not name:
+            return None
+
+        found = self.find(name)
+        if found is None:
+            similar = self.similar(name, 1, MERGE_THRESHOLD)
+            if similar:
+                found = similar[0][1]
+        if found == name:
+            return None
+        return found
+
+    def canonical(self, name, threshold=MERGE_THRESHOLD):
+        """
+        Returns the canonical name to use for the given name: the name with
+        the same normalized key, or else the most similar name that is a
+        variant of it. Names that match nothing become canonical names
+        themselves.
+        """
+        name = ' '.join(name.split())
+        if not name:
+            return name
+
+        found = self.find(name)
+        if found is not None:
+            return found
+
+        found = self.variant(name, threshold)
+        if found is not None:
+            return found
+
+        return self.add(name)
+
+    def normalize_ingredients(self, ingredients):
+        """
+        Replaces the name of every ingredient in the list with its canonical
+        name. Returns how many names were changed.
+        """
+        changed = 0
+        for ingredient in ingredients:
+            name = self.canonical(ingredient['name'])
+            if name != ingredient['name']:
+                ingredient['name'] = name
+                changed += 1
+
+        return changed
+
+
+# The normalizer shared by the whole application
+sharedNormalizer = None
+
+def get_normalizer():
+    """Returns the normalizer shared by the application."""
+    global sharedNormalizer
+
+    if sharedNormalizer is None:
+        sharedNormalizer = IngredientNormalizer()
+
+    return sharedNormalizer
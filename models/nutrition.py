@@ -0,0 +1,110 @@
+###############################################################################
+#
+# nutrition.py
+#
+# Computes the nutrition totals of recipes from a local nutrient table (by
+# default ./data/nutrients.json), using the food table machinery in
+# foodtable.py. The totals of a recipe are cached until its ingredients or
+# the nutrient table change.
+#
+###############################################################################
+
+from models import codec
+
+from models.foodtable import *
+
+# Where the nutrient table is loaded from by default
+DEFAULT_TABLE_PATH = './data/nutrients.json'
+
+class NutrientTable(FoodTable):
+    """
+    A table of nutrient values per gram of food. The nutrient table file
+    maps food names to the nutrients per 100 grams ("per_100g"), the density
+    in grams per milliliter ("density") and optionally the weight of one of
+    some other unit in grams ("grams_per").
+    """
+    def __init__(self, nutrients, units, foods):
+        self.nutrients = nutrients
+        self.units = units
+
+        perGramFoods = {}
+        for name, food in foods.items():
+            perGramFoods[name] = ([value / 100.0 for value in
+                food['per_100g']], food.get('density', 1.0),
+                food.get('grams_per', {}))
+
+        super(NutrientTable, self).__init__(nutrients, perGramFoods)
+
+    @classmethod
+    def load(cls, path=DEFAULT_TABLE_PATH):
+        """
+        Loads a nutrient table file. Raises ValueError or KeyError if the
+        file is broken.
+        """
+        file = open(path, 'r')
+        raw_table = codec.loads(file.read())
+        file.close()
+
+        if not isinstance(raw_table, dict):
+            raise ValueError('Not a nutrient table: ' + path)
+
+        return cls(raw_table['nutrients'], raw_table.get('units', {}),
+                raw_table['foods'])
+
+
+class NutritionFacts(object):
+    """The nutrition totals of a single recipe."""
+    def __init__(self, nutrients, units, totals, servingSize, missing):
+        self.nutrients = nutrients
+        self.units = units
+        # Totals of the whole recipe, in the same order as the nutrients
+        self.totals = totals
+        self.servingSize = servingSize
+        # Names of the ingredients that could not be found in the table
+        self.missing = missing
+
+    def per_serving(self):
+        """Returns the totals divided by the serving size."""
+        if not self.servingSize:
+            return list(self.totals)
+        return [total / float(self.servingSize) for total in self.totals]
+
+    def as_dict(self, perServing=False):
+        """Returns the totals as a dictionary of nutrient names to values."""
+        if perServing:
+            values = self.per_serving()
+        else:
+            values = self.totals
+        return dict(zip(self.nutrients, values))
+
+
+class NutritionEngine(TotalsEngine):
+    """Computes and caches the NutritionFacts of recipes."""
+    def make_result(self, recipe, entry):
+        return NutritionFacts(self.table.nutrients, self.table.units,
+                entry.totals, recipe.servingSize, entry.missing)
+
+
+# The engine shared by the whole application, loaded on first use
+sharedEngine = None
+
+def get_nutrition_engine(path=DEFAULT_TABLE_PATH):
+    """
+    Returns the engine shared by the application, loading the nutrient table
+    the first time. Returns None if there is no nutrient table, or it can't
+    be read.
+    """
+    global sharedEngine
+
+    if sharedEngine is None:
+        try:
+            sharedEngine = NutritionEngine(NutrientTable.load(path))
+        except IOError:
+            print 'No nutrient table found at ' + path
+            return None
+        except (ValueError, KeyError, TypeError), error:
+            print ('The nutrient table at ' + path + ' could not be read: ' +
+                    str(error))
+            return None
+
+    return sharedEngine
@@ -0,0 +1,263 @@
+###############################################################################
+#
+# pantry.py
+#
+# Keeps the ingredients on hand, and takes them off shopping lists. The
+# pantry is saved to a file (by default ./data/pantry.json), so it is still
+# there on the next start.
+#
+# Ingredients are matched by their normalized name ("Tomatoes" is "tomato")
+# and by what their unit measures: units of mass are all counted in grams
+# and units of volume in milliliters, so "2 cups milk" on a shopping list is
+# taken out of "1 l milk" in the pantry. Any other unit ("pc", "clove",
+# "can") only matches itself. The pantry is indexed by that key, and what
+# every (name, unit) pair is keyed to is memoized, so taking the pantry off
+# a shopping list is a dictionary lookup per ingredient.
+#
+# Changes (what was bought, what was cooked) are applied in bulk: all of them
+# go through the index in a single pass, and the file is written once.
+#
+###############################################################################
+
+import os
+
+from models import codec
+
+from models.foodtable import MASS_UNITS, VOLUME_UNITS, normalize_name
+from models.ingredientparser import UNITS
+
+# Where the pantry is kept by default
+DEFAULT_PANTRY_PATH = './data/pantry.json'
+
+# Pantry files of another version are ignored
+PANTRY_VERSION = 1
+
+# Converting between units rounds, so what is left of an amount is dropped
+# if it is under this share of it: that much is a rounding error, not food
+ROUNDING_SHARE = 1e-6
+
+# How many decimals quantities are kept to, like the quantity spinbox
+QUANTITY_DECIMALS = 2
+
+# (name, unit) to what it is keyed by in the pantry, see measure()
+keyMemo = {}
+
+def measure(name, unit):
+    """
+    Returns what an ingredient with the given name and unit is kept under in
+    the pantry, and how much of the unit of the key one of its unit is: for
+    "cup", ((food, 'ml'), 236.59). Units that aren't of mass or volume are
+    keys of their own, with a factor of 1. Memoized.
+    """
+    measured = keyMemo.get((name, unit))
+    if measured is None:
+        spelled = unit.strip()
+        canonical = UNITS.get(spelled) or UNITS.get(spelled.lower(),
+                spelled.lower())
+        food = normalize_name(name)
+        if canonical in MASS_UNITS:
+            measured = ((food, 'g'), MASS_UNITS[canonical])
+        elif canonical in VOLUME_UNITS:
+            measured = ((food, 'ml'), VOLUME_UNITS[canonical])
+        else:
+            measured = ((food, canonical), 1.0)
+
+        if len(keyMemo) >= 1 << 16:
+            keyMemo.clear()
+        keyMemo[(name, unit)] = measured
+    return measured
+
+
+class Pantry(object):
+    """
+    The ingredients on hand. Every item is kept under its key (see
+    measure()) as [name, quantity, unit]: the name and unit it was first
+    stocked with, and how much there is in the unit of its key.
+    """
+    def __init__(self, path=DEFAULT_PANTRY_PATH):
+        self.path = path
+        self.items = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_PANTRY_PATH):
+        """
+        Loads the pantry kept at the given path. A pantry that isn't there
+        yet, or is of another version, is empty. Raises ValueError if the
+        file is broken.
+        """
+        pantry = cls(path)
+        if not os.path.exists(path):
+            return pantry
+
+        file = open(path, 'r')
+        raw_pantry = codec.loads(file.read())
+        file.close()
+
+        if not isinstance(raw_pantry, dict):
+            raise ValueError('Not a pantry file: ' + path)
+        if raw_pantry.get('version') != PANTRY_VERSION:
+            print 'Pantry of another version at ' + path + ', ignored'
+            return pantry
+        pantry.apply(raw_pantry['items'])
+        return pantry
+
+    def save(self):
+        """
+        Writes the pantry to its file. It is written to a temporary file
+        first, so a crash never leaves half a pantry.
+        """
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        temporaryPath = self.path + '.tmp'
+        file = open(temporaryPath, 'w')
+        file.write(codec.dumps({'version': PANTRY_VERSION,
+            'items': self.listing()}, indent=1))
+        file.close()
+
+        # Windows can't rename over an existing file
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temporaryPath, self.path)
+
+    def copy(self):
+        """
+        Returns a copy of the pantry, for taking off shopping lists in
+        another thread while this one goes on being changed.
+        """
+        pantry = Pantry(self.path)
+        pantry.items = dict([(key, list(item)) for key, item in
+            self.items.items()])
+        return pantry
+
+    def __len__(self):
+        return len(self.items)
+
+    def listing(self):
+        """
+        Returns what is in the pantry as (name, quantity, unit), in the unit
+        every item was stocked with, sorted by name.
+        """
+        listing = []
+        for name, quantity, unit in self.items.values():
+            listing.append((name, round(quantity / measure(name, unit)[1],
+                QUANTITY_DECIMALS), unit))
+        listing.sort(key=lambda item: (item[0].lower(), item[2]))
+        return listing
+
+    def on_hand(self, name, unit):
+        """Returns how much of an ingredient there is, in the given unit."""
+        key, factor = measure(name, unit)
+        item = self.items.get(key)
+        if item is None:
+            return 0.0
+        return item[1] / factor
+
+    def apply(self, changes):
+        """
+        Applies changes to the pantry, given as (name, quantity, unit):
+        positive quantities are added, negative ones taken out. Items that
+        run out are dropped. Doesn't save the pantry.
+        """
+        items = self.items
+        for name, quantity, unit in changes:
+            key, factor = measure(name, unit)
+            amount = float(quantity) * factor
+            item = items.get(key)
+            if item is None:
+                if amount > 0:
+                    items[key] = [name, amount, unit]
+            else:
+                before = item[1]
+                item[1] += amount
+                # Taking out what was put in, in another unit, can leave a
+                # rounding error behind
+                if item[1] <= before * ROUNDING_SHARE:
+                    del items[key]
+
+    def add(self, ingredients):
+        """
+        Adds ingredients to the pantry, given as (name, quantity, unit),
+        like what was bought off a shopping list, and saves it.
+        """
+        self.apply(ingredients)
+        self.save()
+
+    def take(self, ingredients):
+        """
+        Takes ingredients out of the pantry, given as (name, quantity,
+        unit), like what a recipe that was cooked used, and saves it. What
+        there isn't enough of runs out.
+        """
+        self.apply([(name, -quantity, unit) for name, quantity, unit in
+            ingredients])
+        self.save()
+
+    def discard(self, ingredients):
+        """
+        Drops ingredients from the pantry altogether, given as (name,
+        quantity, unit), and saves it.
+        """
+        for name, quantity, unit in ingredients:
+            self.items.pop(measure(name, unit)[0], None)
+        self.save()
+
+    def offset(self, ingredients):
+        """
+        Takes the pantry off a shopping list of (name, quantity, unit).
+        Returns every ingredient as (name, quantity to buy, unit, quantity
+        there is), in order. An ingredient that comes up more than once
+        (in cups and in tablespoons) is taken out of the same item, so
+        nothing on hand is counted twice. The pantry itself isn't changed.
+        """
+        items = self.items
+        # How much of every item the ingredients so far have used
+        used = {}
+        offset = []
+        for name, quantity, unit in ingredients:
+            key, factor = measure(name, unit)
+            item = items.get(key)
+            if item is None:
+                offset.append((name, quantity, unit, 0.0))
+                continue
+
+            needed = float(quantity) * factor
+            available = item[1] - used.get(key, 0.0)
+            taken = max(min(available, needed), 0.0)
+            used[key] = used.get(key, 0.0) + taken
+
+            remaining = needed - taken
+            if remaining <= needed * ROUNDING_SHARE:
+                remaining = 0.0
+            offset.append((name, round(remaining / factor,
+                QUANTITY_DECIMALS), unit, round(taken / factor,
+                    QUANTITY_DECIMALS)))
+        return offset
+
+    def net_list(self, ingredients):
+        """
+        Returns what is left to buy of a shopping list of (name, quantity,
+        unit) once the pantry is taken off, as (name, quantity, unit).
+        """
+        return [(name, quantity, unit) for name, quantity, unit, onHand in
+                self.offset(ingredients) if quantity > 0]
+
+
+# The pantry shared by the whole application, loaded on first use
+sharedPantry = None
+
+def get_pantry(path=DEFAULT_PANTRY_PATH):
+    """
+    Returns the pantry shared by the application, loading it the first
+    time. A pantry file that can't be read gives an empty pantry.
+    """
+    global sharedPantry
+
+    if sharedPantry is None:
+        try:
+            sharedPantry = Pantry.load(path)
+        except (ValueError, KeyError, TypeError):
+            print 'Pantry at ' + path + ' could not be read, starting empty'
+            sharedPantry = Pantry(path)
+    return sharedPantry
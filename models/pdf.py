@@ -0,0 +1,413 @@
+###############################################################################
+#
+# pdf.py
+#
+# A small PDF writer, just enough to print recipes: pages of text in the
+# standard Helvetica fonts (which every PDF reader has, so nothing has to be
+# embedded) and JPEG and PNG images. It has no dependencies, and nothing in
+# it touches Qt, so pages can be made in worker processes while the GUI goes
+# on; see binder.py.
+#
+# Objects are written to the file as soon as they are added, and only their
+# offsets are kept, so a document of thousands of pages never has to be held
+# in memory at once.
+#
+###############################################################################
+
+import struct
+import zlib
+
+# The size of the pages, in points (US Letter)
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+# The fonts pages are written in, by the names pages use for them
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+
+# The widths of the characters 32 to 126 of the fonts, in thousandths of the
+# font size, from their Adobe font metrics
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333,
+    278, 278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278,
+    584, 584, 584, 556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278,
+    500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944,
+    667, 667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556,
+    278, 556, 556, 222, 222, 500, 222, 833, 556, 556, 556, 556, 333, 500,
+    278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333,
+    278, 278, 556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333,
+    584, 584, 584, 611, 975, 722, 722, 722, 722, 667, 611, 778, 722, 278,
+    556, 722, 611, 833, 722, 778, 667, 778, 722, 667, 611, 722, 667, 944,
+    667, 667, 611, 333, 278, 333, 584, 556, 333, 556, 611, 556, 611, 556,
+    333, 611, 611, 278, 278, 556, 278, 889, 611, 611, 611, 611, 389, 556,
+    333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584]
+
+# Widths of the characters above 126 (in WinAnsiEncoding) that recipes use
+# and that are far from the average width: bullets, quotes, dashes, degrees
+# and the vulgar fractions
+SPECIAL_WIDTHS = {0x91: 222, 0x92: 222, 0x93: 333, 0x94: 333, 0x95: 350,
+        0x96: 556, 0x97: 1000, 0xb0: 400, 0xbc: 834, 0xbd: 834, 0xbe: 834}
+
+def width_table(widths):
+    """
+    Returns the widths of all 256 characters of a font, guessing an average
+    width for the ones that aren't known.
+    """
+    table = [0] * 32 + widths + [556] * 129
+    for character, width in SPECIAL_WIDTHS.items():
+        table[character] = width
+    return table
+
+# The width of every character of every font, by font name
+WIDTHS = {'F1': width_table(HELVETICA_WIDTHS),
+        'F2': width_table(HELVETICA_BOLD_WIDTHS)}
+
+def encode_text(text):
+    """
+    Encodes text the way the fonts are encoded (Windows-1252, which covers
+    accented latin letters, bullets and curly quotes). Anything else is
+    written as a question mark.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return text.replace(u'\t', u' ').encode('cp1252', 'replace')
+
+def escape_text(data):
+    """Escapes encoded text for a PDF string."""
+    return (data.replace('\\', '\\\\').replace('(', '\\(')
+            .replace(')', '\\)').replace('\r', ' '))
+
+def text_width(data, font):
+    """
+    Returns the width of encoded text in a font, in thousandths of the font
+    size.
+    """
+    widths = WIDTHS[font]
+    return sum([widths[character] for character in bytearray(data)])
+
+def wrap_text(data, font, size, width):
+    """
+    Breaks encoded text into the lines that fit in a width, in points.
+    Words too long for a line are broken wherever they have to be.
+    """
+    widths = WIDTHS[font]
+    limit = width * 1000.0 / size
+    space = widths[32]
+
+    lines = []
+    words = []
+    used = 0
+    for word in data.split():
+        wordWidth = text_width(word, font)
+
+        while wordWidth > limit:
+            if words:
+                lines.append(' '.join(words))
+                words = []
+                used = 0
+            # As many characters as fit, but at least one
+            cut = 0
+            taken = 0
+            for character in bytearray(word):
+                if cut and taken + widths[character] > limit:
+                    break
+                taken += widths[character]
+                cut += 1
+            lines.append(word[:cut])
+            word = word[cut:]
+            wordWidth = text_width(word, font)
+
+        if not word:
+            continue
+        if words and used + space + wordWidth > limit:
+            lines.append(' '.join(words))
+            words = []
+            used = 0
+        if words:
+            used += space
+        used += wordWidth
+        words.append(word)
+
+    if words or not lines:
+        lines.append(' '.join(words))
+    return lines
+
+
+class PdfImage(object):
+    """
+    An image as a PDF image object: its size in pixels, the entries of its
+    dictionary and its data, with its transparency as another image if it
+    has any.
+    """
+    def __init__(self, width, height, entries, data, mask=None):
+        self.width = width
+        self.height = height
+        self.entries = entries
+        self.data = data
+        self.mask = mask
+
+def read_jpeg(data):
+    """
+    Reads the size and colors of a JPEG image, which PDF readers decode
+    themselves. Returns None if it isn't a JPEG image PDF can show, or has
+    no pixels.
+    """
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != '\xff':
+            return None
+        marker = ord(data[position + 1])
+        # Markers without a length
+        if marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            position += 2
+            continue
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        # The start of frame markers hold the size and the colors
+        if (0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc) and
+                position + 10 <= len(data)):
+            depth, height, width, components = struct.unpack('>BHHB',
+                    data[position + 4:position + 10])
+            colorSpace = {1: '/DeviceGray', 3: '/DeviceRGB',
+                    4: '/DeviceCMYK'}.get(components)
+            if colorSpace is None or depth != 8 or not width or not height:
+                return None
+            entries = ('/ColorSpace ' + colorSpace +
+                    ' /BitsPerComponent 8 /Filter /DCTDecode')
+            # CMYK JPEGs are stored inverted, by Photoshop at least
+            if components == 4:
+                entries += ' /Decode [1 0 1 0 1 0 1 0]'
+            return PdfImage(width, height, entries, data)
+        position += 2 + length
+    return None
+
+def unfilter_png(raw, stride, height, pixelSize):
+    """
+    Undoes the filters PNG images put on every row of pixels, returning the
+    pixels themselves.
+    """
+    pixels = bytearray(stride * height)
+    prior = bytearray(stride)
+    position = 0
+    for row in xrange(height):
+        kind = raw[position]
+        line = raw[position + 1:position + 1 + stride]
+        position += stride + 1
+
+        if kind == 1:
+            for i in xrange(pixelSize, stride):
+                line[i] = (line[i] + line[i - pixelSize]) & 0xff
+        elif kind == 2:
+            for i in xrange(stride):
+                line[i] = (line[i] + prior[i]) & 0xff
+        elif kind == 3:
+            for i in xrange(stride):
+                left = line[i - pixelSize] if i >= pixelSize else 0
+                line[i] = (line[i] + ((left + prior[i]) >> 1)) & 0xff
+        elif kind == 4:
+            for i in xrange(stride):
+                if i >= pixelSize:
+                    left = line[i - pixelSize]
+                    upperLeft = prior[i - pixelSize]
+                else:
+                    left = upperLeft = 0
+                up = prior[i]
+                estimate = left + up - upperLeft
+                toLeft = abs(estimate - left)
+                toUp = abs(estimate - up)
+                toUpperLeft = abs(estimate - upperLeft)
+                if toLeft <= toUp and toLeft <= toUpperLeft:
+                    nearest = left
+                elif toUp <= toUpperLeft:
+                    nearest = up
+                else:
+                    nearest = upperLeft
+                line[i] = (line[i] + nearest) & 0xff
+
+        pixels[row * stride:(row + 1) * stride] = line
+        prior = line
+    return pixels
+
+def read_png(data):
+    """
+    Reads a PNG image. PDF can decompress PNG rows itself, so opaque images
+    are passed through as they are. Transparent ones have to be decoded, to
+    split their transparency off into a mask. Returns None if it isn't a PNG
+    image PDF can show (interlaced ones, mostly, and empty ones).
+    """
+    position = 8
+    header = None
+    palette = ''
+    chunks = []
+    while position + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == 'IHDR':
+            header = struct.unpack('>IIBBBBB', body[:13])
+        elif kind == 'PLTE':
+            palette = body
+        elif kind == 'IDAT':
+            chunks.append(body)
+        elif kind == 'IEND':
+            break
+
+    if header is None:
+        return None
+    width, height, depth, colorType, _, _, interlaced = header
+    # Images without pixels can't be scaled to fit
+    if interlaced or not width or not height:
+        return None
+
+    compressed = ''.join(chunks)
+    if colorType in (0, 2, 3):
+        colors = {0: 1, 2: 3, 3: 1}[colorType]
+        if colorType == 3:
+            colorSpace = ('[/Indexed /DeviceRGB ' +
+                    str(len(palette) // 3 - 1) + ' <' +
+                    palette.encode('hex') + '>]')
+        else:
+            colorSpace = '/DeviceGray' if colors == 1 else '/DeviceRGB'
+        entries = ('/ColorSpace ' + colorSpace + ' /BitsPerComponent ' +
+                str(depth) + ' /Filter /FlateDecode /DecodeParms ' +
+                '<< /Predictor 15 /Colors ' + str(colors) +
+                ' /BitsPerComponent ' + str(depth) + ' /Columns ' +
+                str(width) + ' >>')
+        return PdfImage(width, height, entries, compressed)
+
+    # Gray or colors with transparency
+    if depth != 8 or colorType not in (4, 6):
+        return None
+    pixelSize = 2 if colorType == 4 else 4
+    colors = pixelSize - 1
+    pixels = unfilter_png(bytearray(zlib.decompress(compressed)),
+            width * pixelSize, height, pixelSize)
+
+    color = bytearray(width * height * colors)
+    for channel in xrange(colors):
+        color[channel::colors] = pixels[channel::pixelSize]
+    alpha = pixels[colors::pixelSize]
+
+    mask = PdfImage(width, height, '/ColorSpace /DeviceGray ' +
+            '/BitsPerComponent 8 /Filter /FlateDecode',
+            zlib.compress(str(alpha)))
+    colorSpace = '/DeviceGray' if colors == 1 else '/DeviceRGB'
+    return PdfImage(width, height, '/ColorSpace ' + colorSpace +
+            ' /BitsPerComponent 8 /Filter /FlateDecode',
+            zlib.compress(str(color)), mask)
+
+def read_image(path):
+    """
+    Reads an image file for a PDF. Returns None if it can't be read or isn't
+    a JPEG or PNG image PDF can show.
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except IOError:
+        return None
+
+    try:
+        if data.startswith('\xff\xd8'):
+            return read_jpeg(data)
+        if data.startswith('\x89PNG\r\n\x1a\n'):
+            return read_png(data)
+    except (struct.error, zlib.error, IndexError):
+        # Broken images are left out like any other unreadable ones
+        pass
+    return None
+
+
+class PdfWriter(object):
+    """
+    Writes a PDF document to a file, one object at a time. Objects are
+    numbered as they are added, or can have a number reserved first so that
+    other objects can refer to them before they are written.
+    """
+    def __init__(self, file):
+        self.file = file
+        # The offset of every object in the file, by number (there is no
+        # object 0)
+        self.offsets = [None]
+        self.position = 0
+        # The binary comment tells tools the file isn't plain text
+        self.write('%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+        # The fonts are the same for every page
+        self.fonts = {}
+        for name in sorted(FONTS):
+            self.fonts[name] = self.add('<< /Type /Font /Subtype /Type1 ' +
+                    '/BaseFont /' + FONTS[name] +
+                    ' /Encoding /WinAnsiEncoding >>')
+
+    def write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def reserve(self):
+        """Returns the number of an object that will be added later."""
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def add(self, body, number=None):
+        """Writes an object, returning its number."""
+        if number is None:
+            number = self.reserve()
+        self.offsets[number] = self.position
+        self.write(str(number) + ' 0 obj\n' + body + '\nendobj\n')
+        return number
+
+    def add_stream(self, entries, data, number=None):
+        """
+        Writes a stream object, with the given dictionary entries besides
+        its length. Returns its number.
+        """
+        return self.add('<< ' + entries + ' /Length ' + str(len(data)) +
+                ' >>\nstream\n' + data + '\nendstream', number)
+
+    def add_image(self, image):
+        """Writes an image and its mask, returning the number of the image."""
+        entries = ('/Type /XObject /Subtype /Image /Width ' +
+                str(image.width) + ' /Height ' + str(image.height) + ' ' +
+                image.entries)
+        if image.mask is not None:
+            entries += ' /SMask ' + str(self.add_image(image.mask)) + ' 0 R'
+        return self.add_stream(entries, image.data)
+
+    def add_page(self, parent, contents, images):
+        """
+        Writes a page, made of the given content streams and drawing the
+        given images (as /Im0, /Im1 and so on). Returns its number.
+        """
+        fonts = ' '.join(['/' + name + ' ' + str(self.fonts[name]) + ' 0 R'
+            for name in sorted(self.fonts)])
+        xObjects = ' '.join(['/Im' + str(index) + ' ' + str(number) + ' 0 R'
+            for index, number in enumerate(images)])
+        return self.add('<< /Type /Page /Parent ' + str(parent) + ' 0 R ' +
+                '/MediaBox [0 0 ' + str(PAGE_WIDTH) + ' ' +
+                str(PAGE_HEIGHT) + '] /Contents [' +
+                ' '.join([str(number) + ' 0 R' for number in contents]) +
+                '] /Resources << /Font << ' + fonts + ' >> /XObject << ' +
+                xObjects + ' >> >> >>')
+
+    def close(self, pagesNumber, pages):
+        """
+        Writes the page tree (at its reserved number), the catalog and the
+        cross-reference table that ends the document.
+        """
+        self.add('<< /Type /Pages /Kids [' + ' '.join([str(number) + ' 0 R'
+            for number in pages]) + '] /Count ' + str(len(pages)) + ' >>',
+            pagesNumber)
+        catalog = self.add('<< /Type /Catalog /Pages ' + str(pagesNumber) +
+                ' 0 R >>')
+
+        start = self.position
+        # Every entry of the table takes exactly 20 bytes
+        table = ['xref\n0 ' + str(len(self.offsets)) + '\n',
+                '0000000000 65535 f \n']
+        for offset in self.offsets[1:]:
+            table.append('%010d 00000 n \n' % offset)
+        table.append('trailer\n<< /Size ' + str(len(self.offsets)) +
+                ' /Root ' + str(catalog) + ' 0 R >>\nstartxref\n' +
+                str(start) + '\n%%EOF\n')
+        self.write(''.join(table))
@@ -0,0 +1,179 @@
+###############################################################################
+#
+# quantity.py
+#
+# Exact quantities for scaling recipes. Quantities are entered in spinboxes
+# with two decimals, so a third of a cup is stored as 0.33, and scaling it as
+# a float gives things like 0.33 * 3 = 0.99 cups. Here quantities are turned
+# into exact fractions instead (0.33 is taken to mean 1/3, since that is the
+# kitchen fraction the spinbox could not show), scaled as fractions, and
+# formatted the way a cook would write them: "1 1/3 cups", "3/4 tsp".
+#
+# Converting, scaling and formatting are all memoized, since the same few
+# quantities, serving sizes and units come up over and over again.
+#
+###############################################################################
+
+from fractions import Fraction
+
+# The fractions cooks use. Amounts with other fractions are shown as
+# decimals, unless they are close enough to one of these
+KITCHEN_DENOMINATORS = (2, 3, 4, 8)
+
+# How far a decimal from a spinbox can be from a kitchen fraction and still be
+# taken to mean it (the spinboxes round to two decimals)
+SPINBOX_PRECISION = Fraction(1, 200)
+
+# How far, relatively, a scaled amount can be from a kitchen fraction and
+# still be shown as one
+DISPLAY_TOLERANCE = Fraction(1, 50)
+
+# Units that are measured in decimals rather than fractions
+METRIC_UNITS = frozenset(['g', 'kg', 'mg', 'ml', 'l', 'cl', 'dl'])
+
+# Units that get an s (or es) when there's more than one of them. Units that
+# aren't here (abbreviations, mostly) are left as they are
+PLURAL_UNITS = {'cup': 'cups', 'clove': 'cloves', 'can': 'cans',
+        'slice': 'slices', 'stalk': 'stalks', 'sprig': 'sprigs',
+        'pinch': 'pinches', 'piece': 'pieces', 'bunch': 'bunches',
+        'head': 'heads', 'leaf': 'leaves', 'stick': 'sticks',
+        'teaspoon': 'teaspoons', 'tablespoon': 'tablespoons',
+        'pound': 'pounds', 'ounce': 'ounces', 'dash': 'dashes'}
+
+# How many entries every memo keeps at most before it starts over
+MEMO_SIZE = 1 << 16
+
+# The memos: float to Fraction, float to its (numerator, denominator) pair,
+# (from servings, to servings) to the factor between them, and (quantity,
+# unit) to the formatted amount
+exactMemo = {}
+ratioMemo = {}
+factorMemo = {}
+formatMemo = {}
+
+def remember(memo, key, value):
+    """Stores a value in a memo, emptying it first if it is full."""
+    if len(memo) >= MEMO_SIZE:
+        memo.clear()
+    memo[key] = value
+    return value
+
+def nearest_kitchen_fraction(value, tolerance):
+    """
+    Returns the kitchen fraction closest to a fraction if it is within the
+    tolerance of it, or None.
+    """
+    best = None
+    for denominator in KITCHEN_DENOMINATORS:
+        candidate = Fraction(int(round(value * denominator)), denominator)
+        if (abs(candidate - value) <= tolerance and (best is None or
+                abs(candidate - value) < abs(best - value))):
+            best = candidate
+    return best
+
+def exact_quantity(value):
+    """
+    Returns a quantity (a float, an int or a Fraction) as an exact Fraction.
+    Floats are read as the decimals they were typed as, and decimals that
+    round a kitchen fraction to two places are taken to mean that fraction.
+    """
+    exact = exactMemo.get(value)
+    if exact is not None:
+        return exact
+
+    # Not isinstance(), which goes through the numbers ABCs and is slow
+    if type(value) is Fraction:
+        return value
+
+    if isinstance(value, float):
+        # repr gives the shortest decimal that reads back as the float, which
+        # is what was typed in
+        exact = Fraction(repr(value))
+    else:
+        exact = Fraction(value)
+
+    if exact.denominator > 1:
+        kitchen = nearest_kitchen_fraction(exact, SPINBOX_PRECISION)
+        # Tiny amounts are not meant to be nothing at all
+        if kitchen is not None and kitchen != 0:
+            exact = kitchen
+
+    return remember(exactMemo, value, exact)
+
+def scale_quantity(quantity, factor):
+    """Returns a quantity multiplied by an exact factor, as a Fraction."""
+    return exact_quantity(quantity) * factor
+
+def scale_to_float(quantity, numerator, denominator):
+    """
+    Returns a quantity multiplied by the exact factor numerator/denominator,
+    as a float. The exact product is only rounded once, at the end, and
+    making no Fraction of it is much quicker when only the float is wanted.
+    """
+    # The numerator and denominator of a Fraction are properties, which are
+    # slow enough to be worth remembering as a plain pair
+    ratio = ratioMemo.get(quantity)
+    if ratio is None:
+        exact = exact_quantity(quantity)
+        ratio = remember(ratioMemo, quantity, (exact.numerator,
+            exact.denominator))
+    return ratio[0] * numerator / float(ratio[1] * denominator)
+
+def scale_factor(fromServings, toServings):
+    """
+    Returns the exact factor that scales a recipe between servings. Raises
+    ValueError if the recipe is for no servings, as nothing scales from it.
+    """
+    key = (fromServings, toServings)
+    factor = factorMemo.get(key)
+    if factor is None:
+        if not exact_quantity(fromServings):
+            raise ValueError('A recipe of no servings can not be scaled')
+        factor = remember(factorMemo, key, exact_quantity(toServings) /
+                exact_quantity(fromServings))
+    return factor
+
+def format_number(quantity, unit):
+    """
+    Formats a quantity as a whole number and a kitchen fraction ("1 1/3"),
+    or as a decimal for metric units and amounts that don't come close to a
+    kitchen fraction.
+    """
+    if quantity.denominator == 1:
+        return str(quantity.numerator)
+
+    if unit not in METRIC_UNITS:
+        kitchen = quantity
+        if quantity.denominator not in KITCHEN_DENOMINATORS:
+            kitchen = nearest_kitchen_fraction(quantity,
+                    quantity * DISPLAY_TOLERANCE)
+
+        if kitchen is not None and kitchen != 0:
+            whole, part = divmod(kitchen.numerator, kitchen.denominator)
+            if part == 0:
+                return str(whole)
+            fraction = str(part) + '/' + str(kitchen.denominator)
+            if whole == 0:
+                return fraction
+            return str(whole) + ' ' + fraction
+
+    # Up to two decimals, without trailing zeroes, or two significant digits
+    # for tiny amounts that would round to nothing
+    if abs(quantity) < Fraction(1, 100):
+        return '%.2g' % float(quantity)
+    return ('%.2f' % float(quantity)).rstrip('0').rstrip('.')
+
+def format_amount(quantity, unit):
+    """
+    Formats a quantity and its unit the way a cook would write them, like
+    "1 1/3 cups". Memoized.
+    """
+    key = (quantity, unit)
+    amount = formatMemo.get(key)
+    if amount is None:
+        quantity = exact_quantity(quantity)
+        number = format_number(quantity, unit)
+        if quantity > 1 and unit in PLURAL_UNITS:
+            unit = PLURAL_UNITS[unit]
+        amount = remember(formatMemo, key, (number + ' ' + unit).strip())
+    return amount
@@ -0,0 +1,299 @@
+###############################################################################
+#
+# recipefolder.py
+#
+# Keeps the library in sync with a folder of .rcpe files. A manifest kept in
+# the folder remembers the modification time, size and hash of every recipe
+# file, along with the recipe it holds. Scanning the folder only stats the
+# files: a file is only read again when its time or size changed, and only
+# parsed again when its hash changed as well. On a restart, unchanged recipes
+# come straight out of the manifest, without opening their files.
+#
+# The manifest is a journal, one JSON line per file that changed, so that a
+# change during the session only appends a line instead of writing out the
+# whole library. When most of its lines are out of date, it is written again
+# from scratch.
+#
+###############################################################################
+
+import hashlib
+import os
+
+from models import codec
+
+from models.gcpause import gc_paused
+
+# The folder the file dialogs open by default
+DEFAULT_RECIPE_FOLDER = './recipes/'
+
+# The manifest file, inside the recipe folder
+MANIFEST_NAME = '.manifest'
+
+# Manifests of another version are thrown away and the folder scanned again
+MANIFEST_VERSION = 1
+
+# The manifest is written again from scratch once it has this many times more
+# lines than there are files in the folder
+COMPACT_RATIO = 2
+
+def file_hash(content):
+    """Returns the hash of the contents of a file."""
+    return hashlib.md5(content).hexdigest()
+
+
+class FolderChanges(object):
+    """
+    What a scan of a recipe folder found: the recipes of the files that were
+    added and changed, by file name, and the names of the files that are gone.
+    """
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+
+class RecipeManifest(object):
+    """
+    The journal of the files in a recipe folder. Every entry has the mtime,
+    size and hash of a file, and the decoded recipe it holds (None if the
+    file could not be parsed).
+    """
+    def __init__(self, path):
+        self.path = path
+        # File name to its entry
+        self.entries = {}
+        # How many lines the journal has on disk
+        self.lineCount = 0
+        # Lines not yet written to disk
+        self.pending = []
+
+    def load(self):
+        """
+        Reads the journal, later lines overriding earlier ones. A missing or
+        unreadable journal leaves the manifest empty.
+        """
+        self.entries = {}
+        self.lineCount = 0
+        self.pending = []
+
+        try:
+            file = open(self.path, 'r')
+        except IOError:
+            return
+
+        with gc_paused():
+            try:
+                lines = iter(file)
+                try:
+                    header = codec.loads(next(lines))
+                except (StopIteration, ValueError):
+                    header = None
+                if (not isinstance(header, dict) or
+                        header.get('version') != MANIFEST_VERSION):
+                    print 'Recipe folder manifest is out of date, rescanning'
+                    return
+
+                self.lineCount = 1
+                for line in lines:
+                    try:
+                        entry = codec.loads(line)
+                    except ValueError:
+                        # Most likely the last line, cut short by a crash
+                        continue
+
+                    self.lineCount += 1
+                    if entry.get('removed'):
+                        self.entries.pop(entry['name'], None)
+                    else:
+                        self.entries[entry['name']] = entry
+            finally:
+                file.close()
+
+    def get(self, name):
+        """Returns the entry of a file, or None."""
+        return self.entries.get(name)
+
+    def names(self):
+        """Returns the names of every file in the manifest."""
+        return self.entries.keys()
+
+    def record(self, name, mtime, size, digest, recipe):
+        """Records the current state of a file."""
+        entry = {'name': name, 'mtime': mtime, 'size': size, 'hash': digest,
+                'recipe': recipe}
+        self.entries[name] = entry
+        self.pending.append(entry)
+
+    def forget(self, name):
+        """Records that a file is gone."""
+        if self.entries.pop(name, None) is not None:
+            self.pending.append({'name': name, 'removed': True})
+
+    def save(self):
+        """
+        Appends the pending lines to the journal, or writes it again from
+        scratch if it has grown too long or isn't there yet.
+        """
+        if not self.pending:
+            return
+
+        if (self.lineCount == 0 or self.lineCount + len(self.pending) >
+                COMPACT_RATIO * (len(self.entries) + 1)):
+            self.compact()
+            return
+
+        file = open(self.path, 'a')
+        for entry in self.pending:
+            file.write(codec.dumps(entry, separators=(',', ':')) + '\n')
+        file.close()
+
+        self.lineCount += len(self.pending)
+        self.pending = []
+
+    def compact(self):
+        """
+        Writes the journal from scratch, one line per file. It is written to
+        a temporary file first, so a crash never leaves half a manifest.
+        """
+        temporaryPath = self.path + '.tmp'
+        file = open(temporaryPath, 'w')
+        file.write(codec.dumps({'version': MANIFEST_VERSION}) + '\n')
+        for name in sorted(self.entries):
+            file.write(codec.dumps(self.entries[name], separators=(',', ':')) +
+                    '\n')
+        file.close()
+
+        # Windows can't rename over an existing file
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temporaryPath, self.path)
+
+        self.lineCount = len(self.entries) + 1
+        self.pending = []
+
+
+class RecipeFolder(object):
+    """
+    A folder of .rcpe files that the library is kept in sync with.
+    """
+    def __init__(self, path=DEFAULT_RECIPE_FOLDER):
+        self.path = path
+        self.manifest = RecipeManifest(os.path.join(path, MANIFEST_NAME))
+        self.manifest.load()
+
+    def contains(self, filePath):
+        """Returns whether a file path is a recipe file of this folder."""
+        return (os.path.dirname(os.path.abspath(filePath)) ==
+                os.path.abspath(self.path) and filePath.endswith('.rcpe'))
+
+    def recipes(self):
+        """
+        Returns the (file name, decoded recipe) pairs of every parsable file
+        in the manifest, as of the last scan.
+        """
+        entries = self.manifest.entries
+        return [(name, entries[name]['recipe']) for name in sorted(entries)
+                if entries[name]['recipe'] is not None]
+
+    def scan(self):
+        """
+        Compares the folder with the manifest, reading and parsing only the
+        files that are new or changed. Returns the FolderChanges found, and
+        saves the manifest.
+        """
+        with gc_paused():
+            return self.scan_files()
+
+    def scan_files(self):
+        """Does the work of scan()."""
+        changes = FolderChanges()
+
+        try:
+            names = [name for name in os.listdir(self.path) if
+                    name.endswith('.rcpe')]
+        except OSError:
+            names = []
+
+        present = set()
+        for name in names:
+            filePath = os.path.join(self.path, name)
+            try:
+                status = os.stat(filePath)
+            except OSError:
+                # Deleted since it was listed
+                continue
+            present.add(name)
+
+            entry = self.manifest.get(name)
+            if (entry is not None and entry['mtime'] == status.st_mtime and
+                    entry['size'] == status.st_size):
+                # Unchanged, no need to even open it
+                continue
+
+            try:
+                file = open(filePath, 'rb')
+                content = file.read()
+                file.close()
+            except IOError:
+                continue
+
+            digest = file_hash(content)
+            if entry is not None and entry['hash'] == digest:
+                # Only touched, the recipe is still the same
+                self.manifest.record(name, status.st_mtime, status.st_size,
+                        digest, entry['recipe'])
+                continue
+
+            recipe = self.parse(name, content)
+            self.manifest.record(name, status.st_mtime, status.st_size,
+                    digest, recipe)
+
+            if entry is None or entry['recipe'] is None:
+                if recipe is not None:
+                    changes.added.append((name, recipe))
+            elif recipe is None:
+                changes.removed.append(name)
+            else:
+                changes.changed.append((name, recipe))
+
+        for name in self.manifest.names():
+            if name not in present:
+                if self.manifest.get(name)['recipe'] is not None:
+                    changes.removed.append(name)
+                self.manifest.forget(name)
+
+        self.manifest.save()
+        return changes
+
+    def parse(self, name, content):
+        """
+        Decodes the contents of a recipe file. Returns None, after a
+        warning, if it isn't a proper recipe.
+        """
+        try:
+            recipe = codec.loads(content)
+            for field in ['name', 'course', 'serving_size', 'ingredients',
+                    'instructions', 'images']:
+                recipe[field]
+            return recipe
+        except (ValueError, KeyError, TypeError):
+            print 'Skipping ' + name + ', it is not a proper recipe file'
+            return None
+
+    def track(self, filePath, recipe):
+        """
+        Records a recipe file the application has just written into the
+        folder, so that scanning doesn't import it all over again.
+        """
+        name = os.path.basename(filePath)
+        status = os.stat(filePath)
+        file = open(filePath, 'rb')
+        content = file.read()
+        file.close()
+
+        self.manifest.record(name, status.st_mtime, status.st_size,
+                file_hash(content), recipe)
+        self.manifest.save()
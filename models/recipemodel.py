@@ -7,7 +7,9 @@
 #
 ###############################################################################
 
-import simplejson as json
+from models import codec
+from models.interning import intern_recipe
+from models.quantity import scale_factor, scale_quantity, scale_to_float
 
 class RecipeModel():
     def export_recipe(self):
@@ -18,7 +20,7 @@ class RecipeModel():
         Actually just returns a JSON-encoded string
         """
         # Dump the object into a JSON-formatted string
-        json_recipe = json.dumps({"name":self.name,"course":self.course, 
+        json_recipe = codec.dumps({"name":self.name,"course":self.course, 
             "serving_size":self.servingSize,"ingredients":self.ingredients,
             "instructions":self.instructions,"images":self.images},
             separators=(',',':'))
@@ -33,10 +35,17 @@ class RecipeModel():
         this function.
         """
         # Put the decoded JSON string into a "raw" recipe object 
-        raw_recipe = json.loads(raw_json)
+        raw_recipe = codec.loads(raw_json)
 
         print raw_recipe # print it for now
 
+        self.load_recipe(raw_recipe)
+
+    def load_recipe(self, raw_recipe):
+        """
+        Sets the recipe from an already decoded .rcpe file, a dictionary.
+        Raises KeyError if a field is missing.
+        """
         self.name = raw_recipe['name']
         self.course = raw_recipe['course']
         self.servingSize = raw_recipe['serving_size']
@@ -44,6 +53,10 @@ class RecipeModel():
         self.instructions = raw_recipe['instructions']
         self.images = raw_recipe['images']
 
+        # Share the strings that every recipe repeats with the rest of the
+        # library
+        intern_recipe(self)
+
     def print_recipe_information(self):
         """
         A useful debugging function that prints the entirety of the recipe
@@ -78,6 +91,32 @@ class RecipeModel():
             for filePath in self.images:
                 print filePath
 
+    def scale_ingredients(self, servingSize, exact=False):
+        """
+        Returns a new list of ingredients whose quantities are scaled from the
+        recipe's serving size to the given serving size. This is what the
+        shopping list is made of.
+
+        The quantities are scaled as exact fractions, so a third of a cup
+        tripled is exactly a cup. They are returned as floats, or as
+        Fractions if exact is True. Raises ValueError if the recipe has no
+        serving size to scale from.
+        """
+        scaled = []
+        factor = scale_factor(self.servingSize, servingSize)
+        numerator, denominator = factor.numerator, factor.denominator
+
+        for ingredient in self.ingredients:
+            if exact:
+                quantity = scale_quantity(ingredient['quantity'], factor)
+            else:
+                quantity = scale_to_float(ingredient['quantity'], numerator,
+                        denominator)
+            scaled.append({'name': ingredient['name'],
+                'quantity': quantity, 'unit': ingredient['unit']})
+
+        return scaled
+
     def get_recipe(self, recipe):
         """
         Assigns a given recipe to this recipe.
@@ -0,0 +1,414 @@
+###############################################################################
+#
+# similarity.py
+#
+# An index of the recipes in the library for finding the recipes most
+# similar to a given one. Every recipe is a sparse vector of features: its
+# normalized ingredient names, and the terms of its name and instructions.
+# Features are weighted by how rare they are (TF-IDF) and recipes are compared
+# by the cosine of their vectors.
+#
+# The index keeps a posting list per feature (the recipes that have it and
+# their weights), so a query only touches the recipes that share a feature
+# with the given recipe. Posting lists are kept in stdlib arrays, which numpy
+# can read without copying, so the scores of a query are summed with a few
+# vectorized operations. The commonest features are also kept as dense
+# columns, since adding up a whole column is quicker than scattering a long
+# posting list. Recipes are added, updated and removed one at a time
+# as the library changes; removed recipes are only dropped from the posting
+# lists when enough of them pile up.
+#
+# The lengths of the vectors are only all computed again once the library
+# changed size enough, so candidates are ranked with lengths that can be
+# slightly off. The best candidates are scored again with their exact
+# lengths, so the similarities returned are exact.
+#
+###############################################################################
+
+import array
+import math
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from models.foodtable import normalize_name
+
+# How many similar recipes are returned by default
+DEFAULT_LIMIT = 5
+
+# Ingredients say more about a recipe than the words of its instructions
+INGREDIENT_WEIGHT = 2.0
+
+# The lengths of the vectors are computed again once the library has grown or
+# shrunk by this share since they were last computed, since the weights of
+# the features change with the size of the library
+NORM_REFRESH_SHARE = 0.25
+
+# Candidates are ranked with the lengths as they were last computed, which
+# can be slightly stale. This many times the recipes asked for are scored
+# again with their exact lengths, and the best of those are returned
+RESCORE_FACTOR = 4
+
+# Features that at least this share of the recipes have are also kept as
+# dense columns (with numpy), which are much quicker to add up than long
+# posting lists. At most MAX_DENSE_FEATURES of them are kept, the commonest
+# first, to bound the memory they take
+DENSE_FEATURE_SHARE = 0.1
+MAX_DENSE_FEATURES = 128
+
+# Words that say nothing about a recipe
+STOPWORDS = frozenset(['a', 'an', 'and', 'the', 'to', 'in', 'of', 'for',
+    'with', 'on', 'at', 'or', 'until', 'then', 'into', 'it', 'is', 'be',
+    'over', 'from', 'by', 'before', 'after', 'about', 'least', 'just', 'set',
+    'aside', 'minutes', 'minute', 'hours', 'hour', 'degrees', 'f', 'c'])
+
+# Anything that isn't a letter splits words
+WORD_SPLITTER = re.compile('[^a-z]+')
+
+def recipe_features(recipe):
+    """
+    Returns the features of a recipe as a dictionary of feature names to
+    weights, before the rarity of the features is taken into account.
+    """
+    features = {}
+
+    for ingredient in recipe.ingredients:
+        feature = 'i:' + normalize_name(ingredient['name'])
+        features[feature] = INGREDIENT_WEIGHT
+
+    counts = {}
+    for text in [recipe.name] + list(recipe.instructions):
+        for word in WORD_SPLITTER.split(text.lower()):
+            if len(word) > 2 and word not in STOPWORDS:
+                term = 't:' + normalize_name(word)
+                counts[term] = counts.get(term, 0) + 1
+
+    # Terms that show up often count more, but not proportionally
+    for term, count in counts.items():
+        features[term] = 1.0 + math.log(count)
+
+    return features
+
+
+class SimilarityIndex(object):
+    """
+    The index of a library of recipes, kept up to date one recipe at a time.
+    """
+    def __init__(self, recipes=[]):
+        self.clear()
+        for recipe in recipes:
+            self.add(recipe)
+
+    def clear(self):
+        """Empties the index."""
+        # The indexed recipes by document number, None once removed
+        self.documents = []
+        # Recipe to its document number
+        self.numbers = {}
+        # The (feature ids, weights) of every document
+        self.documentFeatures = []
+        # The length of the vector of every document
+        self.norms = array.array('d')
+        # How many documents there were when the lengths were computed
+        self.normsCount = 0
+        # How many times the library changed so far, and how many times it
+        # had when the length of every document was computed
+        self.changes = 0
+        self.normChanges = array.array('l')
+
+        # Feature name to feature id
+        self.featureIds = {}
+        # The posting lists of every feature id: document numbers and weights
+        self.postingNumbers = []
+        self.postingWeights = []
+        # How many live documents have every feature
+        self.frequencies = []
+
+        # How many documents have been removed but are still in the postings
+        self.removedCount = 0
+
+        # Feature id to its row in the dense block, and the dense block
+        # itself: the weights of the commonest features, one row per feature
+        # and one column per document
+        self.denseRows = {}
+        self.dense = None
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __contains__(self, recipe):
+        return recipe in self.numbers
+
+    def idf(self, featureId):
+        """
+        Returns the weight of a feature for being rare: features that few
+        recipes have count the most.
+        """
+        return math.log((len(self.numbers) + 1.0) /
+                (self.frequencies[featureId] + 1.0)) + 1.0
+
+    def norm(self, featureIds, weights, idfs=None):
+        """
+        Returns the length of a document vector. The idf of every feature can
+        be passed in when many lengths are computed at once.
+        """
+        total = 0.0
+        for featureId, weight in zip(featureIds, weights):
+            if idfs is None:
+                idf = self.idf(featureId)
+            else:
+                idf = idfs[featureId]
+            total += (weight * idf) ** 2
+        return math.sqrt(total) or 1.0
+
+    def add(self, recipe, features=None):
+        """
+        Adds a recipe to the index, or indexes it again if it is there
+        already. The features of the recipe can be passed in if they have
+        been made already.
+        """
+        if recipe in self.numbers:
+            self.remove(recipe)
+
+        if features is None:
+            features = recipe_features(recipe)
+
+        self.changes += 1
+        number = len(self.documents)
+        self.documents.append(recipe)
+        self.numbers[recipe] = number
+
+        featureIds = []
+        weights = []
+        for feature, weight in features.items():
+            featureId = self.featureIds.get(feature)
+            if featureId is None:
+                featureId = len(self.postingNumbers)
+                self.featureIds[feature] = featureId
+                self.postingNumbers.append(array.array('i'))
+                self.postingWeights.append(array.array('d'))
+                self.frequencies.append(0)
+
+            self.postingNumbers[featureId].append(number)
+            self.postingWeights[featureId].append(weight)
+            self.frequencies[featureId] += 1
+            featureIds.append(featureId)
+            weights.append(weight)
+
+        self.documentFeatures.append((featureIds, weights))
+        self.norms.append(self.norm(featureIds, weights))
+        self.normChanges.append(self.changes)
+
+        if self.dense is not None:
+            if number >= self.dense.shape[1]:
+                # Out of columns, double them
+                self.dense = numpy.hstack([self.dense,
+                    numpy.zeros(self.dense.shape, dtype=numpy.float32)])
+            for featureId, weight in zip(featureIds, weights):
+                row = self.denseRows.get(featureId)
+                if row is not None:
+                    self.dense[row, number] = weight
+
+        self.check_norms()
+
+    def update(self, recipe):
+        """
+        Indexes a recipe again after it may have been edited. Nothing is done
+        if its features are still the same.
+        """
+        features = recipe_features(recipe)
+
+        number = self.numbers.get(recipe)
+        if number is not None:
+            featureIds, weights = self.documentFeatures[number]
+            indexed = dict(zip(featureIds, weights))
+            current = {}
+            for feature, weight in features.items():
+                current[self.featureIds.get(feature)] = weight
+            if current == indexed:
+                return
+
+        self.add(recipe, features)
+
+    def remove(self, recipe):
+        """Removes a recipe from the index, if it is there."""
+        number = self.numbers.pop(recipe, None)
+        if number is None:
+            return
+
+        self.changes += 1
+        self.documents[number] = None
+        for featureId in self.documentFeatures[number][0]:
+            self.frequencies[featureId] -= 1
+        self.documentFeatures[number] = ([], [])
+        # Removed documents stay in the postings with a score of zero
+        self.norms[number] = float('inf')
+        self.removedCount += 1
+
+        if self.removedCount > len(self.numbers):
+            # Most of the postings are dead weight by now, start over
+            self.rebuild()
+        else:
+            self.check_norms()
+
+    def rebuild(self):
+        """Indexes every live recipe again from scratch."""
+        recipes = [recipe for recipe in self.documents if recipe is not None]
+        self.clear()
+        for recipe in recipes:
+            self.add(recipe)
+
+    def check_norms(self):
+        """
+        Computes the lengths of the document vectors again if the library
+        changed size enough since they were last computed.
+        """
+        count = len(self.numbers)
+        if (abs(count - self.normsCount) <= NORM_REFRESH_SHARE *
+                max(self.normsCount, 1)):
+            return
+
+        idfs = [self.idf(featureId) for featureId in
+                range(len(self.frequencies))]
+        for number, (featureIds, weights) in enumerate(
+                self.documentFeatures):
+            if self.documents[number] is not None:
+                self.norms[number] = self.norm(featureIds, weights, idfs)
+                self.normChanges[number] = self.changes
+        self.normsCount = count
+
+        self.build_dense()
+
+    def build_dense(self):
+        """
+        Picks the features common enough to be kept as dense columns, and
+        fills the dense block in from their posting lists.
+        """
+        if numpy is None:
+            return
+
+        common = [featureId for featureId, frequency in
+                enumerate(self.frequencies) if frequency >=
+                DENSE_FEATURE_SHARE * len(self.numbers)]
+        common.sort(key=lambda featureId: -self.frequencies[featureId])
+        common = common[:MAX_DENSE_FEATURES]
+
+        if not common:
+            self.denseRows = {}
+            self.dense = None
+            return
+
+        # Leave room for the library to grow
+        self.dense = numpy.zeros((len(common), 2 * len(self.documents) + 16),
+                dtype=numpy.float32)
+        self.denseRows = {}
+        for row, featureId in enumerate(common):
+            self.denseRows[featureId] = row
+            numbers = numpy.frombuffer(self.postingNumbers[featureId],
+                    dtype=numpy.intc)
+            self.dense[row, numbers] = numpy.frombuffer(
+                    self.postingWeights[featureId])
+
+    def query_features(self, recipe):
+        """
+        Returns the (feature id, weight) pairs of a recipe to query with, and
+        the length of the query vector. Features that no indexed recipe has
+        are left out.
+        """
+        query = []
+        total = 0.0
+        for feature, weight in recipe_features(recipe).items():
+            featureId = self.featureIds.get(feature)
+            if featureId is None or self.frequencies[featureId] == 0:
+                # No indexed recipe has it, but it still makes the query
+                # vector longer
+                total += (weight * (math.log(len(self.numbers) + 1.0) +
+                    1.0)) ** 2
+                continue
+
+            idf = self.idf(featureId)
+            total += (weight * idf) ** 2
+            # The weight of the query times the idf of the document
+            query.append((featureId, weight * idf * idf))
+
+        return query, math.sqrt(total) or 1.0
+
+    def similar(self, recipe, limit=DEFAULT_LIMIT):
+        """
+        Returns up to limit (similarity, recipe) pairs of the indexed recipes
+        most similar to the given one, most similar first. The recipe itself
+        is left out. The similarities are exact, with the weights the
+        features have in the library as it is now.
+        """
+        query, queryNorm = self.query_features(recipe)
+        if not query:
+            return []
+
+        own = self.numbers.get(recipe)
+        candidates = limit * RESCORE_FACTOR
+
+        if numpy is not None:
+            ranked = self.rank_with_numpy(query, own, candidates)
+        else:
+            totals = {}
+            for featureId, weight in query:
+                for number, documentWeight in zip(
+                        self.postingNumbers[featureId],
+                        self.postingWeights[featureId]):
+                    totals[number] = (totals.get(number, 0.0) +
+                            documentWeight * weight)
+            totals.pop(own, None)
+            ranked = [(total / self.norms[number], number) for number, total
+                    in totals.items()]
+
+        # The best candidates whose lengths are stale are scored again with
+        # their exact lengths, which are kept until the library changes
+        ranked.sort(key=lambda pair: (-pair[0], pair[1]))
+        rescored = []
+        for score, number in ranked[:candidates]:
+            if score <= 0:
+                break
+            if self.normChanges[number] != self.changes:
+                staleNorm = self.norms[number]
+                self.norms[number] = self.norm(*self.documentFeatures[number])
+                self.normChanges[number] = self.changes
+                score = score * staleNorm / self.norms[number]
+            rescored.append((score, number))
+
+        # Scores are divided by the length of the query vector last, since it
+        # is the same for every document
+        rescored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [(float(score) / queryNorm, self.documents[number]) for score,
+                number in rescored[:limit]]
+
+    def rank_with_numpy(self, query, own, limit):
+        """
+        Returns (score, document number) pairs that include the limit best
+        scoring documents, with numpy. Common features are added up from
+        their dense columns, and the others from their posting lists.
+        """
+        count = len(self.documents)
+        scores = numpy.zeros(count)
+
+        for featureId, weight in query:
+            row = self.denseRows.get(featureId)
+            if row is not None:
+                scores += self.dense[row, :count] * weight
+                continue
+
+            numbers = numpy.frombuffer(self.postingNumbers[featureId],
+                    dtype=numpy.intc)
+            # A document has a feature only once, so numbers are unique
+            scores[numbers] += numpy.frombuffer(
+                    self.postingWeights[featureId]) * weight
+
+        scores /= numpy.frombuffer(self.norms)
+        if own is not None:
+            scores[own] = 0.0
+
+        count = min(limit, count)
+        best = numpy.argpartition(-scores, count - 1)[:count]
+        return [(scores[number], number) for number in best.tolist()]
@@ -0,0 +1,161 @@
+###############################################################################
+#
+# streaming.py
+#
+# Reads recipes out of JSON files of any size one recipe at a time, instead
+# of decoding the whole file at once the way RecipeModel.import_recipe does.
+# A file can hold a single recipe (a .rcpe file), a JSON array of recipes (a
+# library export), or recipes one after the other, one per line or not.
+#
+# The file is read in chunks into a buffer. Every recipe is decoded from the
+# buffer with the C decoder as soon as it is whole, and the buffer forgets
+# what has been decoded, so memory stays bounded by the size of the largest
+# recipe plus a chunk, however big the file is.
+#
+###############################################################################
+
+import re
+
+from models import codec
+
+from models.recipemodel import RecipeModel
+
+# How much of the file is read at once
+CHUNK_SIZE = 1 << 16
+
+# A single recipe bigger than this means the file is broken (or isn't a
+# recipe file), rather than that the whole file should be read into memory
+MAX_RECIPE_SIZE = 1 << 26
+
+# Skips whitespace between values
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+class RecipeStream(object):
+    """
+    Iterates over the decoded recipes (dictionaries, the way .rcpe files
+    have them) of a JSON file, one at a time. Raises ValueError if the file
+    isn't well-formed.
+    """
+    def __init__(self, file, chunkSize=CHUNK_SIZE):
+        self.file = file
+        self.chunkSize = chunkSize
+        self.raw_decode = codec.raw_decoder()
+        self.buffer = ''
+        self.position = 0
+        # Where in the file the buffer starts
+        self.offset = 0
+        self.finished = False
+        # How many recipes have been decoded
+        self.count = 0
+
+    def read_more(self, size):
+        """
+        Appends up to size bytes of the file to the buffer, dropping what has
+        been decoded already. Returns whether anything was read.
+        """
+        chunk = self.file.read(size)
+        if not chunk:
+            self.finished = True
+            return False
+
+        self.offset += self.position
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def skip_whitespace(self):
+        """
+        Moves past whitespace, reading more of the file as needed. Returns
+        the next character, or None at the end of the file.
+        """
+        while True:
+            self.position = WHITESPACE.match(self.buffer,
+                    self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_more(self.chunkSize):
+                return None
+
+    def next_value(self):
+        """
+        Decodes the value at the current position, reading more of the file
+        until it is whole.
+        """
+        size = self.chunkSize
+        while True:
+            try:
+                value, end = self.raw_decode(self.buffer, self.position)
+                # A number at the end of the buffer may go on in the file
+                if end < len(self.buffer) or self.finished:
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.finished:
+                    raise
+
+            if len(self.buffer) - self.position > MAX_RECIPE_SIZE:
+                raise ValueError('Recipe at ' + self.where() +
+                        ' is too big, the file must be broken')
+            # Twice as much every time, so a big recipe is not decoded
+            # over and over again
+            self.read_more(size)
+            size *= 2
+
+    def where(self):
+        """Describes the current position in the file, for errors."""
+        return 'byte ' + str(self.offset + self.position)
+
+    def expect(self, character):
+        """
+        Moves past the given character if it is next. Returns whether it
+        was.
+        """
+        if self.skip_whitespace() == character:
+            self.position += 1
+            return True
+        return False
+
+    def recipe(self):
+        """Decodes the next recipe, checking it is one."""
+        if self.skip_whitespace() != '{':
+            raise ValueError('Expected a recipe at ' + self.where())
+        self.count += 1
+        return self.next_value()
+
+    def __iter__(self):
+        first = self.skip_whitespace()
+        if first is None:
+            return
+
+        if first != '[':
+            # Recipes one after the other
+            while self.skip_whitespace() is not None:
+                yield self.recipe()
+            return
+
+        # An array of recipes
+        self.position += 1
+        if not self.expect(']'):
+            while True:
+                yield self.recipe()
+                if self.expect(']'):
+                    break
+                if not self.expect(','):
+                    raise ValueError("Expected ',' or ']' at " +
+                            self.where())
+
+        if self.skip_whitespace() is not None:
+            raise ValueError('Unexpected data after the recipes at ' +
+                    self.where())
+
+
+def iter_recipes(file, chunkSize=CHUNK_SIZE):
+    """
+    Yields the recipes of a JSON file one at a time as RecipeModels. Raises
+    ValueError if the file isn't well-formed, or KeyError if a recipe is
+    missing a field.
+    """
+    for raw_recipe in RecipeStream(file, chunkSize):
+        recipe = RecipeModel()
+        recipe.load_recipe(raw_recipe)
+        yield recipe
@@ -0,0 +1,290 @@
+###############################################################################
+#
+# timeline.py
+#
+# Plans cooking several recipes at once. Every instruction of a recipe is a
+# step that takes some time ("simmer for 20 minutes") and has to wait for
+# the steps before it, unless it says otherwise ("Meanwhile", "In a separate
+# bowl"). That makes a small graph of steps (a DAG) per recipe. The steps
+# of all the recipes are then laid out on a single timeline for the cooks
+# at hand: steps that keep a cook busy (chopping, stirring) are never done
+# two at a time by the same cook, while steps that don't (baking, resting,
+# marinating) run alongside anything else. Steps on the longest remaining
+# path of their recipe (the critical path) go first, and the timeline is laid
+# out backwards from serving time, so every dish is ready to serve at the
+# end rather than going cold while the others finish.
+#
+# How long steps take comes from the analyses of their instructions (see
+# analysis.py). The rest of what is read from every instruction is memoized,
+# since the same instructions come up over and over again.
+#
+###############################################################################
+
+import heapq
+import re
+
+from models.analysis import get_instruction_analyzer
+
+# How long a step that doesn't say takes, in minutes
+DEFAULT_STEP_MINUTES = 5
+
+# Words of steps that don't need the cook, like "bake for 30 minutes". The
+# moment it takes to put a dish in the oven isn't counted
+PASSIVE_WORDS = frozenset(['bake', 'baking', 'simmer', 'simmering', 'roast',
+    'roasting', 'rest', 'resting', 'marinate', 'marinating', 'chill',
+    'chilling', 'refrigerate', 'refrigerating', 'freeze', 'rise', 'proof',
+    'soak', 'soaking', 'cool', 'cooling', 'steep', 'braise', 'slow', 'let',
+    'leave', 'set', 'boil', 'preheat', 'stand'])
+
+# Words that start steps that run alongside the step before them
+PARALLEL_WORDS = ('meanwhile', 'while', 'at the same time')
+
+# Words that start steps that don't need the step before them at all
+SEPARATE_PATTERN = re.compile(r'\b(?:in|using) (?:a|another) (?:separate|'
+        r'second|clean|different|other) |\bseparately\b', re.IGNORECASE)
+
+# Words of steps that bring back together what was done separately
+JOIN_PATTERN = re.compile(r'\b(?:combine|combined|mixture|mixtures|together|'
+        r'fold|into the|serve|serving|assemble|plate|reserved)\b',
+        re.IGNORECASE)
+
+# Steps that say which step they need ("the sauce from step 2")
+STEP_REFERENCE_PATTERN = re.compile(r'\bsteps? (\d+)', re.IGNORECASE)
+
+# Instruction to what was read from it, see read_step()
+stepMemo = {}
+
+def read_step(instruction, analysis):
+    """
+    Returns what an instruction says about its step, given its analysis,
+    as a tuple: how many minutes it takes, how many of them keep the cook
+    busy, whether it runs alongside the step before it, whether it doesn't
+    need the step before it, whether it brings separate steps back
+    together, and the numbers of the steps it refers to. Memoized.
+    """
+    step = stepMemo.get(instruction)
+    if step is not None:
+        return step
+
+    lowered = instruction.strip().lower()
+    minutes = analysis.minutes
+
+    # What the step is is said at its start ("Roast the beets at 400 degrees
+    # for 40 minutes"), or right before its time ("then simmer for 20
+    # minutes")
+    words = re.findall(r"[a-z]+", lowered)[:3]
+    if minutes is None:
+        minutes = DEFAULT_STEP_MINUTES
+    else:
+        words += re.findall(r"[a-z]+",
+                instruction[:analysis.timePosition].lower())[-4:]
+    if any([word in PASSIVE_WORDS for word in words]):
+        busy = 0
+    else:
+        busy = minutes
+
+    step = (minutes, busy, lowered.startswith(PARALLEL_WORDS),
+            SEPARATE_PATTERN.search(instruction) is not None,
+            JOIN_PATTERN.search(instruction) is not None,
+            tuple([int(number) for number in
+                STEP_REFERENCE_PATTERN.findall(instruction)]))
+
+    if len(stepMemo) >= 1 << 16:
+        stepMemo.clear()
+    stepMemo[instruction] = step
+    return step
+
+
+class Step(object):
+    """
+    A step of a recipe: its instruction, how long it takes and for how long
+    it keeps a cook busy (all of it, or none of it), and the steps it has to
+    wait for.
+    """
+    __slots__ = ['recipe', 'number', 'instruction', 'minutes', 'busy',
+            'after', 'start', 'end']
+
+    def __init__(self, recipe, number, instruction, minutes, busy):
+        self.recipe = recipe
+        self.number = number
+        self.instruction = instruction
+        self.minutes = minutes
+        self.busy = busy
+        self.after = []
+        # When it starts and ends, in minutes from the start of cooking,
+        # once it is planned
+        self.start = None
+        self.end = None
+
+def recipe_steps(recipe):
+    """
+    Returns the steps of a recipe, in order, each with the steps it has to
+    wait for. Steps wait for the one before them, except that:
+
+      * "Meanwhile" and "While" steps wait for what the step before them
+        waits for, running alongside it
+      * steps done "in a separate bowl" wait for nothing, and are left open
+        until a step brings them back together ("combine", "fold into the",
+        "serve"), which waits for all of them
+      * steps that say "step 2" wait for step 2 as well
+
+    The last step waits for everything still open, since the dish isn't
+    done until all of it is.
+    """
+    steps = []
+    # The last steps of branches that haven't been brought back together
+    branches = []
+    previous = None
+    analyses = get_instruction_analyzer().analyze(recipe)
+    for number, instruction in enumerate(recipe.instructions):
+        minutes, busy, parallel, separate, join, references = read_step(
+                instruction, analyses[number])
+        step = Step(recipe, number + 1, instruction, minutes, busy)
+
+        if previous is None:
+            pass
+        elif separate:
+            branches.append(previous)
+        elif parallel:
+            step.after.extend(previous.after)
+            branches.append(previous)
+        else:
+            step.after.append(previous)
+            if join or number == len(recipe.instructions) - 1:
+                step.after.extend(branches)
+                branches = []
+
+        for reference in references:
+            if 0 < reference <= len(steps):
+                step.after.append(steps[reference - 1])
+
+        step.after = list(set(step.after))
+        steps.append(step)
+        previous = step
+    return steps
+
+def critical_minutes(steps):
+    """
+    Returns how long a recipe takes at the very least, however many cooks
+    there are: the length of its longest path of steps.
+    """
+    finish = {}
+    for step in steps:
+        finish[step] = step.minutes + max([0] + [finish[before] for before in
+            step.after])
+    return max(finish.values() or [0])
+
+
+class ServicePlan(object):
+    """
+    The steps of several recipes laid out on a single timeline. Every step
+    has its start and end, in minutes from the start of cooking, and every
+    dish is done at the end.
+    """
+    def __init__(self, recipes, steps, minutes, criticalMinutes):
+        self.recipes = recipes
+        # Every step, by when it starts
+        self.steps = steps
+        self.minutes = minutes
+        # The longest any of the recipes takes on its own: no plan can be
+        # quicker
+        self.criticalMinutes = criticalMinutes
+
+def lay_out(steps, cooks):
+    """
+    Lays out steps on a timeline, backwards: every step is given its start
+    and end in minutes before serving. A step is laid out once every step
+    that waits for it is, as late as the cooks allow, the ones on the
+    longest path to the start of cooking first. Returns how long the whole
+    plan takes.
+    """
+    # Going backwards, a step is next once everything after it is laid out
+    waiting = dict([(step, 0) for step in steps])
+    for step in steps:
+        for before in step.after:
+            waiting[before] += 1
+
+    # The longest path from the start of cooking to the end of every step,
+    # which is what is still left to do once it is laid out. Steps come
+    # after the steps they wait for
+    head = {}
+    for step in steps:
+        head[step] = step.minutes + max([0] + [head[before] for before in
+            step.after])
+
+    # Steps that can be laid out now, longest path first, and the steps
+    # being done by when they are done (going backwards, when they start)
+    order = dict([(step, index) for index, step in enumerate(steps)])
+    ready = [(-head[step], order[step], step) for step in steps if
+            waiting[step] == 0]
+    heapq.heapify(ready)
+    running = []
+    freeCooks = cooks
+    time = 0
+
+    while ready or running:
+        # Start what can be started. Steps that keep a cook busy wait for
+        # one to be free
+        postponed = []
+        while ready:
+            item = heapq.heappop(ready)
+            step = item[2]
+            if step.busy:
+                if freeCooks == 0:
+                    postponed.append(item)
+                    continue
+                freeCooks -= 1
+            step.end = time
+            step.start = time + step.minutes
+            heapq.heappush(running, (step.start, item[1], step))
+        for item in postponed:
+            heapq.heappush(ready, item)
+
+        # Move on to when the next step is done
+        time, index, step = heapq.heappop(running)
+        if step.busy:
+            freeCooks += 1
+        for before in step.after:
+            waiting[before] -= 1
+            if waiting[before] == 0:
+                heapq.heappush(ready, (-head[before], order[before], before))
+
+    return max([step.start for step in steps] or [0])
+
+def plan_service(recipes, cooks=1):
+    """
+    Plans cooking several recipes at once, with the given number of cooks,
+    so that all of them are done at the same time. Returns a ServicePlan.
+    """
+    steps = []
+    criticalMinutes = 0
+    for recipe in recipes:
+        recipeSteps = recipe_steps(recipe)
+        criticalMinutes = max(criticalMinutes, critical_minutes(recipeSteps))
+        steps.extend(recipeSteps)
+
+    minutes = lay_out(steps, max(cooks, 1))
+
+    # Turn minutes before serving into minutes from the start of cooking
+    for step in steps:
+        step.start, step.end = minutes - step.start, minutes - step.end
+    steps.sort(key=lambda step: (step.start, step.end))
+    return ServicePlan(recipes, steps, minutes, criticalMinutes)
+
+def format_minutes(minutes):
+    """Formats minutes from the start of cooking as hours:minutes."""
+    minutes = int(round(minutes))
+    return '%d:%02d' % (minutes // 60, minutes % 60)
+
+def format_plan(plan):
+    """
+    Returns a plan as lines of text, a step per line, with when it starts
+    and ends.
+    """
+    lines = ['Total time ' + format_minutes(plan.minutes) + ' (the longest '
+            'recipe takes ' + format_minutes(plan.criticalMinutes) + ')']
+    for step in plan.steps:
+        lines.append(format_minutes(step.start) + ' - ' +
+                format_minutes(step.end) + '  ' + step.recipe.name +
+                ', step ' + str(step.number) + ': ' + step.instruction)
+    return lines
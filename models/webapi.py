@@ -0,0 +1,341 @@
+###############################################################################
+#
+# webapi.py
+#
+# A small local HTTP server that gives read-only access to the recipe library
+# as JSON, for kitchen tablets and the like. It serves these endpoints:
+#
+#   GET /recipes                              every recipe, in short
+#   GET /recipes?q=<text>                     recipes whose name, course or
+#                                             ingredients contain the text
+#   GET /recipes/<id>                         a whole recipe
+#   GET /recipes/<id>/shopping-list?servings=<n>
+#                                             the ingredients, scaled
+#                                             (400 if n isn't a positive
+#                                             number)
+#   GET /recipes/<id>/images/<n>              an image of the recipe
+#
+# Every response has an ETag, and requests that send it back in If-None-Match
+# get an empty 304 response when nothing changed.
+#
+# The server runs in its own threads so it never blocks the Qt event loop,
+# one thread per client. It never touches the recipes the GUI is editing:
+# the GUI publishes an immutable snapshot of the library whenever it changes
+# (made of the same persistent snapshots the undo history uses, so unchanged
+# recipes cost nothing), and the server only reads the latest snapshot.
+#
+###############################################################################
+
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import mimetypes
+import os
+import threading
+import urlparse
+import weakref
+
+from models import codec
+
+from models.history import *
+from models.recipemodel import RecipeModel
+
+# Where the server listens by default. Only this machine can reach it unless
+# another host is given
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8642
+
+# How many responses are kept in the response cache at most
+RESPONSE_CACHE_SIZE = 2048
+
+
+class LibrarySnapshot(object):
+    """
+    An immutable picture of the whole library: the snapshots of its recipes
+    by id, in the order the library lists them.
+    """
+    def __init__(self, version, ids, recipes):
+        self.version = version
+        # Recipe ids, in library order
+        self.ids = tuple(ids)
+        # Recipe id to RecipeSnapshot
+        self.recipes = recipes
+
+
+class LibraryPublisher(object):
+    """
+    Lives on the GUI side. Takes snapshots of the library when it changes,
+    and hands the latest one to the server.
+    """
+    def __init__(self):
+        self.version = 0
+        self.lastId = 0
+        # Recipe to its id and its latest snapshot
+        self.ids = weakref.WeakKeyDictionary()
+        self.snapshots = weakref.WeakKeyDictionary()
+        self.library = LibrarySnapshot(0, [], {})
+
+    def recipe_id(self, recipe):
+        """Returns the id of a recipe, the same for as long as it lives."""
+        if recipe not in self.ids:
+            self.lastId += 1
+            self.ids[recipe] = self.lastId
+        return self.ids[recipe]
+
+    def publish(self, recipes, changed=None):
+        """
+        Publishes a new snapshot of the library. If the recipes that changed
+        are given, only those are snapshotted again; otherwise every recipe
+        is, sharing whatever did not change with its previous snapshot.
+        """
+        if changed is not None:
+            changed = set(changed)
+
+        ids = []
+        snapshots = {}
+        for recipe in recipes:
+            previous = self.snapshots.get(recipe)
+            if previous is None or changed is None or recipe in changed:
+                snapshot = snapshot_recipe(recipe, previous)
+                if snapshot == previous:
+                    snapshot = previous
+                self.snapshots[recipe] = snapshot
+            else:
+                snapshot = previous
+
+            recipeId = self.recipe_id(recipe)
+            ids.append(recipeId)
+            snapshots[recipeId] = snapshot
+
+        self.version += 1
+        # A single assignment, so the server sees either the old library or
+        # the new one
+        self.library = LibrarySnapshot(self.version, ids, snapshots)
+
+
+def recipe_summary(recipeId, snapshot):
+    """Returns the short form of a recipe used in the list of recipes."""
+    return {'id': recipeId, 'name': snapshot.name, 'course': snapshot.course,
+            'serving_size': snapshot.servingSize}
+
+def recipe_document(recipeId, snapshot):
+    """Returns the whole of a recipe, the same way .rcpe files have it."""
+    return {'id': recipeId, 'name': snapshot.name, 'course': snapshot.course,
+            'serving_size': snapshot.servingSize,
+            'ingredients': thaw_ingredients(snapshot.ingredients),
+            'instructions': snapshot.instructions.to_list(),
+            'images': len(snapshot.images)}
+
+def matches(snapshot, text):
+    """
+    Returns whether the name, course or any ingredient of a recipe contains
+    the text, ignoring case.
+    """
+    if text in snapshot.name.lower() or text in snapshot.course.lower():
+        return True
+    for name, quantity, unit in snapshot.ingredients:
+        if text in name.lower():
+            return True
+    return False
+
+def make_etag(body):
+    """Returns a strong ETag for a response body."""
+    return '"' + hashlib.md5(body).hexdigest() + '"'
+
+
+class ResponseCache(object):
+    """
+    Remembers the (ETag, body) of responses for the current version of the
+    library. Shared by every client thread.
+    """
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.version = None
+        self.responses = {}
+        self.lock = threading.Lock()
+
+    def get(self, version, key):
+        """Returns a cached response, or None."""
+        with self.lock:
+            if version != self.version:
+                return None
+            return self.responses.get(key)
+
+    def put(self, version, key, response):
+        """Remembers a response made from the given library version."""
+        with self.lock:
+            if self.version is not None and version < self.version:
+                # Made from a library that has been replaced already
+                return
+            if version != self.version:
+                # The library changed, everything cached is stale
+                self.version = version
+                self.responses = {}
+            if len(self.responses) >= self.size:
+                self.responses = {}
+            self.responses[key] = response
+
+
+class NotFound(Exception):
+    """Raised by the endpoints when what was asked for does not exist."""
+    pass
+
+
+class BadRequest(Exception):
+    """Raised by the endpoints when a query parameter makes no sense."""
+    pass
+
+
+class LibraryRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers the requests of a single client."""
+    server_version = 'PyRecipe-4-U'
+
+    def do_GET(self):
+        library = self.server.publisher.library
+        url = urlparse.urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = urlparse.parse_qs(url.query)
+
+        try:
+            if (len(parts) == 4 and parts[0] == 'recipes' and
+                    parts[2] == 'images'):
+                self.send_image(library, parts[1], parts[3])
+                return
+
+            key = (url.path, url.query)
+            response = self.server.cache.get(library.version, key)
+            if response is None:
+                body = codec.dumps(self.route(library, parts, query),
+                        separators=(',', ':'))
+                response = (make_etag(body), body)
+                self.server.cache.put(library.version, key, response)
+
+            self.send_body(response[0], response[1], 'application/json')
+        except (BadRequest, ZeroDivisionError):
+            self.send_error(400, 'Bad request')
+        except (NotFound, ValueError):
+            self.send_error(404, 'Not found')
+
+    def route(self, library, parts, query):
+        """Returns the JSON-friendly answer to a request."""
+        if parts == ['recipes']:
+            text = query.get('q', [''])[0].strip().lower()
+            return [recipe_summary(recipeId, library.recipes[recipeId]) for
+                    recipeId in library.ids if not text or
+                    matches(library.recipes[recipeId], text)]
+
+        if len(parts) >= 2 and parts[0] == 'recipes':
+            recipeId = int(parts[1])
+            if recipeId not in library.recipes:
+                raise NotFound()
+            snapshot = library.recipes[recipeId]
+
+            if len(parts) == 2:
+                return recipe_document(recipeId, snapshot)
+
+            if parts[2:] == ['shopping-list']:
+                try:
+                    servings = float(query.get('servings',
+                        [snapshot.servingSize])[0])
+                except ValueError:
+                    raise BadRequest()
+                # Also leaves out NaN and infinity
+                if not 0 < servings < float('inf'):
+                    raise BadRequest()
+                recipe = RecipeModel()
+                restore_recipe(recipe, snapshot)
+                try:
+                    ingredients = recipe.scale_ingredients(servings)
+                except ValueError:
+                    # A recipe of no servings can't be scaled
+                    raise BadRequest()
+                return {'id': recipeId, 'serving_size': servings,
+                        'ingredients': ingredients}
+
+        raise NotFound()
+
+    def send_image(self, library, recipeId, number):
+        """Sends an image file of a recipe."""
+        snapshot = library.recipes.get(int(recipeId))
+        number = int(number)
+        if snapshot is None or not 0 <= number < len(snapshot.images):
+            raise NotFound()
+
+        path = snapshot.images[number]
+        try:
+            status = os.stat(path)
+        except OSError:
+            raise NotFound()
+
+        # Files are only read again when they changed on disk
+        etag = ('"' + str(int(status.st_mtime)) + '-' +
+                str(status.st_size) + '"')
+        if self.not_modified(etag):
+            return
+
+        file = open(path, 'rb')
+        body = file.read()
+        file.close()
+
+        contentType = mimetypes.guess_type(path)[0]
+        self.send_body(etag, body, contentType or 'application/octet-stream')
+
+    def not_modified(self, etag):
+        """
+        Sends an empty 304 response if the client has the current version
+        already. Returns whether it did.
+        """
+        if etag not in self.headers.get('If-None-Match', ''):
+            return False
+
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+
+    def send_body(self, etag, body, contentType):
+        """Sends a response, or a 304 if the client has it already."""
+        if self.not_modified(etag):
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        # Clients may keep responses, but have to check they are current
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests would flood the terminal
+        pass
+
+
+class LibraryServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    The HTTP server, answering every client in a thread of its own. The
+    server itself also runs in a background thread, see start().
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, publisher, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port),
+                LibraryRequestHandler)
+        self.publisher = publisher
+        self.cache = ResponseCache()
+        self.thread = None
+
+    def start(self):
+        """Starts serving in a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        print ('Serving the recipe library on http://%s:%d/recipes' %
+                self.server_address)
+
+    def stop(self):
+        """Stops serving and closes the socket."""
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,372 @@
+###############################################################################
+#
+# website.py
+#
+# Publishes the library as a static HTML site, for an intranet or any web
+# server: an index of every recipe, a page per course, a page per recipe and
+# the recipe images, resized for the web.
+#
+# Rebuilds are incremental. A manifest in the site folder remembers the hash
+# of every page written and what every image was resized from, so a rebuild
+# only writes the pages whose content changed and only resizes images whose
+# files changed. Recipe pages are the bulk of a site; the hash of every
+# recipe is remembered too, so when the recipes that changed are known, the
+# others aren't even rendered again.
+#
+###############################################################################
+
+import cgi
+import hashlib
+import os
+import re
+import shutil
+import unicodedata
+import weakref
+
+from models import codec
+from models.quantity import format_amount
+
+# Where sites are written unless told otherwise
+DEFAULT_SITE_FOLDER = './site/'
+
+# The name of the manifest, in the site folder
+MANIFEST_NAME = '.site-manifest'
+
+# Changing how pages look means every page has to be written again, so bump
+# this whenever the templates below change
+SITE_VERSION = 1
+
+# How wide recipe images are made, in pixels
+IMAGE_WIDTH = 640
+
+# Where recipe pages and images go, in the site folder
+RECIPE_FOLDER = 'recipes'
+IMAGE_FOLDER = 'images'
+
+STYLESHEET = """body { font-family: Helvetica, Arial, sans-serif;
+    max-width: 44em; margin: 2em auto; padding: 0 1em; color: #222;
+    line-height: 1.4; }
+nav { margin-bottom: 1.5em; }
+a { color: #a33; text-decoration: none; }
+h1 { margin-bottom: 0.2em; }
+.meta { color: #666; margin-top: 0; }
+img { max-width: 100%; height: auto; margin: 0.5em 0; }
+li { margin: 0.2em 0; }
+"""
+
+PAGE_TEMPLATE = u"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<link rel="stylesheet" href="%(root)sstyle.css">
+</head>
+<body>
+<nav><a href="%(root)sindex.html">All recipes</a></nav>
+%(body)s
+</body>
+</html>
+"""
+
+def text(value):
+    """Returns a string from a recipe as unicode."""
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    return unicode(value)
+
+def escape(value):
+    """Escapes a string from a recipe for HTML."""
+    return cgi.escape(text(value), True)
+
+# Names to the slugs made of them. Slugifying is slow next to the rest of a
+# rebuild, and names rarely change
+slugMemo = {}
+
+def slugify(name):
+    """
+    Returns the part of a URL made of a name: 'Creme Brulee!' becomes
+    'creme-brulee'.
+    """
+    slug = slugMemo.get(name)
+    if slug is None:
+        ascii = unicodedata.normalize('NFKD', text(name)).encode('ascii',
+                'ignore')
+        slug = re.sub(r'[^a-z0-9]+', '-', ascii.lower()).strip('-')
+        if not slug:
+            slug = 'recipe'
+        if len(slugMemo) >= 1 << 16:
+            slugMemo.clear()
+        slugMemo[name] = slug
+    return slug
+
+def unique_slugs(names):
+    """
+    Returns a slug for every name, adding -2, -3 and so on to the ones that
+    come up more than once.
+    """
+    used = set()
+    slugs = []
+    for name in names:
+        base = slug = slugify(name)
+        number = 1
+        while slug in used:
+            number += 1
+            slug = base + '-' + str(number)
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
+
+def content_hash(content):
+    """Returns the hash of a page, or of anything a page is made from."""
+    return hashlib.md5(content).hexdigest()
+
+def copy_image(source, destination, width):
+    """
+    Puts an image on the site as it is. Used when nothing that can resize
+    images is available.
+    """
+    shutil.copyfile(source, destination)
+    return True
+
+def render_page(title, body, root=''):
+    """
+    Returns a whole HTML page, encoded. root is the way back to the top of
+    the site from the page.
+    """
+    return (PAGE_TEMPLATE % {'title': escape(title), 'body': body,
+        'root': root}).encode('utf-8')
+
+def render_recipe(recipe, courseSlug, images):
+    """
+    Returns the page of a recipe, with the given site paths of its images.
+    """
+    body = [u'<h1>' + escape(recipe.name) + u'</h1>',
+            u'<p class="meta"><a href="../' + courseSlug + u'.html">' +
+            escape(recipe.course) + u'</a> &middot; Serves ' +
+            escape(format_amount(recipe.servingSize, '')) + u'</p>']
+    for image in images:
+        body.append(u'<img src="../' + image + u'" alt="">')
+
+    body.append(u'<h2>Ingredients</h2>\n<ul>')
+    for ingredient in recipe.ingredients:
+        body.append(u'<li>' + escape(format_amount(ingredient['quantity'],
+            ingredient['unit'])) + u' ' + escape(ingredient['name']) +
+            u'</li>')
+    body.append(u'</ul>\n<h2>Instructions</h2>\n<ol>')
+    for instruction in recipe.instructions:
+        body.append(u'<li>' + escape(instruction).replace(u'\n', u'<br>') +
+                u'</li>')
+    body.append(u'</ol>')
+
+    return render_page(recipe.name, u'\n'.join(body), '../')
+
+def render_list(title, entries, root=''):
+    """
+    Returns a page listing links, given as (site path, text) with a header
+    for every group of them: entries are (header, links).
+    """
+    body = [u'<h1>' + escape(title) + u'</h1>']
+    for header, links in entries:
+        if header:
+            body.append(u'<h2>' + header + u'</h2>')
+        body.append(u'<ul>')
+        for path, label in links:
+            body.append(u'<li><a href="' + root + path + u'">' + label +
+                    u'</a></li>')
+        body.append(u'</ul>')
+    return render_page(title, u'\n'.join(body), root)
+
+
+class SiteBuilder(object):
+    """
+    Builds the static site of a library into a folder, writing only what
+    changed since the last build. Images are resized with the given
+    function, resize(source, destination, width), which returns whether it
+    wrote the destination. Without one, images are copied as they are.
+    """
+    def __init__(self, folder=DEFAULT_SITE_FOLDER, resize=None):
+        self.folder = folder
+        self.resize = resize or copy_image
+        self.manifestPath = os.path.join(folder, MANIFEST_NAME)
+        # Recipe to the hash of its contents, as of the last build
+        self.hashes = weakref.WeakKeyDictionary()
+        self.load()
+
+    def load(self):
+        """
+        Reads the manifest of the last build. A missing or unreadable one,
+        or one from another version, means everything gets written again.
+        """
+        self.pages = {}
+        self.images = {}
+        # Whether the manifest has to be written again
+        self.dirty = False
+        try:
+            with open(self.manifestPath) as file:
+                manifest = codec.loads(file.read())
+        except (IOError, ValueError):
+            return
+        if manifest.get('version') == SITE_VERSION:
+            self.pages = manifest['pages']
+            self.images = manifest['images']
+
+    def save(self):
+        """
+        Writes the manifest. It is written to a temporary file first, so a
+        crash never leaves half a manifest.
+        """
+        temporaryPath = self.manifestPath + '.tmp'
+        file = open(temporaryPath, 'w')
+        file.write(codec.dumps({'version': SITE_VERSION, 'pages': self.pages,
+            'images': self.images}, separators=(',', ':')))
+        file.close()
+
+        # Windows can't rename over an existing file
+        if os.name == 'nt' and os.path.exists(self.manifestPath):
+            os.remove(self.manifestPath)
+        os.rename(temporaryPath, self.manifestPath)
+        self.dirty = False
+
+    def recipe_hash(self, recipe, changed):
+        """
+        Returns the hash of a recipe's contents, computing it again only if
+        the recipe may have changed.
+        """
+        recipeHash = self.hashes.get(recipe)
+        if recipeHash is None or changed is None or recipe in changed:
+            recipeHash = content_hash(recipe.export_recipe())
+            self.hashes[recipe] = recipeHash
+        return recipeHash
+
+    def site_image(self, source):
+        """
+        Returns the site path of the web version of an image, resizing it
+        again only if the image file changed. Returns None if the image
+        can't be read.
+        """
+        try:
+            status = os.stat(source)
+        except OSError:
+            return None
+        stamp = [status.st_mtime, status.st_size]
+
+        extension = os.path.splitext(source)[1].lower() or '.png'
+        path = (IMAGE_FOLDER + '/' + content_hash(text(source).encode(
+            'utf-8'))[:16] + '-' + str(IMAGE_WIDTH) + extension)
+
+        if (self.images.get(source) != [stamp, path] or
+                not os.path.exists(os.path.join(self.folder, path))):
+            try:
+                written = self.resize(source, os.path.join(self.folder, path),
+                        IMAGE_WIDTH)
+            except (IOError, OSError):
+                written = False
+            self.dirty = True
+            if not written:
+                self.images.pop(source, None)
+                return None
+            self.images[source] = [stamp, path]
+        return path
+
+    def write(self, path, key, render, written):
+        """
+        Writes a page of the site if the key it's made from (its hash, or
+        the hash of what it's made from) changed since the last build. The
+        page is only rendered if it is written. Pages are trusted to be
+        still there; removing the manifest makes the next build write
+        everything again.
+        """
+        if self.pages.get(path) == key:
+            return
+        file = open(os.path.join(self.folder, path), 'wb')
+        file.write(render())
+        file.close()
+        self.pages[path] = key
+        self.dirty = True
+        written.append(path)
+
+    def build(self, recipes, changed=None):
+        """
+        Brings the site up to date with the library. If the recipes that
+        changed are given, only those are hashed again; otherwise every
+        recipe is. Returns the site paths of the pages written.
+        """
+        if changed is not None:
+            changed = set(changed)
+
+        for folder in [self.folder, os.path.join(self.folder, RECIPE_FOLDER),
+                os.path.join(self.folder, IMAGE_FOLDER)]:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+
+        written = []
+        current = set()
+        usedImages = set()
+
+        courses = sorted(set([recipe.course for recipe in recipes]))
+        courseSlugs = dict(zip(courses, unique_slugs(['course-' + course
+            for course in courses])))
+
+        # The recipe pages, written if the recipe or its images changed
+        recipeLinks = {}
+        for recipe, slug in zip(recipes, unique_slugs([recipe.name for
+                recipe in recipes])):
+            path = RECIPE_FOLDER + '/' + slug + '.html'
+            images = [image for image in [self.site_image(source) for source
+                in recipe.images] if image is not None]
+            usedImages.update(images)
+            courseSlug = courseSlugs[recipe.course]
+
+            key = (self.recipe_hash(recipe, changed) + ':' + courseSlug +
+                    ':' + ','.join(images))
+            self.write(path, key, lambda: render_recipe(recipe, courseSlug,
+                images), written)
+            current.add(path)
+            recipeLinks.setdefault(recipe.course, []).append((path,
+                escape(recipe.name)))
+
+        # The list pages are quick to render, so they are rendered every
+        # time and only written if they came out different
+        for course in courses:
+            path = courseSlugs[course] + '.html'
+            links = sorted(recipeLinks[course], key=lambda link: link[1])
+            page = render_list(course, [(None, links)])
+            self.write(path, content_hash(page), lambda: page, written)
+            current.add(path)
+
+        page = render_list('Recipes', [(u'<a href="' +
+            courseSlugs[course] + u'.html">' + escape(course) + u'</a>',
+            sorted(recipeLinks[course], key=lambda link: link[1]))
+            for course in courses])
+        self.write('index.html', content_hash(page), lambda: page, written)
+        current.add('index.html')
+
+        self.write('style.css', content_hash(STYLESHEET), lambda: STYLESHEET,
+                written)
+        current.add('style.css')
+
+        self.remove_stale(current, usedImages)
+        if self.dirty:
+            self.save()
+        return written
+
+    def remove_stale(self, current, usedImages):
+        """
+        Removes the pages and images of recipes and courses that are gone.
+        """
+        for path in [path for path in self.pages if path not in current]:
+            self.remove(path)
+            del self.pages[path]
+            self.dirty = True
+
+        for source in [source for source in self.images if
+                self.images[source][1] not in usedImages]:
+            self.remove(self.images.pop(source)[1])
+            self.dirty = True
+
+    def remove(self, path):
+        """Removes a file of the site, if it's still there."""
+        try:
+            os.remove(os.path.join(self.folder, path))
+        except OSError:
+            pass
@@ -5,13 +5,17 @@
 # This program reads a .rcpe file, parses its JSON content and then displays
 # everything in a neat and organized manner.
 
-import simplejson as json
-
+import os
 import sys
 
+# The codec lives in the models package, one folder up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    '..'))
+from models import codec
+
 file = open(sys.argv[1], 'r') # Open the file passed as an argument
 print 'File loaded!'
-recipe = json.loads(file.read())
+recipe = codec.loads(file.read())
 print recipe
 
 # Print them one by one